@@ -5,17 +5,24 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from decouple import config
 from database import SessionLocal
+import hashlib
+import hmac
 import models
+import schemas
+import cache
 import crud
+import password_hashing
 
 # Security settings
 SECRET_KEY = config('SECRET_KEY', default='your-secret-key-here-change-in-production')
 ALGORITHM = config('ALGORITHM', default='HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = config('ACCESS_TOKEN_EXPIRE_MINUTES', default=30, cast=int)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# pbkdf2_sha256 hashes (written by create_simple_admin.py) verify and are upgraded to bcrypt
+pwd_context = CryptContext(schemes=["bcrypt", "pbkdf2_sha256"], deprecated="auto")
 security = HTTPBearer()
 
 def get_db():
@@ -25,17 +32,24 @@ def get_db():
     finally:
         db.close()
 
-def verify_password(plain_password, hashed_password):
+def verify_and_update(plain_password, hashed_password):
+    """Return (valid, new_hash); new_hash is set when the stored hash uses an outdated scheme"""
+    if pwd_context.identify(hashed_password) is None:
+        # Fallback for simple hash format (hash:salt)
+        if ':' not in hashed_password:
+            return False, None
+        stored_hash, salt = hashed_password.split(':', 1)
+        computed_hash = hashlib.pbkdf2_hmac('sha256', plain_password.encode('utf-8'), salt.encode('utf-8'), 100000).hex()
+        if not hmac.compare_digest(computed_hash, stored_hash):
+            return False, None
+        return True, pwd_context.hash(plain_password)
     try:
-        return pwd_context.verify(plain_password, hashed_password)
-    except Exception:
-        # Fallback for simple hash format (password:salt)
-        if ':' in hashed_password:
-            import hashlib
-            stored_hash, salt = hashed_password.split(':')
-            computed_hash = hashlib.pbkdf2_hmac('sha256', plain_password.encode('utf-8'), salt.encode('utf-8'), 100000).hex()
-            return computed_hash == stored_hash
-        return False
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except ValueError:
+        return False, None
+
+def verify_password(plain_password, hashed_password):
+    return verify_and_update(plain_password, hashed_password)[0]
 
 def get_password_hash(password):
     return pwd_context.hash(password)
@@ -48,6 +62,39 @@ def authenticate_user(db: Session, email: str, password: str):
         return False
     return user
 
+async def run_password_job(func, *args):
+    """Run password hashing work on the password pool; 429 when it is saturated"""
+    try:
+        return await password_hashing.password_pool.run(func, *args)
+    except password_hashing.PoolSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="השרת עמוס כרגע, נסו שוב בעוד רגע",
+            headers={"Retry-After": "1"},
+        )
+
+async def hash_password(password: str):
+    return await run_password_job(get_password_hash, password)
+
+async def authenticate(db: Session, email: str, password: str):
+    """authenticate_user for async routes: upgrades outdated hashes on success"""
+    user = await run_in_threadpool(crud.get_user_by_email, db, email)
+    if not user:
+        return False
+    valid, new_hash = await run_password_job(verify_and_update, password, user.hashed_password)
+    if not valid:
+        return False
+    if new_hash:
+        await run_in_threadpool(crud.update_user_password_hash, db, user, new_hash)
+    return user
+
+def token_claims(user):
+    """Claims that let get_current_user authorize without loading the user"""
+    return {"sub": user.email, "uid": user.id, "adm": bool(user.is_admin), "ver": user.token_version or 0}
+
+def create_user_token(user, expires_delta: Optional[timedelta] = None):
+    return create_access_token(token_claims(user), expires_delta)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -58,6 +105,19 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def cached_user(db: Session, user_id: int):
+    """The user's snapshot from the user cache, loading it by id on a miss"""
+    found, user = cache.user_cache.get(user_id)
+    if found:
+        return user
+    generation = cache.user_cache.generation
+    db_user = crud.get_user(db, user_id)
+    if db_user is None:
+        return None
+    user = schemas.CurrentUser.model_validate(db_user)
+    cache.user_cache.set(user_id, user, tags=[f"user:{user_id}"], generation=generation)
+    return user
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
@@ -74,8 +134,15 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = crud.get_user_by_email(db, email=email)
+
+    user_id, version = payload.get("uid"), payload.get("ver")
+    if user_id is None or version is None:
+        # Tokens issued before the claims were added
+        user = crud.get_user_by_email(db, email=email)
+    else:
+        user = cached_user(db, user_id)
+        if user is not None and user.token_version != version:
+            raise credentials_exception
     if user is None:
         raise credentials_exception
     return user
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Load-test the catalog routes on the sync Session path vs the async (AsyncSession) path
+
+Seeds a throwaway SQLite catalog and starts uvicorn twice on it, once with
+ASYNC_CATALOG_ROUTES off and once with it on. Each run drives the catalog with
+many concurrent connections and reports p50/p99 latency and requests per
+second. Search requests use a random price cap, so most of them miss the
+response cache and reach the database.
+
+Usage: python bench_async_catalog.py [--products 2000] [--seconds 10] [--concurrency 500]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_catalog_snapshot import seed, wait_for_server
+
+ENDPOINTS = [
+    ("product detail", lambda: f"/api/products/{random.randint(1, 200)}"),
+    ("search (uncached)", lambda: f"/api/products/search?sort=price&price_max={random.randrange(2000, 4000)}"),
+]
+
+
+def percentile(latencies, fraction):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def drive(base_url, path_for, seconds, concurrency):
+    import httpx
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.get(path_for())
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await client.get(path_for())  # warm up
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def run_server(port, async_routes):
+    env = dict(os.environ, ASYNC_CATALOG_ROUTES=str(async_routes), CATALOG_SNAPSHOT_WARM="False")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    print(f"🌱 Seeding {args.products} products...")
+    seed(args.products)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    print(f"\n{args.concurrency} concurrent connections, {args.seconds:.0f}s per run")
+    print(f"{'endpoint':<20}{'routes':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, path_for in ENDPOINTS:
+        for async_routes in (False, True):
+            server = run_server(args.port, async_routes)
+            try:
+                wait_for_server(base_url, server)
+                latencies, errors, elapsed = asyncio.run(drive(base_url, path_for, args.seconds, args.concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{name:<20}{'async' if async_routes else 'sync':>8}{len(latencies) / elapsed:>10.0f}"
+                  f"{percentile(latencies, 0.5) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
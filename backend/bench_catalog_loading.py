@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Benchmark catalog listing load strategies
+
+Seeds a throwaway SQLite catalog (5k products by default, each with 10 images,
+4 metal variants and 12 carat sizes) and compares the old joinedload listing
+against crud.catalog_query, reporting statements, rows on the wire and latency
+per page.
+
+Usage: python bench_catalog_loading.py [--products 5000] [--limit 100] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(db, models, products):
+    db.add(models.Category(name="טבעות", description=""))
+    db.commit()
+    for start in range(0, products, 500):
+        batch = []
+        for i in range(start, min(start + 500, products)):
+            product = models.Product(
+                name=f"טבעת {i}", description="טבעת יהלום מעבדה",
+                base_price=2000.0 + i, price=2000.0 + i, category_id=1,
+            )
+            product.images = [models.ProductImage(image_url=f"/uploads/{i}-{j}.jpg", sort_order=j) for j in range(10)]
+            product.variants = [
+                models.ProductVariant(color_name=f"Gold {j}", color_code="#ffd700", images=[], sort_order=j)
+                for j in range(4)
+            ]
+            product.available_carats = [
+                models.ProductCaratAvailability(carat_weight=0.25 * (j + 1), sort_order=j) for j in range(12)
+            ]
+            batch.append(product)
+        db.add_all(batch)
+        db.commit()
+
+
+def joined_listing(db, models, skip, limit):
+    """The listing query as it was before crud.catalog_query used selectinload"""
+    from sqlalchemy.orm import joinedload
+    return db.query(models.Product).options(
+        joinedload(models.Product.category),
+        joinedload(models.Product.images),
+        joinedload(models.Product.variants),
+        joinedload(models.Product.available_carats)
+    ).filter(models.Product.is_available == True).offset(skip).limit(limit).all()
+
+
+def measure(engine, db_factory, listing, skip, limit, repeat):
+    from sqlalchemy import event
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    timings = []
+    for attempt in range(repeat):
+        db = db_factory()
+        if attempt == 0:
+            event.listen(engine, "before_cursor_execute", capture)
+        start = time.perf_counter()
+        listing(db, skip, limit)
+        timings.append((time.perf_counter() - start) * 1000)
+        if attempt == 0:
+            event.remove(engine, "before_cursor_execute", capture)
+        db.close()
+
+    # Replay the captured statements to count the rows each one returns
+    rows = 0
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for statement, parameters in captured:
+            rows += len(cursor.execute(statement, parameters).fetchall())
+    finally:
+        raw.close()
+
+    return len(captured), rows, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    from database import SessionLocal, engine
+    import models
+    import crud
+
+    models.Base.metadata.create_all(bind=engine)
+    print(f"🌱 Seeding {args.products} products (10 images, 4 variants, 12 carats each)...")
+    db = SessionLocal()
+    seed(db, models, args.products)
+    db.close()
+
+    strategies = {
+        "joinedload": lambda db, skip, limit: joined_listing(db, models, skip, limit),
+        "catalog_query": lambda db, skip, limit: crud.get_products(db, skip=skip, limit=limit),
+    }
+    pages = {"first page": 0, "middle page": args.products // 2, "last page": args.products - args.limit}
+
+    print(f"\n{'strategy':<15}{'page':<14}{'queries':>8}{'rows':>10}{'median ms':>12}")
+    for name, listing in strategies.items():
+        for page, skip in pages.items():
+            queries, rows, median_ms = measure(engine, SessionLocal, listing, skip, args.limit, args.repeat)
+            print(f"{name:<15}{page:<14}{queries:>8}{rows:>10}{median_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
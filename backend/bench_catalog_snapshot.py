@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Benchmark the pre-serialized catalog snapshot against the ORM path under uvicorn
+
+Seeds a throwaway SQLite catalog and starts uvicorn on it. The app gets extra
+/bench/orm/... routes that serve the same data the old way: ORM load,
+response_model validation and JSON encoding on every call. Then it drives both
+paths with concurrent clients and reports requests per second.
+
+Usage: python bench_catalog_snapshot.py [--products 2000] [--seconds 5] [--concurrency 32]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = [
+    ("category page (24)", "/bench/orm/products?limit=24&category_id=1", "/api/products?limit=24&category_id=1"),
+    ("product detail", "/bench/orm/products/7", "/api/products/7"),
+    ("featured", "/bench/orm/products/featured", "/api/products/featured"),
+]
+
+
+def build_app():
+    from typing import List
+    from fastapi import Depends
+    from sqlalchemy.orm import Session
+    import main
+    import crud
+    import schemas
+
+    def orm_products(limit: int = 100, category_id: int = None, db: Session = Depends(main.get_db)):
+        return crud.get_products(db, limit=limit, category_id=category_id)
+
+    def orm_featured(limit: int = 6, db: Session = Depends(main.get_db)):
+        return crud.get_featured_products(db, limit=limit)
+
+    def orm_product(product_id: int, db: Session = Depends(main.get_db)):
+        return crud.get_product(db, product_id=product_id)
+
+    routes = [
+        ("/bench/orm/products", orm_products, List[schemas.ProductResponse]),
+        ("/bench/orm/products/featured", orm_featured, List[schemas.ProductResponse]),
+        ("/bench/orm/products/{product_id}", orm_product, schemas.ProductResponse),
+    ]
+    for path, endpoint, response_model in reversed(routes):
+        main.app.add_api_route(path, endpoint, response_model=response_model)
+        # Ahead of the SPA catch-all route
+        main.app.router.routes.insert(0, main.app.router.routes.pop())
+    return main.app
+
+
+def seed(products):
+    from database import SessionLocal, engine
+    import models
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add_all([models.Category(name=name, description="") for name in ("טבעות", "עגילים", "צמידים")])
+    db.commit()
+    for i in range(products):
+        product = models.Product(
+            name=f"טבעת יהלום {i}", description="טבעת יהלום מעבדה בעבודת יד " * 4,
+            base_price=2000.0 + i, price=2000.0 + i, carat_weight=1.0, color_grade="E",
+            clarity_grade="VS1", cut_grade="Excellent", shape="Round",
+            is_featured=i % 50 == 0, category_id=i % 3 + 1,
+        )
+        product.images = [models.ProductImage(image_url=f"/uploads/{i}-{j}.jpg", sort_order=j) for j in range(5)]
+        product.variants = [
+            models.ProductVariant(color_name=color, color_code="#ffd700", images=[f"/uploads/{i}-{color}.jpg"])
+            for color in ("Yellow Gold", "White Gold", "Rose Gold")
+        ]
+        product.available_carats = [
+            models.ProductCaratAvailability(carat_weight=0.5 * (j + 1), sort_order=j) for j in range(6)
+        ]
+        db.add(product)
+    db.commit()
+    db.close()
+
+
+async def drive(base_url, path, seconds, concurrency):
+    import httpx
+
+    completed = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(client):
+        nonlocal completed
+        while time.perf_counter() < deadline:
+            response = await client.get(path)
+            response.raise_for_status()
+            completed += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        await client.get(path)  # warm up
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return completed / (time.perf_counter() - started)
+
+
+def wait_for_server(base_url, process, timeout=60):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            httpx.get(f"{base_url}/api/categories")
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError("uvicorn did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        import uvicorn
+        uvicorn.run(build_app(), host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+        return
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    print(f"🌱 Seeding {args.products} products...")
+    seed(args.products)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "--port", str(args.port)],
+                              env=os.environ.copy(), cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        wait_for_server(base_url, server)
+        print(f"\n{'endpoint':<22}{'orm req/s':>12}{'snapshot req/s':>16}{'speedup':>10}")
+        for name, orm_path, snapshot_path in ENDPOINTS:
+            orm_rps = asyncio.run(drive(base_url, orm_path, args.seconds, args.concurrency))
+            snapshot_rps = asyncio.run(drive(base_url, snapshot_path, args.seconds, args.concurrency))
+            print(f"{name:<22}{orm_rps:>12.0f}{snapshot_rps:>16.0f}{snapshot_rps / orm_rps:>9.1f}x")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
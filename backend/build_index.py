@@ -0,0 +1,162 @@
+"""In-memory index of the React build root (index.html, favicon, manifest, ...)
+
+The SPA catch-all serves index.html for every client-side route and the root
+route serves files like /favicon.ico. Instead of probing the filesystem on
+each hit, the build root is scanned once (at startup, or on first use) into
+a dict of file name -> BuildFile holding the bytes, a content hash ETag and
+the content type. The `.br` / `.gz` siblings written by precompress.py are
+loaded with their file and served when the client accepts them.
+
+These files are not fingerprinted, so they are sent with `Cache-Control:
+no-cache` and clients revalidate them with If-None-Match, which is answered
+with 304 from memory. Files larger than FRONTEND_BUILD_MAX_FILE_BYTES stay on
+disk and are only indexed by path.
+
+Every worker notices a new build by itself: at most once every
+FRONTEND_BUILD_CHECK_SECONDS, get() stats index.html and reloads the whole
+index when its mtime or size (or a precompressed sibling's) changed. FRONTEND_BUILD_WATCH reloads right
+away instead (uses watchfiles, installed with uvicorn[standard]). /static is
+not indexed: its fingerprinted bundles are served by the /static mount.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Dict, Optional
+
+from decouple import config
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+
+import static_files
+from catalog_version import is_not_modified
+
+FRONTEND_BUILD_DIR = Path(config('FRONTEND_BUILD_DIR', default='../frontend/build'))
+FRONTEND_BUILD_MAX_FILE_BYTES = config('FRONTEND_BUILD_MAX_FILE_BYTES', default=1024 * 1024, cast=int)
+FRONTEND_BUILD_WATCH = config('FRONTEND_BUILD_WATCH', default=False, cast=bool)
+FRONTEND_BUILD_CHECK_SECONDS = config('FRONTEND_BUILD_CHECK_SECONDS', default=2.0, cast=float)
+
+CACHE_CONTROL = "no-cache"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BuildFile:
+    path: Path
+    etag: str
+    media_type: str
+    body: Optional[bytes] = None  # None: too large to keep, served from disk
+    encoded: Dict[str, bytes] = field(default_factory=dict)  # coding -> body
+
+    def response(self, request_headers: Headers) -> Response:
+        headers = {"cache-control": CACHE_CONTROL}
+        if self.encoded:
+            headers["vary"] = "Accept-Encoding"
+        body, etag = self.body, self.etag
+        accepted = static_files.accepted_encodings(request_headers.get("accept-encoding")) if self.encoded else ()
+        for coding, _ in static_files.ENCODINGS:
+            if coding in accepted and coding in self.encoded:
+                # Each representation gets its own ETag
+                body, etag = self.encoded[coding], f'{self.etag[:-1]}-{coding}"'
+                headers["content-encoding"] = coding
+                break
+        headers["etag"] = etag
+        if is_not_modified(request_headers.get("if-none-match"), None, etag, None):
+            return Response(status_code=304, headers=headers)
+        if body is None:
+            return FileResponse(self.path, headers=headers, media_type=self.media_type)
+        return Response(body, headers=headers, media_type=self.media_type)
+
+
+def load_file(path: Path, max_bytes: int = FRONTEND_BUILD_MAX_FILE_BYTES) -> BuildFile:
+    media_type = guess_type(path.name)[0] or "text/plain"
+    stat_result = path.stat()
+    if stat_result.st_size > max_bytes:
+        return BuildFile(path, f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"', media_type)
+    body = path.read_bytes()
+    encoded = {}
+    for coding, suffix in static_files.ENCODINGS:
+        sibling = path.with_name(path.name + suffix)
+        # Siblings older than the file are stale, as in static_files
+        if sibling.is_file() and sibling.stat().st_mtime >= stat_result.st_mtime:
+            encoded[coding] = sibling.read_bytes()
+    # The ETag names the content, so it is the same on every worker and survives rebuilds of unchanged files
+    return BuildFile(path, f'"{hashlib.sha256(body).hexdigest()[:32]}"', media_type, body, encoded)
+
+
+class BuildIndex:
+    """File name -> BuildFile for the files directly under a build directory"""
+
+    def __init__(self, directory: Path = FRONTEND_BUILD_DIR, max_file_bytes: int = FRONTEND_BUILD_MAX_FILE_BYTES,
+                 check_seconds: float = FRONTEND_BUILD_CHECK_SECONDS, clock=time.monotonic):
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.check_seconds = check_seconds
+        self.clock = clock
+        self._files = None
+        self._signature = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _index_signature(self):
+        """(mtime, size) of index.html, which every build rewrites, and of its precompressed siblings"""
+        signature = []
+        for name in ("index.html", *(f"index.html{suffix}" for _, suffix in static_files.ENCODINGS)):
+            try:
+                stat_result = (self.directory / name).stat()
+            except OSError:
+                signature.append(None)
+            else:
+                signature.append((stat_result.st_mtime_ns, stat_result.st_size))
+        return tuple(signature)
+
+    def load(self) -> Dict[str, BuildFile]:
+        """(Re)scan the build directory; a missing directory gives an empty index"""
+        # Taken before the scan: a build landing meanwhile is picked up by the next check
+        signature = self._index_signature()
+        files = {}
+        if self.directory.is_dir():
+            for path in sorted(self.directory.iterdir()):
+                if path.is_file() and not path.name.endswith(tuple(suffix for _, suffix in static_files.ENCODINGS)):
+                    files[path.name] = load_file(path, self.max_file_bytes)
+        with self._lock:
+            # Swapped whole: requests never see a half-built index
+            self._files = files
+            self._signature = signature
+            self._checked_at = self.clock()
+            self.loads += 1
+        return files
+
+    def get(self, name: str) -> Optional[BuildFile]:
+        files = self._files
+        if files is None:
+            files = self.load()
+        elif self.clock() - self._checked_at >= self.check_seconds:
+            self._checked_at = self.clock()
+            if self._index_signature() != self._signature:
+                files = self.load()
+                logger.info("Reloaded the frontend build index after a new build (%d files)", len(files))
+        return files.get(name)
+
+    async def watch(self):
+        """Reload whenever the build directory changes; runs until cancelled"""
+        try:
+            from watchfiles import awatch
+        except ImportError:
+            logger.warning("FRONTEND_BUILD_WATCH is set but watchfiles is not installed")
+            return
+        while not self.directory.is_dir():
+            await asyncio.sleep(5)
+        async for _ in awatch(self.directory, recursive=False):
+            await asyncio.to_thread(self.load)
+            logger.info("Reloaded the frontend build index (%d files)", len(self._files))
+
+
+frontend_build = BuildIndex()
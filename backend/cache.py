@@ -0,0 +1,193 @@
+"""In-process TTL + LRU cache for public catalog reads
+
+Entries are tagged (e.g. "product:12", "product-lists", "categories") so crud
+mutators can drop exactly the entries a write affects. The cache is per
+process: with several uvicorn workers, a write invalidates only the worker that
+served it and the others catch up within the TTL.
+"""
+
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+from decouple import config
+
+CATALOG_CACHE_MAX_ENTRIES = config('CATALOG_CACHE_MAX_ENTRIES', default=1024, cast=int)
+CATALOG_CACHE_TTL_SECONDS = config('CATALOG_CACHE_TTL_SECONDS', default=60, cast=float)
+CATALOG_SNAPSHOT_MAX_PRODUCTS = config('CATALOG_SNAPSHOT_MAX_PRODUCTS', default=50000, cast=int)
+CATALOG_SNAPSHOT_TTL_SECONDS = config('CATALOG_SNAPSHOT_TTL_SECONDS', default=3600, cast=float)
+AUTH_USER_CACHE_MAX_ENTRIES = config('AUTH_USER_CACHE_MAX_ENTRIES', default=1024, cast=int)
+AUTH_USER_CACHE_TTL_SECONDS = config('AUTH_USER_CACHE_TTL_SECONDS', default=30, cast=float)
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.Lock()
+        # Bumped by every invalidation so loads that raced a write are not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return (found, value)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, value, _ = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value, tags=(), generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self.clock() + self.ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+catalog_cache = TTLCache(maxsize=CATALOG_CACHE_MAX_ENTRIES, ttl=CATALOG_CACHE_TTL_SECONDS)
+# Pre-encoded ProductResponse JSON per product id; listing bodies are joined from these
+product_json = TTLCache(maxsize=CATALOG_SNAPSHOT_MAX_PRODUCTS, ttl=CATALOG_SNAPSHOT_TTL_SECONDS)
+# schemas.CurrentUser per user id, so authenticated requests skip the users lookup
+user_cache = TTLCache(maxsize=AUTH_USER_CACHE_MAX_ENTRIES, ttl=AUTH_USER_CACHE_TTL_SECONDS)
+
+
+def cached(namespace: str, tags=()):
+    """Cache a `func(db, **params)` read in catalog_cache.
+
+    The key is the namespace plus every parameter except `db`. Tags are format
+    strings filled from the same parameters, e.g. "product:{product_id}".
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = {}
+            for name, value in bound.arguments.items():
+                if signature.parameters[name].kind is inspect.Parameter.VAR_KEYWORD:
+                    params.update(value)
+                elif name != "db":
+                    params[name] = value
+            key = (namespace,) + tuple(sorted(params.items()))
+
+            found, value = catalog_cache.get(key)
+            if found:
+                return value
+            generation = catalog_cache.generation
+            value = func(*args, **kwargs)
+            catalog_cache.set(key, value, tags=[tag.format(**params) for tag in tags], generation=generation)
+            return value
+        return wrapper
+    return decorator
+
+
+def invalidate_product(product_id=None):
+    """Drop cached entries affected by a write to one product (or to an unknown one)"""
+    tags = ["product-lists"]
+    if product_id is not None:
+        tags.append(f"product:{product_id}")
+    catalog_cache.invalidate(*tags)
+    product_json.invalidate(*tags)
+
+
+def invalidate_products():
+    """Drop every product entry, e.g. after a change that reprices all of them"""
+    catalog_cache.invalidate("products")
+    product_json.invalidate("products")
+
+
+def invalidate_categories():
+    """Category rows are embedded in every product response, so drop those too"""
+    catalog_cache.invalidate("categories", "products")
+    product_json.invalidate("products")
+
+
+def invalidate_images(product_ids, categories: bool = False):
+    """Drop the entries that show images whose renditions changed: those products, and the category list"""
+    tags = [f"product:{product_id}" for product_id in product_ids]
+    if tags:
+        tags.append("product-lists")
+    if categories:
+        tags.append("categories")
+    if tags:
+        catalog_cache.invalidate(*tags)
+        product_json.invalidate(*tags)
+
+
+def forget_user(user_id):
+    """Drop a user's cached snapshot after a change to the user row"""
+    user_cache.invalidate(f"user:{user_id}")
+
+
+def clear():
+    catalog_cache.clear()
+    product_json.clear()
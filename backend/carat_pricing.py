@@ -0,0 +1,148 @@
+"""Process-local carat pricing table with O(log n) multiplier lookup
+
+Active CaratPricing rows are loaded into parallel sorted arrays. A lookup
+bisects for the requested weight, so 0.9999 and 1.0 resolve to the same row
+instead of failing a float equality test. Lookups can optionally interpolate
+linearly between configured weights.
+
+The table records the catalog version it was built from and rebuilds when
+that version moves. Every CaratPricing write bumps the version (see
+catalog_version.py), and crud calls invalidate() so this process refreshes
+immediately.
+"""
+
+import logging
+from bisect import bisect_left
+from typing import List, Optional
+
+from decouple import config
+from sqlalchemy.orm import Session
+
+import catalog_version
+import models
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; bulk lookups fall back to pure Python
+    np = None
+
+CARAT_WEIGHT_TOLERANCE = config('CARAT_WEIGHT_TOLERANCE', default=0.005, cast=float)
+CARAT_PRICE_INTERPOLATION = config('CARAT_PRICE_INTERPOLATION', default=False, cast=bool)
+# Bulk lookups at least this large are vectorized when NumPy is installed
+CARAT_PRICE_NUMPY_THRESHOLD = config('CARAT_PRICE_NUMPY_THRESHOLD', default=256, cast=int)
+
+logger = logging.getLogger(__name__)
+_warned_missing_numpy = False
+
+
+def _warn_missing_numpy():
+    global _warned_missing_numpy
+    if not _warned_missing_numpy:
+        _warned_missing_numpy = True
+        logger.warning("NumPy is not installed; bulk carat price lookups run in pure Python")
+
+
+def weights_match(a: float, b: float, tolerance: float = CARAT_WEIGHT_TOLERANCE) -> bool:
+    return abs(a - b) <= tolerance
+
+
+class CaratPriceTable:
+    """Immutable sorted (weight, multiplier) arrays built from one read of carat_pricing"""
+
+    def __init__(self, weights: List[float], multipliers: List[float], version: Optional[int]):
+        self.weights = weights
+        self.multipliers = multipliers
+        self.version = version
+
+    @classmethod
+    def load(cls, db: Session, version: Optional[int] = None):
+        rows = db.query(models.CaratPricing.carat_weight, models.CaratPricing.price_multiplier).filter(
+            models.CaratPricing.is_active == True
+        ).order_by(models.CaratPricing.carat_weight).all()
+        return cls([row.carat_weight for row in rows], [row.price_multiplier for row in rows], version)
+
+    def find(self, carat_weight: float, tolerance: float = CARAT_WEIGHT_TOLERANCE) -> Optional[int]:
+        """Index of the configured weight nearest to carat_weight, if within tolerance"""
+        i = bisect_left(self.weights, carat_weight)
+        best = None
+        for candidate in (i - 1, i):
+            if 0 <= candidate < len(self.weights):
+                distance = abs(self.weights[candidate] - carat_weight)
+                if distance <= tolerance and (best is None or distance < best[0]):
+                    best = (distance, candidate)
+        return best[1] if best else None
+
+    def multiplier(self, carat_weight: float, tolerance: float = CARAT_WEIGHT_TOLERANCE,
+                   interpolate: bool = CARAT_PRICE_INTERPOLATION) -> Optional[float]:
+        """Multiplier for carat_weight, or None when no configured weight applies"""
+        index = self.find(carat_weight, tolerance)
+        if index is not None:
+            return self.multipliers[index]
+        if not interpolate or not self.weights:
+            return None
+        i = bisect_left(self.weights, carat_weight)
+        if i == 0 or i == len(self.weights):
+            # Outside the configured range: do not extrapolate
+            return None
+        low_weight, high_weight = self.weights[i - 1], self.weights[i]
+        low, high = self.multipliers[i - 1], self.multipliers[i]
+        return low + (high - low) * (carat_weight - low_weight) / (high_weight - low_weight)
+
+    def multipliers_for(self, carat_weights: List[float], tolerance: float = CARAT_WEIGHT_TOLERANCE,
+                        interpolate: bool = CARAT_PRICE_INTERPOLATION, default: float = 1.0,
+                        numpy_threshold: int = CARAT_PRICE_NUMPY_THRESHOLD) -> List[float]:
+        """multiplier() for many weights at once, with `default` where none applies"""
+        if np is None and len(carat_weights) >= numpy_threshold:
+            _warn_missing_numpy()
+        if np is None or len(carat_weights) < numpy_threshold or not self.weights:
+            results = (self.multiplier(w, tolerance, interpolate) for w in carat_weights)
+            return [default if m is None else m for m in results]
+
+        weights = np.asarray(self.weights, dtype=float)
+        multipliers = np.asarray(self.multipliers, dtype=float)
+        wanted = np.asarray(carat_weights, dtype=float)
+
+        # Nearest configured weight on either side of each requested weight
+        right = np.clip(np.searchsorted(weights, wanted), 0, len(weights) - 1)
+        left = np.clip(right - 1, 0, len(weights) - 1)
+        left_distance = np.abs(weights[left] - wanted)
+        right_distance = np.abs(weights[right] - wanted)
+        nearest = np.where(left_distance <= right_distance, left, right)
+        matched = np.minimum(left_distance, right_distance) <= tolerance
+
+        result = np.full(wanted.shape, default)
+        result[matched] = multipliers[nearest[matched]]
+        if interpolate:
+            inside = ~matched & (wanted > weights[0]) & (wanted < weights[-1])
+            result[inside] = np.interp(wanted[inside], weights, multipliers)
+        return result.tolist()
+
+
+class CaratPricingCache:
+    """Holds the current CaratPriceTable and swaps in a rebuilt one when it goes stale"""
+
+    def __init__(self):
+        self._table = None
+
+    def table(self, db: Session) -> CaratPriceTable:
+        version, _ = catalog_version.catalog_version.current(db)
+        table = self._table
+        if table is not None and table.version == version:
+            return table
+        # Loaded without a lock: on an AsyncSession the load yields to the event
+        # loop, and a second request blocking on a thread lock would stall it.
+        # Concurrent misses may both load; the last one wins.
+        table = self._table = CaratPriceTable.load(db, version)
+        return table
+
+    def invalidate(self):
+        self._table = None
+
+
+pricing_table = CaratPricingCache()
+
+
+def multiplier_for(db: Session, carat_weight: float) -> float:
+    """Price multiplier for a carat weight; 1.0 when no pricing is configured for it"""
+    multiplier = pricing_table.table(db).multiplier(carat_weight)
+    return 1.0 if multiplier is None else multiplier
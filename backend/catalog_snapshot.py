@@ -0,0 +1,111 @@
+"""Pre-serialized JSON snapshot of the public catalog
+
+Every product's ProductResponse JSON is encoded once and kept in
+cache.product_json. Listing bodies (category pages, keyset pages,
+featured/discounted) are assembled by an id-only query plus a byte join of
+those fragments, then cached in cache.catalog_cache. When a product changes, the
+crud invalidation drops its fragment and the lists. The next read re-encodes
+only that product. Routes return the bytes as-is, skipping ORM loading,
+response_model validation and JSON encoding.
+"""
+
+import json
+from typing import List, Optional
+
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+import cache
+import crud
+import models
+import schemas
+
+_categories_adapter = TypeAdapter(List[schemas.CategoryResponse])
+
+
+def encode_product(db_product) -> bytes:
+    return schemas.ProductResponse.model_validate(db_product).model_dump_json().encode("utf-8")
+
+
+def product_fragments(db: Session, product_ids: List[int]) -> List[bytes]:
+    """Encoded products in the given order, loading only the ones not yet in the snapshot"""
+    fragments = {}
+    missing = []
+    for product_id in product_ids:
+        found, fragment = cache.product_json.get(product_id)
+        if found:
+            fragments[product_id] = fragment
+        else:
+            missing.append(product_id)
+
+    if missing:
+        generation = cache.product_json.generation
+        for db_product in crud.catalog_query(db).filter(models.Product.id.in_(missing)):
+            fragment = encode_product(db_product)
+            cache.product_json.set(
+                db_product.id, fragment,
+                tags=("products", f"product:{db_product.id}"), generation=generation,
+            )
+            fragments[db_product.id] = fragment
+    return [fragments[product_id] for product_id in product_ids if product_id in fragments]
+
+
+def json_array(fragments: List[bytes]) -> bytes:
+    return b"[" + b",".join(fragments) + b"]"
+
+
+def warm(db: Session, batch_size: int = 500) -> int:
+    """Encode every available product up front; returns how many were encoded"""
+    product_ids = [row.id for row in db.query(models.Product.id).filter(models.Product.is_available == True)]
+    for start in range(0, len(product_ids), batch_size):
+        product_fragments(db, product_ids[start:start + batch_size])
+        db.expunge_all()
+    return len(product_ids)
+
+
+@cache.cached("categories-json", tags=("categories",))
+def categories_json(db: Session, skip: int = 0, limit: int = 100) -> bytes:
+    categories = _categories_adapter.validate_python(crud.get_categories(db, skip=skip, limit=limit))
+    return _categories_adapter.dump_json(categories)
+
+
+@cache.cached("products-json", tags=("products", "product-lists"))
+def products_json(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None) -> bytes:
+    product_ids = crud.get_products(db, skip=skip, limit=limit, category_id=category_id, ids_only=True)
+    return json_array(product_fragments(db, product_ids))
+
+
+@cache.cached("products-page-json", tags=("products", "product-lists"))
+def products_page_json(db: Session, cursor: Optional[str] = None, limit: int = 100,
+                       category_id: Optional[int] = None, sort: str = "newest") -> bytes:
+    product_ids, next_cursor = crud.get_products_page(
+        db, cursor=cursor, limit=limit, category_id=category_id, sort=sort, ids_only=True
+    )
+    items = json_array(product_fragments(db, product_ids))
+    return b'{"items":' + items + b',"next_cursor":' + json.dumps(next_cursor).encode("utf-8") + b"}"
+
+
+@cache.cached("featured-json", tags=("products", "product-lists"))
+def featured_products_json(db: Session, limit: int = 6) -> bytes:
+    return json_array(product_fragments(db, crud.get_featured_products(db, limit=limit, ids_only=True)))
+
+
+@cache.cached("discounted-json", tags=("products", "product-lists"))
+def discounted_products_json(db: Session, limit: int = 6) -> bytes:
+    return json_array(product_fragments(db, crud.get_discounted_products(db, limit=limit, ids_only=True)))
+
+
+@cache.cached("search-json", tags=("products", "product-lists"))
+def search_products_json(db: Session, **filters) -> bytes:
+    return json_array(product_fragments(db, crud.search_products(db, **filters, ids_only=True)))
+
+
+def product_exists(db: Session, product_id: int) -> bool:
+    """A product with a fragment in the snapshot exists; others cost a primary key lookup"""
+    found, _ = cache.product_json.get(product_id)
+    return found or db.query(models.Product.id).filter(models.Product.id == product_id).first() is not None
+
+
+def product_json(db: Session, product_id: int) -> Optional[bytes]:
+    fragments = product_fragments(db, [product_id])
+    return fragments[0] if fragments else None
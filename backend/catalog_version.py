@@ -0,0 +1,206 @@
+"""Catalog version counter behind the ETag / Last-Modified headers on catalog GETs
+
+A single catalog_state row holds a version number that every committed write to a
+catalog table bumps in the same transaction, whether the write is a flushed ORM
+object or a bulk query.update()/delete(). Readers see the version through a short
+in-process TTL. When another worker bumps it, this worker's response cache is
+cleared so cached bodies never outlive the version they are tagged with.
+
+Commits that only record image renditions also bump manifest_version. A move
+made of such commits alone is not a foreign write: image_variants reloads the
+srcset index and drops just the responses showing the changed images.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from itertools import chain
+
+from decouple import config
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+import cache
+import models
+
+CATALOG_VERSION_TTL_SECONDS = config('CATALOG_VERSION_TTL_SECONDS', default=1.0, cast=float)
+
+CATALOG_MODELS = (
+    models.Category,
+    models.Product,
+    models.ProductImage,
+    models.ProductVariant,
+    models.ProductCaratAvailability,
+    models.CaratPricing,
+    # Renditions show up in image srcsets of product and category responses
+    models.ImageManifest,
+)
+# Catalog tables whose writes only add srcsets to the responses
+MANIFEST_MODELS = (models.ImageManifest,)
+
+_CHANGED = "catalog_changed"
+_COMMITTED = "catalog_committed_version"
+
+
+class CatalogVersion:
+    """Process-local view of catalog_state, refreshed at most every `ttl` seconds"""
+
+    def __init__(self, ttl: float, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.version = None
+        self.manifest_version = None
+        self.updated_at = None
+        self._checked_at = None
+        # Versions moved by other workers; process-local indexes reload when it changes
+        self.foreign_writes = 0
+        # Versions moved by other workers' manifest-only commits
+        self.manifest_writes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_generation(self):
+        """Changes whenever another worker may have written image manifests"""
+        return self.foreign_writes, self.manifest_writes
+
+    def current(self, db: Session):
+        """Return (version, updated_at), reading catalog_state when the TTL has lapsed"""
+        with self._lock:
+            if self._checked_at is not None and self.clock() - self._checked_at < self.ttl:
+                return self.version, self.updated_at
+        row = db.query(
+            models.CatalogState.version, models.CatalogState.manifest_version, models.CatalogState.updated_at
+        ).filter(models.CatalogState.id == 1).first()
+        version, manifest_version, updated_at = row if row else (0, 0, None)
+        self._observe(version, manifest_version, updated_at, local_write=False)
+        return version, updated_at
+
+    def committed(self, version, manifest_version, updated_at):
+        """Record a version this process just committed itself"""
+        self._observe(version, manifest_version, updated_at, local_write=True)
+
+    def reset(self):
+        with self._lock:
+            self.version = None
+            self.manifest_version = None
+            self.updated_at = None
+            self._checked_at = None
+
+    def _observe(self, version, manifest_version, updated_at, local_write):
+        with self._lock:
+            # Our own commits already invalidated precisely; anything else means
+            # another worker wrote and our cached responses may be stale
+            moved = self.version is not None and version != self.version and not (
+                local_write and version == self.version + 1
+            )
+            # ...unless every commit since the last look only wrote manifests
+            manifests_only = moved and version > self.version and (
+                version - self.version == manifest_version - self.manifest_version
+            )
+            foreign_write = moved and not manifests_only
+            self.version = version
+            self.manifest_version = manifest_version
+            self.updated_at = updated_at
+            self._checked_at = self.clock()
+            if foreign_write:
+                self.foreign_writes += 1
+            elif manifests_only:
+                self.manifest_writes += 1
+        if foreign_write:
+            cache.clear()
+
+
+catalog_version = CatalogVersion(ttl=CATALOG_VERSION_TTL_SECONDS)
+
+
+def etag_for(version: int) -> str:
+    return f'"catalog-{version}"'
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def is_not_modified(if_none_match, if_modified_since, etag: str, updated_at) -> bool:
+    """RFC 9110 evaluation: If-None-Match (weak comparison) wins over If-Modified-Since"""
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+    if if_modified_since is not None and updated_at is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return updated_at.replace(microsecond=0) <= since
+    return False
+
+
+def mark_changed(session: Session):
+    """Bump the version on the next commit for writes the hooks cannot see (raw SQL)"""
+    _mark(session, models.CatalogState)
+
+
+def _mark(session: Session, model):
+    # "manifests" or "rows": a commit that only collected "manifests" bumps manifest_version too
+    session.info.setdefault(_CHANGED, set()).add("manifests" if issubclass(model, MANIFEST_MODELS) else "rows")
+
+
+# Session hooks: mark sessions that touch catalog tables and bump the version on commit
+@event.listens_for(Session, "after_flush")
+def _track_flushed_changes(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, CATALOG_MODELS):
+            _mark(session, type(obj))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_changes(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and issubclass(mapper.class_, CATALOG_MODELS):
+            _mark(orm_execute_state.session, mapper.class_)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_version(session):
+    session.flush()
+    changed = session.info.pop(_CHANGED, None)
+    if not changed:
+        return
+    manifests_only = changed == {"manifests"}
+    now = datetime.now(timezone.utc)
+    bumped = session.execute(
+        update(models.CatalogState)
+        .where(models.CatalogState.id == 1)
+        .values(
+            version=models.CatalogState.version + 1,
+            manifest_version=models.CatalogState.manifest_version + int(manifests_only),
+            updated_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if bumped.rowcount == 0:
+        session.add(models.CatalogState(id=1, version=1, manifest_version=int(manifests_only), updated_at=now))
+        session.flush()
+    version, manifest_version = session.query(
+        models.CatalogState.version, models.CatalogState.manifest_version
+    ).filter(models.CatalogState.id == 1).one()
+    session.info[_COMMITTED] = (version, manifest_version, now)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_version(session):
+    committed = session.info.pop(_COMMITTED, None)
+    if committed is not None:
+        catalog_version.committed(*committed)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_changes(session, previous_transaction):
+    session.info.pop(_CHANGED, None)
+    session.info.pop(_COMMITTED, None)
@@ -0,0 +1,287 @@
+"""Optional in-memory columnar catalog for filtering, sorting and facets
+
+When CATALOG_COLUMNAR_ENGINE is on and NumPy is installed, available-product
+listings, featured/discounted lists, /api/products/search (without a text
+query) and /api/products/facets read product ids and counts from NumPy
+arrays instead of SQL. The arrays mirror models.Product:
+- ordinal grade ranks
+- prices as floats, including the min/max final price that price_range.py
+  derives from carat availability
+- boolean masks for availability, featured and each category
+
+Responses are still built from the JSON snapshot. Writes go through the ORM
+as before.
+
+crud reports every write through notify(). Changed products are re-read
+and patched into the arrays on the next query. Category and pricing
+changes, new or deleted products, and writes from other workers (seen as
+an unexpected catalog version) rebuild the arrays from scratch.
+"""
+
+import logging
+import threading
+from collections import namedtuple
+from typing import Iterable, List, Optional
+
+from decouple import config
+from sqlalchemy.orm import Session
+
+import catalog_version
+import grades
+import models
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; without it the SQL path is used
+    np = None
+
+CATALOG_COLUMNAR_ENGINE = config('CATALOG_COLUMNAR_ENGINE', default=False, cast=bool)
+
+logger = logging.getLogger(__name__)
+_warned_missing_numpy = False
+
+_COLUMNS = (
+    models.Product.id, models.Product.category_id, models.Product.shape,
+    models.Product.color_rank, models.Product.clarity_rank, models.Product.cut_rank,
+    models.Product.carat_weight, models.Product.price, models.Product.discount_percentage,
+    models.Product.min_final_price, models.Product.max_final_price,
+    models.Product.is_available, models.Product.is_featured, models.Product.created_at,
+)
+
+
+# Same attribute names as the rows of the grouped SQL facet query
+_Row = namedtuple("_Row", "category_id name shape color_rank clarity_rank price_bucket count")
+
+
+def enabled() -> bool:
+    global _warned_missing_numpy
+    if CATALOG_COLUMNAR_ENGINE and np is None and not _warned_missing_numpy:
+        _warned_missing_numpy = True
+        logger.warning("CATALOG_COLUMNAR_ENGINE is on but NumPy is not installed; catalog queries use SQL")
+    return CATALOG_COLUMNAR_ENGINE and np is not None
+
+
+def _floats(values):
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def _ranks(values):
+    return np.array([-1 if value is None else value for value in values], dtype=np.int16)
+
+
+def _timestamps(values):
+    # Naive and aware datetimes share one ordering: the wall-clock value as stored
+    return np.array([value.replace(tzinfo=None) for value in values], dtype="datetime64[us]").astype(np.int64)
+
+
+class CatalogColumns:
+    """Column arrays for every product, ordered by id"""
+
+    def __init__(self, rows, categories, version):
+        self.version = version
+        self.category_names = categories
+        columns = list(zip(*rows)) if rows else [()] * len(_COLUMNS)
+        (ids, category_ids, shapes, color_ranks, clarity_ranks, cut_ranks, carats, prices, discounts,
+         min_final_prices, max_final_prices, available, featured, created_at) = columns
+
+        self.ids = np.array(ids, dtype=np.int64)
+        self.position = {product_id: i for i, product_id in enumerate(ids)}
+        self.category_id = np.array([-1 if value is None else value for value in category_ids], dtype=np.int64)
+        # Shapes are dictionary-encoded; code -1 is NULL
+        self.shape_names = sorted({shape for shape in shapes if shape is not None})
+        codes = {shape: code for code, shape in enumerate(self.shape_names)}
+        self.shape = np.array([codes.get(shape, -1) for shape in shapes], dtype=np.int32)
+        self.color_rank = _ranks(color_ranks)
+        self.clarity_rank = _ranks(clarity_ranks)
+        self.cut_rank = _ranks(cut_ranks)
+        self.carat_weight = _floats(carats)
+        self.price = _floats(prices)
+        self.discount = _floats(discounts)
+        self.min_final_price = _floats(min_final_prices)
+        self.max_final_price = _floats(max_final_prices)
+        self.available = np.array([value is True for value in available], dtype=bool)
+        self.featured = np.array([value is True for value in featured], dtype=bool)
+        self.created_at = _timestamps(created_at)
+        self._category_masks = {}
+
+    @classmethod
+    def load(cls, db: Session, version):
+        rows = db.query(*_COLUMNS).order_by(models.Product.id).all()
+        categories = dict(db.query(models.Category.id, models.Category.name))
+        return cls(rows, categories, version)
+
+    @staticmethod
+    def read(db: Session, product_ids: Iterable[int]):
+        return db.query(*_COLUMNS).filter(models.Product.id.in_(product_ids)).all()
+
+    def patch(self, product_ids: Iterable[int], rows) -> bool:
+        """Write re-read rows for the given products in place; False when the id set itself changed"""
+        product_ids = set(product_ids)
+        if len(rows) != len(product_ids) or any(row.id not in self.position for row in rows):
+            return False
+        if any(row.shape is not None and row.shape not in self.shape_names for row in rows):
+            return False
+        codes = {shape: code for code, shape in enumerate(self.shape_names)}
+        for row in rows:
+            i = self.position[row.id]
+            self.category_id[i] = -1 if row.category_id is None else row.category_id
+            self.shape[i] = codes.get(row.shape, -1)
+            self.color_rank[i], self.clarity_rank[i], self.cut_rank[i] = _ranks(
+                [row.color_rank, row.clarity_rank, row.cut_rank]
+            )
+            (self.carat_weight[i], self.price[i], self.discount[i],
+             self.min_final_price[i], self.max_final_price[i]) = _floats(
+                [row.carat_weight, row.price, row.discount_percentage, row.min_final_price, row.max_final_price]
+            )
+            self.available[i] = row.is_available is True
+            self.featured[i] = row.is_featured is True
+            self.created_at[i] = _timestamps([row.created_at])[0]
+        self._category_masks.clear()
+        return True
+
+    # Queries: boolean masks over all products, then ids in the SQL path's order
+
+    def category_mask(self, category_id: int):
+        mask = self._category_masks.get(category_id)
+        if mask is None:
+            mask = self._category_masks[category_id] = self.category_id == category_id
+        return mask
+
+    def shape_mask(self, shapes):
+        codes = [self.shape_names.index(shape) for shape in shapes if shape in self.shape_names]
+        return np.isin(self.shape, codes)
+
+    def filter(self, category_id: Optional[int] = None, shapes=(), colors=(), clarities=(), cuts=(),
+               color_min=None, color_max=None, clarity_min=None, clarity_max=None, cut_min=None, cut_max=None,
+               carat_min=None, carat_max=None, price_min=None, price_max=None):
+        """Mask of available products matching crud.filter_products() semantics (no text query)"""
+        mask = self.available.copy()
+        if category_id:
+            mask &= self.category_mask(category_id)
+        if shapes:
+            mask &= self.shape_mask(shapes)
+        for scale, column, values, low, high in (
+            ("color", self.color_rank, colors, color_min, color_max),
+            ("clarity", self.clarity_rank, clarities, clarity_min, clarity_max),
+            ("cut", self.cut_rank, cuts, cut_min, cut_max),
+        ):
+            if values:
+                mask &= np.isin(column, [grades.rank(scale, value) for value in values])
+            if low:
+                mask &= (column >= grades.rank(scale, low)) & (column >= 0)
+            if high:
+                mask &= (column <= grades.rank(scale, high)) & (column >= 0)
+        # NaN comparisons are False, which drops NULLs just like SQL
+        for column, low, high in ((self.carat_weight, carat_min, carat_max), (self.price, price_min, price_max)):
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        return mask
+
+    def order(self, mask, sort: str):
+        """Indices of the masked products in crud.PRODUCT_SEARCH_SORTS order (ties by id).
+
+        Also "id" (plain listings) and "discount" (largest discount first).
+        """
+        index = np.flatnonzero(mask)
+        ids = self.ids[index]
+        if sort == "id":
+            return index  # already in id order
+        if sort == "discount":
+            keys = (ids, -self.discount[index])
+        elif sort in ("newest", "relevance"):
+            keys = (ids, -self.created_at[index])
+        elif sort in ("price", "price_desc"):
+            price = self.price[index]
+            keys = (ids, price if sort == "price" else -price)
+        else:
+            column = {
+                "carat": self.carat_weight, "carat_desc": self.carat_weight, "color": self.color_rank,
+                "clarity": self.clarity_rank, "cut": self.cut_rank,
+            }[sort][index].astype(np.float64)
+            missing = np.isnan(column) | (column < 0)
+            value = np.where(missing, 0.0, -column if sort == "carat_desc" else column)
+            keys = (ids, value, missing)
+        return index[np.lexsort(keys)]
+
+    def ids_for(self, index, skip: int = 0, limit: Optional[int] = None) -> List[int]:
+        end = None if limit is None else skip + limit
+        return self.ids[index[skip:end]].tolist()
+
+    def grouped_rows(self, mask, price_boundaries):
+        """(category_id, category name, shape, color rank, clarity rank, price bucket, count) per combination"""
+        index = np.flatnonzero(mask)
+        if not len(index):
+            return []
+        buckets = np.searchsorted(np.asarray(price_boundaries, dtype=np.float64), self.price[index], side="right")
+        keys = np.stack([
+            self.category_id[index], self.shape[index], self.color_rank[index],
+            self.clarity_rank[index], buckets,
+        ], axis=1)
+        combinations, counts = np.unique(keys, axis=0, return_counts=True)
+        rows = []
+        for (category_id, shape, color_rank, clarity_rank, bucket), count in zip(combinations.tolist(), counts.tolist()):
+            category_id = None if category_id < 0 else category_id
+            rows.append(_Row(
+                category_id, self.category_names.get(category_id),
+                self.shape_names[shape] if shape >= 0 else None,
+                None if color_rank < 0 else color_rank,
+                None if clarity_rank < 0 else clarity_rank,
+                bucket, count,
+            ))
+        return rows
+
+
+class CatalogEngine:
+    """Holds the current CatalogColumns and applies the crud change feed"""
+
+    def __init__(self):
+        self._columns = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def columns(self, db: Session) -> CatalogColumns:
+        # Queries run outside the lock: on an AsyncSession they yield to the
+        # event loop, and another request waiting on a thread lock would stall it
+        version, _ = catalog_version.catalog_version.current(db)
+        with self._lock:
+            columns = self._columns
+            pending = set(self._pending)
+        if columns is not None and columns.version == version:
+            if not pending:
+                return columns
+            rows = CatalogColumns.read(db, pending)
+            with self._lock:
+                if self._columns is columns and columns.patch(pending, rows):
+                    self._pending -= pending
+                    return columns
+        columns = CatalogColumns.load(db, version)
+        with self._lock:
+            self._columns = columns
+            self._pending.clear()
+        return columns
+
+    def notify(self, product_ids: Optional[Iterable[int]] = None):
+        """Change feed from crud: these products (None: anything) were just committed"""
+        with self._lock:
+            columns = self._columns
+            if columns is None:
+                return
+            version = catalog_version.catalog_version.version
+            # Our own commit moves the version by one; a bigger jump means
+            # someone else wrote too, so start over
+            if product_ids is None or version is None or version - columns.version not in (0, 1):
+                self._columns = None
+                self._pending.clear()
+                return
+            columns.version = version
+            self._pending.update(product_ids)
+
+    def reset(self):
+        with self._lock:
+            self._columns = None
+            self._pending.clear()
+
+
+catalog_engine = CatalogEngine()
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+# Point the app at a throwaway database before anything imports database.py
+_test_db_dir = tempfile.mkdtemp(prefix="diamond_store_test_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_test_db_dir}/test.db")
+
+# main.py mounts ./uploads relative to the working directory
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal, engine, writer_engine
+import models
+import cache
+import catalog_version
+import carat_pricing
+import search_index
+import rate_limit
+import image_srcsets
+import columnar
+
+
+@pytest.fixture
+def db():
+    """Fresh schema and session for each test"""
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        search_index.drop(connection)
+        search_index.create(connection)
+    cache.clear()
+    cache.user_cache.clear()
+    rate_limit.login_limiter.reset()
+    catalog_version.catalog_version.reset()
+    image_srcsets.manifests.reset({}, catalog_version.catalog_version.manifest_generation)
+    carat_pricing.pricing_table.invalidate()
+    columnar.catalog_engine.reset()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    import main
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def admin_headers(db):
+    import auth
+    admin = models.User(
+        email="admin@example.com", username="admin", full_name="מנהל",
+        hashed_password="unused", is_admin=True,
+    )
+    db.add(admin)
+    db.commit()
+    token = auth.create_access_token(data={"sub": admin.email})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def pbkdf2_hash(password, salt="salt"):
+    """A password hash in the legacy hash:salt format verify_password still accepts"""
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000).hex()
+    return f"{digest}:{salt}"
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement the engine executes inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = [engine] + ([writer_engine] if writer_engine is not None else [])
+    for bind in engines:
+        event.listen(bind, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for bind in engines:
+            event.remove(bind, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def query_counter():
+    return count_queries
+
+
+def seed_catalog(db, products=10, categories=2, images=3, variants=2, carats=4):
+    """Insert a small catalog with every relationship populated"""
+    db_categories = [
+        models.Category(name=f"קטגוריה {i}", description="") for i in range(categories)
+    ]
+    db.add_all(db_categories)
+    db.flush()
+    for i in range(products):
+        product = models.Product(
+            name=f"יהלום {i}",
+            description="יהלום מעבדה",
+            base_price=1000.0 + i,
+            price=1000.0 + i,
+            carat_weight=1.0,
+            color_grade="E",
+            clarity_grade="VS1",
+            cut_grade="Excellent",
+            shape="Round",
+            is_featured=i % 3 == 0,
+            discount_percentage=10.0 if i % 4 == 0 else 0.0,
+            category_id=db_categories[i % categories].id,
+        )
+        product.images = [
+            models.ProductImage(image_url=f"/uploads/{i}-{j}.jpg", sort_order=j)
+            for j in range(images)
+        ]
+        product.variants = [
+            models.ProductVariant(color_name=f"Gold {j}", color_code="#ffd700", images=[], sort_order=j)
+            for j in range(variants)
+        ]
+        product.available_carats = [
+            models.ProductCaratAvailability(carat_weight=0.5 * (j + 1), sort_order=j)
+            for j in range(carats)
+        ]
+        db.add(product)
+    db.commit()
+    return db_categories
@@ -1,7 +1,21 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, func, tuple_, type_coerce, String
+import base64
+import json
+from datetime import datetime
+from typing import List
 import models
 import schemas
+import cache
+import catalog_version  # registers the session hooks that bump the catalog version
+import carat_pricing
+import price_range  # registers the session hooks that maintain min/max_final_price
+import grades
+import search_index
+import columnar
+import uploads
 from typing import Optional
 
 # User CRUD
@@ -14,10 +28,11 @@ def get_user_by_email(db: Session, email: str):
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    # Import inside function to avoid circular import
-    from auth import get_password_hash
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
+    if hashed_password is None:
+        # Import inside function to avoid circular import
+        from auth import get_password_hash
+        hashed_password = get_password_hash(user.password)
     db_user = models.User(
         email=user.email,
         username=user.username,
@@ -30,6 +45,23 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.refresh(db_user)
     return db_user
 
+def update_user_password_hash(db: Session, db_user: models.User, hashed_password: str):
+    db_user.hashed_password = hashed_password
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+def revoke_user_tokens(db: Session, user_id: int):
+    """Invalidate every access token issued to the user so far"""
+    db_user = get_user(db, user_id)
+    if db_user is None:
+        return None
+    db_user.token_version = (db_user.token_version or 0) + 1
+    db.commit()
+    db.refresh(db_user)
+    cache.forget_user(user_id)
+    return db_user
+
 # Category CRUD
 def get_categories(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Category).filter(models.Category.is_active == True).offset(skip).limit(limit).all()
@@ -37,28 +69,44 @@ def get_categories(db: Session, skip: int = 0, limit: int = 100):
 def get_category(db: Session, category_id: int):
     return db.query(models.Category).filter(models.Category.id == category_id).first()
 
+def category_exists(db: Session, category_id: int) -> bool:
+    return db.query(models.Category.id).filter(models.Category.id == category_id).first() is not None
+
 def create_category(db: Session, category: schemas.CategoryCreate):
     db_category = models.Category(**category.dict())
     db.add(db_category)
     db.commit()
     db.refresh(db_category)
+    categories_changed()
     return db_category
 
 def update_category(db: Session, category_id: int, category: schemas.CategoryUpdate):
     db_category = db.query(models.Category).filter(models.Category.id == category_id).first()
     if db_category:
+        image_urls = {db_category.image_url, db_category.hero_image_url}
         update_data = category.dict(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_category, field, value)
+        db.flush()
+        search_index.index_category(db, category_id)
         db.commit()
         db.refresh(db_category)
+        categories_changed()
+        uploads.release(db, image_urls - {db_category.image_url, db_category.hero_image_url})
     return db_category
 
 def delete_category(db: Session, category_id: int):
     db_category = db.query(models.Category).filter(models.Category.id == category_id).first()
     if db_category:
+        # Deleting the category detaches its products; their index rows still carry its name
+        product_ids = [row.id for row in db.query(models.Product.id).filter(models.Product.category_id == category_id)]
+        image_urls = [db_category.image_url, db_category.hero_image_url]
         db.delete(db_category)
+        db.flush()
+        search_index.index_products(db, product_ids)
         db.commit()
+        categories_changed()
+        uploads.release(db, image_urls)
     return db_category
 
 # Carat Pricing CRUD
@@ -67,13 +115,14 @@ def get_carat_pricing(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.CaratPricing).filter(models.CaratPricing.is_active == True).order_by(models.CaratPricing.carat_weight).offset(skip).limit(limit).all()
 
 def get_carat_pricing_by_weight(db: Session, carat_weight: float):
-    """Get specific carat pricing by weight"""
+    """Get specific carat pricing by weight (nearest configured weight within tolerance)"""
+    tolerance = carat_pricing.CARAT_WEIGHT_TOLERANCE
     return db.query(models.CaratPricing).filter(
         and_(
-            models.CaratPricing.carat_weight == carat_weight,
+            models.CaratPricing.carat_weight.between(carat_weight - tolerance, carat_weight + tolerance),
             models.CaratPricing.is_active == True
         )
-    ).first()
+    ).order_by(func.abs(models.CaratPricing.carat_weight - carat_weight)).first()
 
 def create_carat_pricing(db: Session, carat_pricing: schemas.CaratPricingCreate):
     """Create new carat pricing configuration"""
@@ -81,6 +130,7 @@ def create_carat_pricing(db: Session, carat_pricing: schemas.CaratPricingCreate)
     db.add(db_carat_pricing)
     db.commit()
     db.refresh(db_carat_pricing)
+    pricing_table_changed()
     return db_carat_pricing
 
 def update_carat_pricing(db: Session, carat_pricing_id: int, carat_pricing: schemas.CaratPricingUpdate):
@@ -92,6 +142,7 @@ def update_carat_pricing(db: Session, carat_pricing_id: int, carat_pricing: sche
             setattr(db_carat_pricing, field, value)
         db.commit()
         db.refresh(db_carat_pricing)
+        pricing_table_changed()
     return db_carat_pricing
 
 def delete_carat_pricing(db: Session, carat_pricing_id: int):
@@ -100,16 +151,29 @@ def delete_carat_pricing(db: Session, carat_pricing_id: int):
     if db_carat_pricing:
         db.delete(db_carat_pricing)
         db.commit()
+        pricing_table_changed()
     return db_carat_pricing
 
+def pricing_table_changed():
+    """Rebuild the in-memory carat pricing table on its next lookup"""
+    carat_pricing.pricing_table.invalidate()
+    # Every product's price range may have moved
+    cache.invalidate_products()
+    columnar.catalog_engine.notify()
+
+# Change feed: every committed catalog write reports here
+def product_changed(product_id=None):
+    cache.invalidate_product(product_id)
+    columnar.catalog_engine.notify(None if product_id is None else [product_id])
+
+def categories_changed():
+    cache.invalidate_categories()
+    columnar.catalog_engine.notify()
+
 def calculate_price_for_carat(db: Session, base_price: float, carat_weight: float, discount_percentage: float = 0.0):
     """Calculate price for a specific carat weight"""
-    carat_pricing = get_carat_pricing_by_weight(db, carat_weight)
-    if not carat_pricing:
-        # Default to 1.0 multiplier if carat pricing not found
-        price_multiplier = 1.0
-    else:
-        price_multiplier = carat_pricing.price_multiplier
+    # In-memory lookup; defaults to a 1.0 multiplier if no carat pricing applies
+    price_multiplier = carat_pricing.multiplier_for(db, carat_weight)
     
     calculated_price = base_price * price_multiplier
     final_price = calculated_price * (1 - discount_percentage / 100)
@@ -123,6 +187,42 @@ def calculate_price_for_carat(db: Session, base_price: float, carat_weight: floa
         "final_price": final_price
     }
 
+def get_price_matrix(db: Session, product_ids: List[int]):
+    """Prices for every available carat of each product, from one availability query"""
+    rows = db.query(
+        models.ProductCaratAvailability.product_id,
+        models.ProductCaratAvailability.carat_weight,
+        models.Product.base_price,
+        models.Product.discount_percentage,
+    ).join(models.Product, models.Product.id == models.ProductCaratAvailability.product_id).filter(
+        models.ProductCaratAvailability.product_id.in_(product_ids),
+        models.ProductCaratAvailability.is_available == True,
+    ).order_by(
+        models.ProductCaratAvailability.product_id,
+        models.ProductCaratAvailability.sort_order,
+        models.ProductCaratAvailability.id,
+    ).all()
+
+    multipliers = carat_pricing.pricing_table.table(db).multipliers_for([row.carat_weight for row in rows])
+
+    matrix = {}
+    for row, price_multiplier in zip(rows, multipliers):
+        discount_percentage = row.discount_percentage or 0.0
+        calculated_price = row.base_price * price_multiplier
+        matrix.setdefault(row.product_id, []).append({
+            "base_price": row.base_price,
+            "carat_weight": row.carat_weight,
+            "price_multiplier": price_multiplier,
+            "calculated_price": calculated_price,
+            "discount_percentage": discount_percentage,
+            "final_price": calculated_price * (1 - discount_percentage / 100),
+        })
+    # Requested order, each product once; products without available carats get []
+    return [
+        {"product_id": product_id, "prices": matrix.get(product_id, [])}
+        for product_id in dict.fromkeys(product_ids)
+    ]
+
 # Product Carat Availability CRUD
 def get_product_available_carats(db: Session, product_id: int):
     """Get all available carat weights for a product"""
@@ -139,6 +239,7 @@ def create_product_carat_availability(db: Session, product_carat: schemas.Produc
     db.add(db_product_carat)
     db.commit()
     db.refresh(db_product_carat)
+    product_changed(db_product_carat.product_id)
     return db_product_carat
 
 def update_product_carat_availability(db: Session, product_carat_id: int, product_carat: schemas.ProductCaratAvailabilityCreate):
@@ -149,18 +250,22 @@ def update_product_carat_availability(db: Session, product_carat_id: int, produc
             setattr(db_product_carat, key, value)
         db.commit()
         db.refresh(db_product_carat)
+        product_changed(db_product_carat.product_id)
     return db_product_carat
 
 def delete_product_carat_availability(db: Session, product_carat_id: int):
     """Delete product carat availability"""
     db_product_carat = db.query(models.ProductCaratAvailability).filter(models.ProductCaratAvailability.id == product_carat_id).first()
     if db_product_carat:
+        product_id = db_product_carat.product_id
         db.delete(db_product_carat)
         db.commit()
+        product_changed(product_id)
     return db_product_carat
 
 def set_default_carat_for_product(db: Session, product_id: int, carat_weight: float):
     """Set a specific carat as default for a product"""
+    # is_default does not affect the price range, so price_range is not told about these updates
     # First, remove default status from all carats for this product
     db.query(models.ProductCaratAvailability).filter(
         models.ProductCaratAvailability.product_id == product_id
@@ -175,24 +280,231 @@ def set_default_carat_for_product(db: Session, product_id: int, carat_weight: fl
     ).update({"is_default": True})
     
     db.commit()
+    product_changed(product_id)
 
 # Product CRUD (Updated)
-def get_products(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None):
-    query = db.query(models.Product).options(
-        joinedload(models.Product.images),
-        joinedload(models.Product.variants),
-        joinedload(models.Product.available_carats)
-    ).filter(models.Product.is_available == True)
+def catalog_query(db: Session):
+    """Product query that eagerly loads every relationship ProductResponse serializes,
+    so building a response never falls back to per-row lazy loads.
+
+    The many-to-one category is joined; each one-to-many collection is loaded with
+    its own IN-query keyed by the page of product ids. Joining the collections would
+    return images x variants x carats rows per product and force OFFSET/LIMIT into a
+    subquery.
+    """
+    return db.query(models.Product).options(
+        joinedload(models.Product.category),
+        selectinload(models.Product.images),
+        selectinload(models.Product.variants),
+        selectinload(models.Product.available_carats)
+    )
+
+def _listing_query(db: Session, ids_only: bool):
+    """Listings either load full products or just their ids (for the JSON snapshot)"""
+    return db.query(models.Product.id) if ids_only else catalog_query(db)
+
+def _listing_result(rows, ids_only: bool):
+    return [row.id for row in rows] if ids_only else rows
+
+def get_products(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None,
+                 ids_only: bool = False):
+    if ids_only and columnar.enabled():
+        columns = columnar.catalog_engine.columns(db)
+        return columns.ids_for(columns.order(columns.filter(category_id=category_id), "id"), skip, limit)
+    query = _listing_query(db, ids_only).filter(models.Product.is_available == True)
+    if category_id:
+        query = query.filter(models.Product.category_id == category_id)
+    return _listing_result(query.order_by(models.Product.id).offset(skip).limit(limit).all(), ids_only)
+
+# Catalog search: sort name -> ORDER BY clauses; products without a value sort last.
+# "relevance" ranks full-text matches and needs a text query (see search_index.py).
+PRODUCT_SEARCH_SORTS = {
+    "relevance": (),
+    "newest": (models.Product.created_at.desc(),),
+    "price": (models.Product.price.asc(),),
+    "price_desc": (models.Product.price.desc(),),
+    "carat": (models.Product.carat_weight.asc().nulls_last(),),
+    "carat_desc": (models.Product.carat_weight.desc().nulls_last(),),
+    "color": (models.Product.color_rank.asc().nulls_last(),),
+    "clarity": (models.Product.clarity_rank.asc().nulls_last(),),
+    "cut": (models.Product.cut_rank.asc().nulls_last(),),
+}
+
+def _grade_ranks(scale: str, values):
+    """Grade names -> ranks; raises ValueError for grades not on the scale"""
+    ranks = [grades.rank(scale, value) for value in values]
+    if None in ranks:
+        raise ValueError(f"unknown {scale} grade")
+    return ranks
+
+def _between(query, column, low=None, high=None):
+    if low is not None:
+        query = query.filter(column >= low)
+    if high is not None:
+        query = query.filter(column <= high)
+    return query
+
+def filter_products(db: Session, query, q: Optional[str] = None,
+                    category_id: Optional[int] = None, shapes=(), colors=(), clarities=(), cuts=(),
+                    color_min: Optional[str] = None, color_max: Optional[str] = None,
+                    clarity_min: Optional[str] = None, clarity_max: Optional[str] = None,
+                    cut_min: Optional[str] = None, cut_max: Optional[str] = None,
+                    carat_min: Optional[float] = None, carat_max: Optional[float] = None,
+                    price_min: Optional[float] = None, price_max: Optional[float] = None):
+    """Apply the catalog search filters to a products query; returns (query, text matches).
+
+    Grade bounds are inclusive and follow the grade scale, best first: color_min="D",
+    color_max="G" matches D through G. Raises ValueError for an unknown grade.
+    """
+    query = query.filter(models.Product.is_available == True)
+    matches = search_index.matches(db, q) if q else None
+    if matches is not None:
+        query = query.join(matches, matches.c.product_id == models.Product.id)
+    if category_id:
+        query = query.filter(models.Product.category_id == category_id)
+    if shapes:
+        query = query.filter(models.Product.shape.in_(shapes))
+
+    rank_columns = {
+        "color": models.Product.color_rank,
+        "clarity": models.Product.clarity_rank,
+        "cut": models.Product.cut_rank,
+    }
+    for scale, values, low, high in (
+        ("color", colors, color_min, color_max),
+        ("clarity", clarities, clarity_min, clarity_max),
+        ("cut", cuts, cut_min, cut_max),
+    ):
+        column = rank_columns[scale]
+        if values:
+            query = query.filter(column.in_(_grade_ranks(scale, values)))
+        low_rank, high_rank = (_grade_ranks(scale, [bound])[0] if bound else None for bound in (low, high))
+        query = _between(query, column, low_rank, high_rank)
+
+    query = _between(query, models.Product.carat_weight, carat_min, carat_max)
+    query = _between(query, models.Product.price, price_min, price_max)
+    return query, matches
+
+def normalize_search_filters(q: Optional[str] = None, shapes=(), colors=(), clarities=(), cuts=(),
+                             **filters):
+    """Canonical form of search filters, so equivalent requests share one cache key.
+
+    Text is reduced to its search terms, set filters are deduplicated and sorted, and
+    grades take their spelling on the scale. Raises ValueError for an unknown grade.
+    """
+    def canonical(scale, values):
+        return tuple(sorted({grades.canonical(scale, value) for value in values}, key=lambda g: grades.rank(scale, g)))
+
+    for scale in ("color", "clarity", "cut"):
+        for bound in (f"{scale}_min", f"{scale}_max"):
+            if filters.get(bound):
+                filters[bound] = grades.canonical(scale, filters[bound])
+    return {
+        **filters,
+        "q": search_index.normalize(q) or None,
+        "shapes": tuple(sorted(set(shapes))),
+        "colors": canonical("color", colors),
+        "clarities": canonical("clarity", clarities),
+        "cuts": canonical("cut", cuts),
+    }
+
+def search_products(db: Session, skip: int = 0, limit: int = 100, sort: Optional[str] = None,
+                    ids_only: bool = False, **filters):
+    """Available products matching a text query and/or the 4C attributes (see filter_products).
+
+    Sorts by relevance when there is a text query and by newest otherwise.
+    """
+    if ids_only and not filters.get("q") and columnar.enabled():
+        columns = columnar.catalog_engine.columns(db)
+        filters.pop("q", None)
+        return columns.ids_for(columns.order(columns.filter(**filters), sort or "newest"), skip, limit)
+    query, matches = filter_products(db, _listing_query(db, ids_only), **filters)
+
+    if sort is None:
+        sort = "relevance" if matches is not None else "newest"
+    order_by = PRODUCT_SEARCH_SORTS[sort]
+    if sort == "relevance":
+        order_by = (matches.c.score,) if matches is not None else PRODUCT_SEARCH_SORTS["newest"]
+    query = query.order_by(*order_by, models.Product.id)
+    return _listing_result(query.offset(skip).limit(limit).all(), ids_only)
+
+# Keyset pagination: sort name -> (sort column, descending)
+PRODUCT_SORTS = {
+    "newest": (models.Product.created_at, True),
+    "price": (models.Product.price, False),
+}
+
+def encode_product_cursor(sort: str, value, product_id: int) -> str:
+    """Opaque cursor pointing just past the given (sort value, id) position"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, value, product_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_product_cursor(cursor: str):
+    """Return (sort, value, product_id); raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort, value, product_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("invalid cursor")
+    if sort not in PRODUCT_SORTS or not isinstance(product_id, int):
+        raise ValueError("invalid cursor")
+    return sort, value, product_id
+
+def _product_sort_key(db: Session, sort: str):
+    column, descending = PRODUCT_SORTS[sort]
+    if column is models.Product.created_at:
+        if db.get_bind().dialect.name == "sqlite":
+            # SQLite keeps timestamps as text (CURRENT_TIMESTAMP has no microseconds);
+            # compare the stored text as-is so cursor values round-trip exactly
+            return type_coerce(column, String), descending, str
+        return column, descending, datetime.fromisoformat
+    return column, descending, float
+
+def get_products_page(db: Session, cursor: Optional[str] = None, limit: int = 100,
+                      category_id: Optional[int] = None, sort: str = "newest", ids_only: bool = False):
+    """Keyset-paginated product listing ordered by (sort key, id).
+
+    Returns (products, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for a malformed cursor or one issued for another sort.
+    """
+    key, descending, parse_value = _product_sort_key(db, sort)
+    query = _listing_query(db, ids_only).add_columns(key).filter(models.Product.is_available == True)
     if category_id:
         query = query.filter(models.Product.category_id == category_id)
-    return query.offset(skip).limit(limit).all()
+
+    if cursor:
+        cursor_sort, value, last_id = decode_product_cursor(cursor)
+        if cursor_sort != sort:
+            raise ValueError("cursor was issued for a different sort")
+        try:
+            value = parse_value(value)
+        except (TypeError, ValueError):
+            raise ValueError("invalid cursor")
+        # Row-value comparison lets the (sort key, id) index seek straight to the cursor
+        position = tuple_(key, models.Product.id)
+        if descending:
+            query = query.filter(position < tuple_(value, last_id))
+        else:
+            query = query.filter(position > tuple_(value, last_id))
+
+    if descending:
+        query = query.order_by(key.desc(), models.Product.id.desc())
+    else:
+        query = query.order_by(key.asc(), models.Product.id.asc())
+
+    # Fetch one extra row to learn whether another page exists; no rows at all for an empty page
+    rows = [(row[0], row[-1]) for row in query.limit(limit + 1).all()] if limit > 0 else []
+    next_cursor = None
+    if len(rows) > limit > 0:
+        rows = rows[:limit]
+        last, last_value = rows[-1]
+        next_cursor = encode_product_cursor(sort, last_value, last if ids_only else last.id)
+    return [product for product, _ in rows], next_cursor
 
 def get_product(db: Session, product_id: int):
-    return db.query(models.Product).options(
-        joinedload(models.Product.images),
-        joinedload(models.Product.variants),
-        joinedload(models.Product.available_carats)
-    ).filter(models.Product.id == product_id).first()
+    return catalog_query(db).filter(models.Product.id == product_id).first()
 
 def create_product(db: Session, product: schemas.ProductCreate):
     # Extract available_carats before creating product
@@ -201,8 +513,11 @@ def create_product(db: Session, product: schemas.ProductCreate):
     
     db_product = models.Product(**product_data)
     db.add(db_product)
+    db.flush()
+    search_index.index_products(db, [db_product.id])
     db.commit()
     db.refresh(db_product)
+    product_changed(db_product.id)
     
     # Add carat availability if provided
     for carat_data in available_carats:
@@ -214,6 +529,7 @@ def create_product(db: Session, product: schemas.ProductCreate):
 def update_product(db: Session, product_id: int, product: schemas.ProductUpdate):
     db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if db_product:
+        image_url = db_product.image_url
         # Handle available_carats separately
         available_carats = product.available_carats
         update_data = product.dict(exclude_unset=True, exclude={"available_carats"})
@@ -224,6 +540,7 @@ def update_product(db: Session, product_id: int, product: schemas.ProductUpdate)
         # Update carat availability if provided
         if available_carats is not None:
             # Delete existing carat availability
+            price_range.mark_products(db, [product_id])
             db.query(models.ProductCaratAvailability).filter(
                 models.ProductCaratAvailability.product_id == product_id
             ).delete()
@@ -233,28 +550,38 @@ def update_product(db: Session, product_id: int, product: schemas.ProductUpdate)
                 carat_data.product_id = product_id
                 create_product_carat_availability(db, carat_data)
         
+        db.flush()
+        search_index.index_products(db, [product_id])
         db.commit()
         db.refresh(db_product)
+        product_changed(product_id)
+        if db_product.image_url != image_url:
+            uploads.release(db, [image_url])
     return db_product
 
 def delete_product(db: Session, product_id: int):
     db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if db_product:
+        image_urls = [db_product.image_url, *(image.image_url for image in db_product.images)]
+        image_urls += [url for variant in db_product.variants for url in variant.images or []]
         db.delete(db_product)
+        search_index.remove_products(db, [product_id])
         db.commit()
+        product_changed(product_id)
+        uploads.release(db, image_urls)
     return db_product
 
-def get_featured_products(db: Session, limit: int = 6):
+def get_featured_products(db: Session, limit: int = 6, ids_only: bool = False):
     """Get featured products marked by admins"""
-    return db.query(models.Product).options(
-        joinedload(models.Product.images),
-        joinedload(models.Product.available_carats)
-    ).filter(
+    if ids_only and columnar.enabled():
+        columns = columnar.catalog_engine.columns(db)
+        return columns.ids_for(columns.order(columns.filter() & columns.featured, "id"), limit=limit)
+    return _listing_result(_listing_query(db, ids_only).filter(
         and_(
             models.Product.is_available == True,
             models.Product.is_featured == True
         )
-    ).limit(limit).all()
+    ).order_by(models.Product.id).limit(limit).all(), ids_only)
 
 def toggle_product_featured(db: Session, product_id: int):
     """Toggle the featured status of a product"""
@@ -263,19 +590,20 @@ def toggle_product_featured(db: Session, product_id: int):
         db_product.is_featured = not db_product.is_featured
         db.commit()
         db.refresh(db_product)
+        product_changed(product_id)
     return db_product
 
-def get_discounted_products(db: Session, limit: int = 6):
+def get_discounted_products(db: Session, limit: int = 6, ids_only: bool = False):
     """Get products with discounts"""
-    return db.query(models.Product).options(
-        joinedload(models.Product.images),
-        joinedload(models.Product.available_carats)
-    ).filter(
+    if ids_only and columnar.enabled():
+        columns = columnar.catalog_engine.columns(db)
+        return columns.ids_for(columns.order(columns.filter() & (columns.discount > 0), "discount"), limit=limit)
+    return _listing_result(_listing_query(db, ids_only).filter(
         and_(
             models.Product.is_available == True,
             models.Product.discount_percentage > 0
         )
-    ).order_by(models.Product.discount_percentage.desc()).limit(limit).all()
+    ).order_by(models.Product.discount_percentage.desc(), models.Product.id).limit(limit).all(), ids_only)
 
 # Product Image CRUD
 def create_product_image(db: Session, product_image: schemas.ProductImageCreate):
@@ -283,6 +611,7 @@ def create_product_image(db: Session, product_image: schemas.ProductImageCreate)
     db.add(db_image)
     db.commit()
     db.refresh(db_image)
+    product_changed(db_image.product_id)
     return db_image
 
 def get_product_images(db: Session, product_id: int):
@@ -293,8 +622,11 @@ def get_product_images(db: Session, product_id: int):
 def delete_product_image(db: Session, image_id: int):
     db_image = db.query(models.ProductImage).filter(models.ProductImage.id == image_id).first()
     if db_image:
+        product_id, image_url = db_image.product_id, db_image.image_url
         db.delete(db_image)
         db.commit()
+        product_changed(product_id)
+        uploads.release(db, [image_url])
     return db_image
 
 # Product Variant CRUD
@@ -303,6 +635,7 @@ def create_product_variant(db: Session, variant: schemas.ProductVariantCreate):
     db.add(db_variant)
     db.commit()
     db.refresh(db_variant)
+    product_changed(db_variant.product_id)
     return db_variant
 
 def get_product_variants(db: Session, product_id: int):
@@ -313,15 +646,31 @@ def get_product_variants(db: Session, product_id: int):
 def update_product_variant(db: Session, variant_id: int, variant: schemas.ProductVariantCreate):
     db_variant = db.query(models.ProductVariant).filter(models.ProductVariant.id == variant_id).first()
     if db_variant:
+        image_urls = set(db_variant.images or [])
         for key, value in variant.dict(exclude_unset=True).items():
             setattr(db_variant, key, value)
         db.commit()
         db.refresh(db_variant)
+        product_changed(db_variant.product_id)
+        uploads.release(db, image_urls.difference(db_variant.images or []))
     return db_variant
 
 def delete_product_variant(db: Session, variant_id: int):
     db_variant = db.query(models.ProductVariant).filter(models.ProductVariant.id == variant_id).first()
     if db_variant:
+        product_id = db_variant.product_id
+        image_urls = list(db_variant.images or [])
         db.delete(db_variant)
         db.commit()
-    return db_variant 
\ No newline at end of file
+        product_changed(product_id)
+        uploads.release(db, image_urls)
+    return db_variant
+
+# Async reads: the read functions above take a sync Session. On an AsyncSession
+# they run through run_sync, so their queries await the async driver instead
+# of holding a threadpool worker, and each query keeps a single implementation.
+async def run_read(db, read, *args, **kwargs):
+    """Await `read(session, *args, **kwargs)` on either an AsyncSession or a sync Session"""
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(read, *args, **kwargs)
+    return await run_in_threadpool(read, db, *args, **kwargs)
@@ -1,22 +1,362 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from decouple import config
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+from decouple import Csv, config
 import os
+import threading
+import time
+from typing import Optional
+
+from pool_telemetry import PoolTelemetry
 
 # Database URL - you can change this to PostgreSQL in production
 SQLALCHEMY_DATABASE_URL = config(
-    'DATABASE_URL', 
+    'DATABASE_URL',
     default="sqlite:///./diamond_store.db"
 )
 
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, 
-        connect_args={"check_same_thread": False}
+# Serve the public catalog GETs from async routes on an AsyncSession
+ASYNC_CATALOG_ROUTES = config('ASYNC_CATALOG_ROUTES', default=False, cast=bool)
+
+
+def pool_settings(workers: Optional[int], max_connections: int, engines: int = 1):
+    """Default (pool_size, max_overflow) for one engine in one worker process.
+
+    Each engine in each worker gets an even share of the database connection
+    budget, half kept open and half as overflow for bursts. When the worker
+    count is unknown the budget cannot be split safely, so each worker keeps
+    SQLAlchemy's conservative 5 + 10, shared by its engines.
+    """
+    if workers is None:
+        return max(1, 5 // engines), max(1, 10 // engines)
+    share = max(2, max_connections // max(1, workers * engines))
+    pool_size = share // 2
+    return pool_size, share - pool_size
+
+
+# Pool sizing. Without explicit sizes, the server-wide connection budget is
+# split across the uvicorn/gunicorn workers (WEB_CONCURRENCY) and engines.
+# WEB_CONCURRENCY must match the real worker count; unset, pools stay small.
+DATABASE_WORKERS = config('WEB_CONCURRENCY', default=None, cast=lambda value: None if value in (None, '') else int(value))
+DATABASE_MAX_CONNECTIONS = config('DATABASE_MAX_CONNECTIONS', default=90, cast=int)
+_default_pool_size, _default_max_overflow = pool_settings(
+    DATABASE_WORKERS, DATABASE_MAX_CONNECTIONS, engines=2 if ASYNC_CATALOG_ROUTES else 1
+)
+DATABASE_POOL_SIZE = config('DATABASE_POOL_SIZE', default=_default_pool_size, cast=int)
+DATABASE_MAX_OVERFLOW = config('DATABASE_MAX_OVERFLOW', default=_default_max_overflow, cast=int)
+# Seconds a checkout waits for a free connection before "QueuePool limit" errors
+DATABASE_POOL_TIMEOUT = config('DATABASE_POOL_TIMEOUT', default=10.0, cast=float)
+DATABASE_POOL_RECYCLE = config('DATABASE_POOL_RECYCLE', default=1800, cast=int)
+DATABASE_POOL_PRE_PING = config('DATABASE_POOL_PRE_PING', default=True, cast=bool)
+# PostgreSQL statement_timeout for every connection; 0 disables
+DATABASE_STATEMENT_TIMEOUT_MS = config('DATABASE_STATEMENT_TIMEOUT_MS', default=30000, cast=int)
+DATABASE_ECHO = config('DATABASE_ECHO', default=False, cast=bool)
+
+# SQLite production profile for file databases: WAL, so readers never block
+# the writer and vice versa, plus one serialized writer connection per
+# process (see RoutingSession)
+SQLITE_PRODUCTION_MODE = config('SQLITE_PRODUCTION_MODE', default=True, cast=bool)
+SQLITE_BUSY_TIMEOUT_MS = config('SQLITE_BUSY_TIMEOUT_MS', default=5000, cast=int)
+SQLITE_SYNCHRONOUS = config('SQLITE_SYNCHRONOUS', default='NORMAL')
+SQLITE_MMAP_SIZE = config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int)
+# Negative values are KiB: -65536 is a 64 MiB page cache per connection
+SQLITE_CACHE_SIZE = config('SQLITE_CACHE_SIZE', default=-65536, cast=int)
+
+# Read replicas for read-only routes (same schema, replicated from DATABASE_URL)
+DATABASE_REPLICA_URLS = config('DATABASE_REPLICA_URLS', default='', cast=Csv())
+# How long a replica that failed stays out before it is pinged again
+DATABASE_REPLICA_RETRY_SECONDS = config('DATABASE_REPLICA_RETRY_SECONDS', default=30.0, cast=float)
+# Reads stay on the primary this long after a write, covering replication lag
+DATABASE_READ_YOUR_WRITES_SECONDS = config('DATABASE_READ_YOUR_WRITES_SECONDS', default=5.0, cast=float)
+
+pool_telemetry = {
+    "primary": PoolTelemetry("primary"), "writer": PoolTelemetry("writer"), "async": PoolTelemetry("async"),
+}
+
+
+def is_sqlite_file(url) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Connect hook of the SQLite profile"""
+    cursor = dbapi_connection.cursor()
+    for pragma in (
+        "journal_mode=WAL",
+        f"synchronous={SQLITE_SYNCHRONOUS}",
+        f"mmap_size={SQLITE_MMAP_SIZE}",
+        f"cache_size={SQLITE_CACHE_SIZE}",
+        "temp_store=MEMORY",
+        f"busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    ):
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+def _driver_autocommit(dbapi_connection, connection_record):
+    # Let SQLAlchemy's "begin" event issue BEGIN instead of pysqlite's implicit one
+    dbapi_connection.isolation_level = None
+
+
+def _begin_immediate(connection):
+    # Take the write lock up front: waiting for it honours busy_timeout, while
+    # upgrading a deferred transaction fails at once when another process writes
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def engine_options(url: str, telemetry: PoolTelemetry, asynchronous: bool = False) -> dict:
+    """create_engine() keyword arguments for the configured pool on this database"""
+    url = make_url(url)
+    options = {"echo": DATABASE_ECHO}
+    if url.get_backend_name() == "sqlite":
+        if asynchronous:
+            return options  # aiosqlite keeps its default NullPool
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            return options  # one shared in-memory connection, nothing to size
+    else:
+        options["pool_recycle"] = DATABASE_POOL_RECYCLE
+        options["pool_pre_ping"] = DATABASE_POOL_PRE_PING
+    if url.get_backend_name() == "postgresql" and DATABASE_STATEMENT_TIMEOUT_MS:
+        if asynchronous:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DATABASE_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DATABASE_STATEMENT_TIMEOUT_MS}"}
+    options.update(
+        poolclass=telemetry.pool_class(AsyncAdaptedQueuePool if asynchronous else QueuePool),
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
     )
-else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    return options
+
+
+def is_write(clause) -> bool:
+    """INSERT/UPDATE/DELETE constructs, or text() starting with a write verb"""
+    if isinstance(clause, UpdateBase):
+        return True
+    if isinstance(clause, TextClause):
+        verb = clause.text.lstrip().split(None, 1)[:1]
+        return bool(verb) and verb[0].upper() in ("INSERT", "UPDATE", "DELETE", "REPLACE")
+    return False
+
+
+class RoutingSession(Session):
+    """Session that reads from the pool and writes through the writer engine.
+
+    From the first write (a flush or a write statement) to the end of the
+    transaction, every statement uses the writer so the transaction reads its
+    own writes. Without a writer it is a plain Session.
+    """
+
+    def __init__(self, *args, writer=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writer = writer
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        if self.writer is not None and (self.info.get("writing") or self._flushing or is_write(clause)):
+            self.info["writing"] = True
+            return self.writer
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _release_writer(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("writing", None)
+
+
+def create_read_engine(url: str, telemetry: PoolTelemetry):
+    """Pooled engine for reads (and, without the SQLite writer, writes) on a database URL"""
+    engine = telemetry.attach(create_engine(url, **engine_options(url, telemetry)))
+    if SQLITE_PRODUCTION_MODE and is_sqlite_file(url):
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+    return engine
+
+
+def create_engines(url: str, telemetry: dict = pool_telemetry):
+    """(engine, writer_engine) for a database URL.
+
+    writer_engine is None unless the SQLite profile applies. Then it holds a
+    single connection, so in-process writers queue for it with
+    DATABASE_POOL_TIMEOUT instead of contending for the database lock.
+    """
+    engine = create_read_engine(url, telemetry["primary"])
+    if not (SQLITE_PRODUCTION_MODE and is_sqlite_file(url)):
+        return engine, None
+    writer_engine = telemetry["writer"].attach(create_engine(
+        url, echo=DATABASE_ECHO, connect_args={"check_same_thread": False},
+        poolclass=telemetry["writer"].pool_class(), pool_size=1, max_overflow=0,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+    ))
+    event.listen(writer_engine, "connect", apply_sqlite_pragmas)
+    event.listen(writer_engine, "connect", _driver_autocommit)
+    event.listen(writer_engine, "begin", _begin_immediate)
+    return engine, writer_engine
+
+
+def session_factory(engine, writer_engine=None):
+    return sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine, writer=writer_engine)
+
+
+engine, writer_engine = create_engines(SQLALCHEMY_DATABASE_URL)
+
+SessionLocal = session_factory(engine, writer_engine)
+Base = declarative_base()
+
+
+class ReplicaSet:
+    """Read replica engines, picked round-robin among the healthy ones.
+
+    A replica whose connection fails is taken out of rotation for
+    retry_seconds, then pinged before it gets traffic again. After this
+    process commits a write, choose() returns None (read from the primary)
+    for sticky_seconds, so caches are not refilled from a lagging replica.
+    """
+
+    def __init__(self, engines, retry_seconds: float = 30.0, sticky_seconds: float = 5.0, clock=time.monotonic):
+        self.engines = list(engines)
+        self.retry_seconds = retry_seconds
+        self.sticky_seconds = sticky_seconds
+        self.clock = clock
+        self._next = 0
+        self._down_until = {}
+        self._primary_until = None
+        self._lock = threading.Lock()
+        for replica in self.engines:
+            event.listen(replica, "handle_error", self._on_error)
+
+    def choose(self):
+        """The next healthy replica engine, or None to use the primary"""
+        now = self.clock()
+        if not self.engines or (self._primary_until is not None and now < self._primary_until):
+            return None
+        for _ in range(len(self.engines)):
+            with self._lock:
+                replica = self.engines[self._next % len(self.engines)]
+                self._next += 1
+                down_until = self._down_until.get(replica)
+            if down_until is None or (now >= down_until and self.ping(replica)):
+                return replica
+        return None
+
+    def ping(self, replica) -> bool:
+        try:
+            with replica.connect() as connection:
+                connection.exec_driver_sql("SELECT 1")
+        except exc.DBAPIError:
+            self.mark_down(replica)
+            return False
+        with self._lock:
+            self._down_until.pop(replica, None)
+        return True
+
+    def mark_down(self, replica):
+        with self._lock:
+            self._down_until[replica] = self.clock() + self.retry_seconds
+
+    def note_write(self):
+        self._primary_until = self.clock() + self.sticky_seconds
+
+    def _on_error(self, context):
+        # Lost connections, or no connection at all; query errors keep the replica
+        if context.is_disconnect or context.connection is None:
+            self.mark_down(context.engine)
+
+
+replicas = ReplicaSet(
+    [
+        create_read_engine(url, pool_telemetry.setdefault(f"replica-{i}", PoolTelemetry(f"replica-{i}")))
+        for i, url in enumerate(DATABASE_REPLICA_URLS)
+    ],
+    retry_seconds=DATABASE_REPLICA_RETRY_SECONDS,
+    sticky_seconds=DATABASE_READ_YOUR_WRITES_SECONDS,
+)
+
+
+def read_session() -> Session:
+    """Session for read-only routes: on a healthy replica, else the primary.
+
+    Anything it does write still goes to the primary.
+    """
+    replica = replicas.choose()
+    if replica is None:
+        return SessionLocal()
+    return SessionLocal(bind=replica, writer=writer_engine or engine)
+
+
+# Track committed writes so this process reads its own writes from the primary
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_write(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _note_write(session):
+    if session.info.pop("wrote", False):
+        replicas.note_write()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_write(session, previous_transaction):
+    session.info.pop("wrote", None)
+
+# Async drivers for the same databases: aiosqlite locally, asyncpg in production
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with its driver swapped for the async one (sqlite:// -> sqlite+aiosqlite://)"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+_async_engine = None
+
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+
+def get_async_engine():
+    """The async engine, created on first use so the async driver is only needed when enabled"""
+    global _async_engine
+    if _async_engine is None:
+        telemetry = pool_telemetry["async"]
+        _async_engine = create_async_engine(
+            async_database_url(SQLALCHEMY_DATABASE_URL),
+            **engine_options(SQLALCHEMY_DATABASE_URL, telemetry, asynchronous=True),
+        )
+        telemetry.attach(_async_engine.sync_engine)
+        if SQLITE_PRODUCTION_MODE and is_sqlite_file(SQLALCHEMY_DATABASE_URL):
+            event.listen(_async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    return _async_engine
+
+
+def async_session() -> AsyncSession:
+    return AsyncSessionLocal(bind=get_async_engine())
+
+
+async def dispose_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base() 
\ No newline at end of file
+def pool_stats() -> dict:
+    """Telemetry for every engine this process has created"""
+    return {name: telemetry.stats() for name, telemetry in pool_telemetry.items() if telemetry.engine is not None}
@@ -0,0 +1,131 @@
+"""Filter-sidebar facet counts for the catalog, computed in one grouped query
+
+The current search filters are applied in SQL, except the facet selections
+themselves (category, shape, color, clarity). Products are then grouped by
+every facet column at once, so the database returns one row per distinct
+(category, shape, color, clarity, price bucket) combination. Each facet is
+rolled up from those rows in Python, applying the other facets' selections
+but not its own. That way picking "Round" still shows how many Oval stones
+there are.
+
+With the columnar engine enabled, the grouped rows come from its arrays
+instead (see columnar.py). The result is cached per normalized filter set and
+dropped by product writes.
+"""
+
+from collections import Counter
+from typing import Optional
+
+from decouple import Csv, config
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+import cache
+import columnar
+import crud
+import grades
+import models
+import schemas
+
+# Upper bounds of the price buckets; the last bucket is open-ended
+PRICE_FACET_BOUNDARIES = config('PRICE_FACET_BOUNDARIES', default='1000,2500,5000,10000,25000', cast=Csv(float))
+
+FACETS = ("category", "shape", "color", "clarity")
+
+
+def _price_bucket():
+    """Bucket index of the product price: 0 below the first boundary, len(boundaries) above the last"""
+    return case(
+        *[(models.Product.price < boundary, index) for index, boundary in enumerate(PRICE_FACET_BOUNDARIES)],
+        else_=len(PRICE_FACET_BOUNDARIES),
+    )
+
+
+def _grouped_rows(db: Session, q: Optional[str] = None, **filters):
+    """One row per (category, shape, color rank, clarity rank, price bucket) with its product count"""
+    if not q and columnar.enabled():
+        columns = columnar.catalog_engine.columns(db)
+        return columns.grouped_rows(columns.filter(**filters), PRICE_FACET_BOUNDARIES)
+
+    bucket = _price_bucket().label("price_bucket")
+    columns = (
+        models.Product.category_id, models.Category.name, models.Product.shape,
+        models.Product.color_rank, models.Product.clarity_rank, bucket,
+    )
+    query = db.query(*columns, func.count(models.Product.id).label("count")).outerjoin(
+        models.Category, models.Category.id == models.Product.category_id
+    )
+    query, _ = crud.filter_products(db, query, q=q, **filters)
+    return query.group_by(*columns).all()
+
+
+def product_facets(db: Session, category_id: Optional[int] = None, shapes=(), colors=(), clarities=(),
+                   **filters) -> dict:
+    """Facet counts (ProductFacets) for the given search filters"""
+    rows = _grouped_rows(db, **filters)
+
+    selected = {
+        "category": {category_id} if category_id else None,
+        "shape": set(shapes) or None,
+        "color": {grades.rank("color", grade) for grade in colors} or None,
+        "clarity": {grades.rank("clarity", grade) for grade in clarities} or None,
+    }
+
+    def included(values, skip=None):
+        return all(
+            selected[facet] is None or values[facet] in selected[facet]
+            for facet in FACETS if facet != skip
+        )
+
+    counts = {facet: Counter() for facet in FACETS + ("price",)}
+    category_names = {}
+    total = 0
+    for row in rows:
+        values = {
+            "category": row.category_id, "shape": row.shape,
+            "color": row.color_rank, "clarity": row.clarity_rank,
+        }
+        category_names[row.category_id] = row.name
+        for facet in FACETS:
+            if included(values, skip=facet):
+                counts[facet][values[facet]] += row.count
+        if included(values):
+            counts["price"][row.price_bucket] += row.count
+            total += row.count
+
+    def graded(scale):
+        scale_grades = grades.GRADE_SCALES[scale]
+        return [
+            {"value": scale_grades[rank], "count": count}
+            for rank, count in sorted(item for item in counts[scale].items() if item[0] is not None)
+        ]
+
+    bounds = [None, *PRICE_FACET_BOUNDARIES, None]
+    return {
+        "total": total,
+        "categories": [
+            {"id": category, "name": category_names[category] or "", "count": count}
+            for category, count in sorted(
+                counts["category"].items(), key=lambda item: (-item[1], category_names[item[0]] or "")
+            )
+            if category is not None
+        ],
+        "shapes": [
+            {"value": shape, "count": count}
+            for shape, count in sorted(
+                ((shape, count) for shape, count in counts["shape"].items() if shape),
+                key=lambda item: (-item[1], item[0]),
+            )
+        ],
+        "colors": graded("color"),
+        "clarities": graded("clarity"),
+        "price_ranges": [
+            {"min": bounds[index], "max": bounds[index + 1], "count": counts["price"][index]}
+            for index in range(len(PRICE_FACET_BOUNDARIES) + 1)
+        ],
+    }
+
+
+@cache.cached("facets-json", tags=("products", "product-lists"))
+def product_facets_json(db: Session, **filters) -> bytes:
+    return schemas.ProductFacets.model_validate(product_facets(db, **filters)).model_dump_json().encode("utf-8")
@@ -0,0 +1,38 @@
+"""Ordinal scales for the diamond grades stored on products
+
+Products keep the grade as entered (e.g. "VS1") plus its rank on the scale,
+best grade first, so "VVS2 or better" is an indexed integer range query.
+Grades not on a scale rank as None.
+"""
+
+from typing import Optional
+
+COLOR_GRADES = ("D", "E", "F", "G", "H", "I", "J", "K", "L", "M")
+CLARITY_GRADES = ("FL", "IF", "VVS1", "VVS2", "VS1", "VS2", "SI1", "SI2", "I1", "I2", "I3")
+CUT_GRADES = ("Excellent", "Very Good", "Good", "Fair", "Poor")
+
+GRADE_SCALES = {
+    "color": COLOR_GRADES,
+    "clarity": CLARITY_GRADES,
+    "cut": CUT_GRADES,
+}
+
+_RANKS = {
+    scale: {grade.upper(): rank for rank, grade in enumerate(grades)}
+    for scale, grades in GRADE_SCALES.items()
+}
+
+
+def rank(scale: str, grade: Optional[str]) -> Optional[int]:
+    """Position of grade on the scale (0 = best), case-insensitive"""
+    if grade is None:
+        return None
+    return _RANKS[scale].get(grade.strip().upper())
+
+
+def canonical(scale: str, grade: str) -> str:
+    """Grade as spelled on the scale ("vvs1" -> "VVS1"); raises ValueError if unknown"""
+    position = rank(scale, grade)
+    if position is None:
+        raise ValueError(f"unknown {scale} grade: {grade!r}")
+    return GRADE_SCALES[scale][position]
@@ -0,0 +1,57 @@
+"""Process-local index of image renditions: original url -> `srcset`
+
+Response schemas read srcsets from here while serializing, so lookups are
+plain dict reads and never touch the database. The index is filled by
+image_variants: loaded at startup, extended as this worker records
+renditions, and reloaded by catalog requests, on their own session, after
+another worker changed the catalog (see image_variants.sync_manifests()).
+Until it is loaded every lookup returns None.
+"""
+
+from typing import Optional
+
+
+def format_srcset(variants) -> Optional[str]:
+    return ", ".join(f"{variant['url']} {variant['width']}w" for variant in variants) or None
+
+
+class ManifestIndex:
+    """original url -> srcset, tagged with the catalog generation it was loaded at"""
+
+    def __init__(self):
+        self._srcsets = None
+        self.generation = None
+
+    def reset(self, srcsets=None, generation=None):
+        """Replace the contents, e.g. with freshly loaded manifests or {} for an empty schema; returns the old ones"""
+        previous, self._srcsets = self._srcsets, srcsets
+        self.generation = generation
+        return previous
+
+    def stale(self, generation) -> bool:
+        return self._srcsets is None or generation != self.generation
+
+    def add(self, original_url: str, variants):
+        srcsets = self._srcsets
+        if srcsets is not None:
+            # Copy on write: readers never see a dict being modified
+            self._srcsets = {**srcsets, original_url: format_srcset(variants)}
+
+    def discard(self, original_url: str):
+        srcsets = self._srcsets
+        if srcsets is not None and original_url in srcsets:
+            self._srcsets = {url: value for url, value in srcsets.items() if url != original_url}
+
+    def srcset(self, url: Optional[str]) -> Optional[str]:
+        srcsets = self._srcsets
+        if not url or srcsets is None:
+            return None
+        return srcsets.get(url)
+
+
+manifests = ManifestIndex()
+
+
+def srcset(url: Optional[str]) -> Optional[str]:
+    """`srcset` attribute value for an uploaded image, once its renditions exist"""
+    return manifests.srcset(url)
@@ -0,0 +1,272 @@
+"""Responsive WebP renditions of uploaded images, generated in a process pool
+
+After an upload is saved, submit() hands the original to a ProcessPoolExecutor
+that writes uploads/derived/<stem>-<ext>-<width>.webp for each IMAGE_VARIANT_WIDTHS
+width narrower than the original (plus the original width when it is narrower
+than the widest one). Orientation is applied before encoding and EXIF, XMP and
+other metadata are dropped; only the ICC colour profile is kept. The upload
+request returns as soon as the original is on disk.
+
+When a job finishes, its renditions are recorded in image_manifests. That is a
+catalog table, so the write bumps the catalog version (and the ETags) as a
+manifest-only commit. Responses look renditions up in a process-local index of
+the manifests (image_srcsets), loaded at startup. The worker that recorded a
+manifest adds it to its index; the others reload theirs in sync_manifests(),
+which catalog requests call on their own session once they notice a catalog
+write this worker did not make. Either way only the cached responses that
+show a changed image are dropped (invalidate_references()).
+
+Existing uploads can be processed with `python image_variants.py`.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import chain
+from pathlib import Path
+from typing import Optional
+
+from decouple import Csv, config
+from PIL import Image, ImageOps
+from sqlalchemy import String, cast, or_
+from sqlalchemy.orm import Session
+
+import cache
+import catalog_version
+import image_srcsets
+import models
+from database import SessionLocal
+
+IMAGE_VARIANTS_ENABLED = config('IMAGE_VARIANTS_ENABLED', default=True, cast=bool)
+IMAGE_VARIANT_WIDTHS = config('IMAGE_VARIANT_WIDTHS', default='320,640,1024,1600', cast=Csv(int, post_process=tuple))
+IMAGE_VARIANT_QUALITY = config('IMAGE_VARIANT_QUALITY', default=80, cast=int)
+IMAGE_PROCESS_WORKERS = config('IMAGE_PROCESS_WORKERS', default=2, cast=int)
+
+DERIVED_DIR = "derived"
+UPLOADS_URL = "/uploads/"
+
+logger = logging.getLogger(__name__)
+
+
+def target_widths(width: int, widths=IMAGE_VARIANT_WIDTHS):
+    """Rendition widths for an image `width` pixels wide; never upscales"""
+    targets = {target for target in widths if target < width}
+    if width <= max(widths):
+        targets.add(width)
+    return sorted(targets)
+
+
+def generate_variants(source: str, output_dir: str, widths=IMAGE_VARIANT_WIDTHS, quality: int = IMAGE_VARIANT_QUALITY):
+    """Write the WebP renditions of `source`; returns its size and the rendition file names.
+
+    Runs in the process pool, so it takes and returns plain picklable values.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # The extension is part of the name: the same bytes stored as .jpg and .png
+    # are two originals whose renditions must not be shared
+    stem = Path(source).name.replace(".", "-")
+    with Image.open(source) as original:
+        width, height = original.size
+        if getattr(original, "is_animated", False):
+            # A still rendition would drop the animation; keep serving the original
+            return {"width": width, "height": height, "variants": []}
+        icc_profile = original.info.get("icc_profile")
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in image.getbands() or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        variants = []
+        for target in target_widths(width, widths):
+            rendition = image if target == width else image.resize(
+                (target, max(1, round(height * target / width))), Image.LANCZOS
+            )
+            name = f"{stem}-{target}.webp"
+            partial = os.path.join(output_dir, f"{name}.part")
+            # Nothing but the colour profile is carried over: no EXIF, no XMP
+            rendition.save(partial, "WEBP", quality=quality, method=4, icc_profile=icc_profile)
+            os.replace(partial, os.path.join(output_dir, name))
+            variants.append({"width": target, "name": name})
+    return {"width": width, "height": height, "variants": variants}
+
+
+def invalidate_references(db: Session, urls):
+    """Drop the cached product and category responses that show any of `urls`"""
+    urls = set(urls)
+    if not urls:
+        return
+    product_ids = {
+        product_id for (product_id,) in
+        db.query(models.ProductImage.product_id).filter(models.ProductImage.image_url.in_(urls))
+    }
+    product_ids.update(product_id for (product_id,) in db.query(models.Product.id).filter(models.Product.image_url.in_(urls)))
+    # Variant images are a JSON list: narrow down by text, then match exact entries
+    images = cast(models.ProductVariant.images, String)
+    for product_id, variant_images in db.query(models.ProductVariant.product_id, models.ProductVariant.images).filter(
+        or_(*(images.contains(url) for url in urls))
+    ):
+        if urls.intersection(variant_images or []):
+            product_ids.add(product_id)
+    category_ids = [
+        category_id for (category_id,) in db.query(models.Category.id).filter(
+            or_(models.Category.image_url.in_(urls), models.Category.hero_image_url.in_(urls))
+        )
+    ]
+    if category_ids:
+        # Products embed their category
+        product_ids.update(
+            product_id for (product_id,) in
+            db.query(models.Product.id).filter(models.Product.category_id.in_(category_ids))
+        )
+    cache.invalidate_images(product_ids, categories=bool(category_ids))
+
+
+def record_manifest(original_url: str, result: dict):
+    """Store a finished job in image_manifests and drop the responses it changes"""
+    variants = [
+        {"width": variant["width"], "url": f"{UPLOADS_URL}{DERIVED_DIR}/{variant['name']}"}
+        for variant in result["variants"]
+    ]
+    db = SessionLocal()
+    try:
+        manifest = db.query(models.ImageManifest).filter(models.ImageManifest.original_url == original_url).first()
+        if manifest is None:
+            manifest = models.ImageManifest(original_url=original_url)
+            db.add(manifest)
+        manifest.width = result["width"]
+        manifest.height = result["height"]
+        manifest.variants = variants
+        db.commit()
+        image_srcsets.manifests.add(original_url, variants)
+        invalidate_references(db, [original_url])
+    finally:
+        db.close()
+
+
+class ImageProcessor:
+    """Lazily started process pool for generate_variants() with job counters"""
+
+    def __init__(self, workers: int = IMAGE_PROCESS_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def submit(self, path: Path, url: str, output_dir: Path) -> Future:
+        """Queue the renditions of an uploaded file; the returned future resolves once they are recorded"""
+        done = Future()
+        job = self.executor().submit(
+            generate_variants, str(path), str(output_dir), IMAGE_VARIANT_WIDTHS, IMAGE_VARIANT_QUALITY
+        )
+        with self._lock:
+            self.submitted += 1
+        job.add_done_callback(lambda job: self._finished(url, job, done))
+        return done
+
+    def _finished(self, url, job, done):
+        try:
+            result = job.result()
+            record_manifest(url, result)
+        except Exception as error:
+            with self._lock:
+                self.failed += 1
+            logger.warning("Could not generate image variants for %s: %s", url, error)
+            done.set_exception(error)
+            return
+        with self._lock:
+            self.completed += 1
+        done.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "pending": self.submitted - self.completed - self.failed,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+processor = ImageProcessor()
+
+
+def process_upload(directory: Path, saved: dict) -> Optional[Future]:
+    """Schedule renditions for a file save_upload() wrote; never fails the upload itself"""
+    if not IMAGE_VARIANTS_ENABLED:
+        return None
+    if saved.get("deduplicated") and image_srcsets.srcset(saved["url"]) is not None:
+        # Same content as an earlier upload: its renditions already exist
+        return None
+    try:
+        return processor.submit(directory / saved["filename"], saved["url"], directory / DERIVED_DIR)
+    except Exception as error:
+        logger.warning("Could not schedule image variants for %s: %s", saved["url"], error)
+        return None
+
+
+def load_manifests(db: Session) -> dict:
+    """original url -> srcset for every image_manifests row"""
+    rows = db.query(models.ImageManifest.original_url, models.ImageManifest.variants).all()
+    return {url: image_srcsets.format_srcset(variants) for url, variants in rows}
+
+
+def sync_manifests(db: Session):
+    """(Re)load the srcset index on `db` when it is empty or another worker wrote to the catalog.
+
+    Call after catalog_version has been read on the same session, so its
+    write counts are current. Responses showing an image whose srcset changed
+    are dropped from the cache.
+    """
+    generation = catalog_version.catalog_version.manifest_generation
+    if image_srcsets.manifests.stale(generation):
+        srcsets = load_manifests(db)
+        previous = image_srcsets.manifests.reset(srcsets, generation)
+        if previous is not None:
+            invalidate_references(db, {
+                url for url in previous.keys() | srcsets.keys() if previous.get(url) != srcsets.get(url)
+            })
+
+
+def backfill(uploads_dir: Path = Path("uploads")):
+    """Generate renditions for every upload that has no manifest yet"""
+    db = SessionLocal()
+    try:
+        done = {url for (url,) in db.query(models.ImageManifest.original_url)}
+    finally:
+        db.close()
+    # Legacy uploads sit in the root, content-addressed ones in uploads/ab/cd/
+    paths = sorted(chain(uploads_dir.glob("*"), uploads_dir.glob("??/??/*")))
+    urls = {path: f"{UPLOADS_URL}{path.relative_to(uploads_dir).as_posix()}" for path in paths}
+    jobs = [
+        processor.submit(path, url, uploads_dir / DERIVED_DIR)
+        for path, url in urls.items()
+        if path.is_file() and not path.name.endswith(".part") and url not in done
+    ]
+    failed = 0
+    for job in jobs:
+        if job.exception() is not None:
+            failed += 1
+    processor.shutdown()
+    return len(jobs), failed
+
+
+if __name__ == "__main__":
+    processed, failed = backfill()
+    print(f"Processed {processed} uploads ({failed} failed)")
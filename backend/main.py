@@ -1,28 +1,46 @@
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
+from functools import partial
+from typing import List, Optional, Literal, Union
+import asyncio
+import math
 import os
-import uuid
-import shutil
-from pathlib import Path
 from decouple import config
 
+import database
 from database import SessionLocal, engine
 import models
 import schemas
 import auth
+import password_hashing
+import rate_limit
+import uploads
+import static_files
+import build_index
+import image_variants
 from auth import get_current_user, get_current_admin_user
 import crud
+import cache
+import catalog_version
+import catalog_snapshot
+import carat_pricing
+import search_index
+import facets
 
 # Create tables
 models.Base.metadata.create_all(bind=engine)
+with engine.begin() as connection:
+    search_index.create(connection)
 
 app = FastAPI(title="Diamond Lab Store API")
 
+# Cap upload request bodies while they stream in (added before CORS so 413s get CORS headers)
+app.add_middleware(uploads.UploadLimitMiddleware, limits=uploads.body_limits("/api/upload", "/api/upload/batch"))
+
 # CORS middleware
 allowed_origins = config('ALLOWED_ORIGINS', default='http://localhost:3000,http://localhost:3001').split(',')
 app.add_middleware(
@@ -37,64 +55,162 @@ app.add_middleware(
 security = HTTPBearer()
 
 # Create uploads directory
-uploads_dir = Path("uploads")
+uploads_dir = uploads.UPLOAD_ROOT
 uploads_dir.mkdir(exist_ok=True)
 
-# Serve static files
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Serve static files; uploads never change under their URL, so they are cached as immutable
+app.mount("/uploads", static_files.CachedStaticFiles(directory=uploads_dir, immutable=uploads.IMMUTABLE_PATHS), name="uploads")
 
-# Mount React static files (JS, CSS, etc.)
-frontend_build_dir = Path("../frontend/build")
+# Mount React static files (JS, CSS, etc.); fingerprinted bundles are cached as immutable
+frontend_build_dir = build_index.FRONTEND_BUILD_DIR
 if frontend_build_dir.exists():
-    app.mount("/static", StaticFiles(directory="../frontend/build/static"), name="static")
+    app.mount("/static", static_files.CachedStaticFiles(directory=frontend_build_dir / "static", immutable=static_files.FINGERPRINTED), name="static")
     # Mount React build root files (images, favicon, etc.) to serve from root path
     # This serves files like /Background-White.png, /favicon.ico, /logo192.png, etc.
-    app.mount("/assets", StaticFiles(directory="../frontend/build", html=False), name="assets")
+    app.mount("/assets", static_files.CachedStaticFiles(directory=frontend_build_dir, html=False, immutable=static_files.FINGERPRINTED), name="assets")
 
 # Dependency
-def get_db():
+READ_PRIMARY_COOKIE = "read_primary"
+
+def get_db(request: Request, response: Response):
+    """Primary session, for mutating routes and authentication.
+
+    With read replicas configured, a mutating request also sets a short-lived
+    cookie that keeps this client's reads on the primary (read-your-writes).
+    """
+    if database.replicas.engines and request.method not in ("GET", "HEAD", "OPTIONS"):
+        response.set_cookie(
+            READ_PRIMARY_COOKIE, "1", max_age=max(1, round(database.DATABASE_READ_YOUR_WRITES_SECONDS)),
+            httponly=True, samesite="lax",
+        )
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+def read_session(request: Request) -> Session:
+    if request.cookies.get(READ_PRIMARY_COOKIE):
+        return SessionLocal()
+    return database.read_session()
+
+def get_read_db(request: Request):
+    """Session for read-only routes: a healthy read replica when configured, else the primary"""
+    db = read_session(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+CatalogSession = Union[Session, AsyncSession]
+
+async def get_catalog_db(request: Request):
+    """Session for the public catalog GETs: an AsyncSession when ASYNC_CATALOG_ROUTES is on.
+
+    The catalog routes are async and read through crud.run_read, so with the async
+    driver they never hold a threadpool worker; otherwise each read runs in the
+    threadpool on a sync Session as before.
+    """
+    if database.ASYNC_CATALOG_ROUTES:
+        async with database.async_session() as db:
+            yield db
+    else:
+        db = read_session(request)
+        try:
+            yield db
+        finally:
+            db.close()
+
+async def catalog_conditional(request: Request, response: Response, db: CatalogSession = Depends(get_catalog_db)):
+    """Answer conditional catalog GETs with 304 before any catalog query or serialization runs"""
+    await answer_conditional(request, response, db)
+
+async def product_conditional(request: Request, response: Response, product_id: int, db: CatalogSession = Depends(get_catalog_db)):
+    """catalog_conditional for one product: a missing product is a 404, never a 304"""
+    await answer_conditional(request, response, db, partial(catalog_snapshot.product_exists, product_id=product_id))
+
+async def category_conditional(request: Request, response: Response, category_id: int, db: CatalogSession = Depends(get_catalog_db)):
+    """catalog_conditional for one category: a missing category is a 404, never a 304"""
+    await answer_conditional(request, response, db, partial(crud.category_exists, category_id=category_id))
+
+async def answer_conditional(request: Request, response: Response, db: CatalogSession, exists=None):
+    """Raise 304 when the request's validators match the catalog version, else set them on `response`.
+
+    The ETag covers the whole catalog, so for single-row routes `exists(session)`
+    is checked before answering 304: the route then reports a missing row itself.
+    """
+    version, updated_at = await crud.run_read(db, catalog_version.catalog_version.current)
+    # Responses read image srcsets from memory; refresh them here, on the request's session
+    await crud.run_read(db, image_variants.sync_manifests)
+    headers = {"ETag": catalog_version.etag_for(version), "Cache-Control": "no-cache"}
+    if updated_at is not None:
+        headers["Last-Modified"] = catalog_version.http_date(updated_at)
+    if catalog_version.is_not_modified(
+        request.headers.get("if-none-match"),
+        request.headers.get("if-modified-since"),
+        headers["ETag"],
+        updated_at,
+    ) and (exists is None or await crud.run_read(db, exists)):
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+
+def catalog_json(body: bytes, response: Response):
+    """Serve pre-encoded catalog JSON, keeping the validators set by catalog_conditional"""
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
+
 # Auth Routes
 @app.post("/api/auth/register", response_model=schemas.UserResponse)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(crud.get_user_by_email, db, email=user.email)
     if db_user:
         raise HTTPException(
             status_code=400,
             detail="המייל כבר רשום במערכת"
         )
-    return crud.create_user(db=db, user=user)
+    # bcrypt runs on the password pool, not on the threadpool shared with catalog reads
+    hashed_password = await auth.hash_password(user.password)
+    return await run_in_threadpool(crud.create_user, db=db, user=user, hashed_password=hashed_password)
 
 @app.post("/api/auth/login")
-def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
-    db_user = auth.authenticate_user(db, user.email, user.password)
+async def login(user: schemas.UserLogin, request: Request, db: Session = Depends(get_db)):
+    # Throttle before the users query and the bcrypt verify
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = await rate_limit.login_limiter.check(client_ip, user.email)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="יותר מדי ניסיונות התחברות, נסו שוב מאוחר יותר",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    db_user = await auth.authenticate(db, user.email, user.password)
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="מייל או סיסמה שגויים",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = auth.create_access_token(data={"sub": db_user.email})
+    access_token = auth.create_user_token(db_user)
     return {"access_token": access_token, "token_type": "bearer", "user": schemas.UserResponse.from_orm(db_user)}
 
 @app.get("/api/auth/me", response_model=schemas.UserResponse)
 def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
-# Category Routes
-@app.get("/api/categories", response_model=List[schemas.CategoryResponse])
-def read_categories(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    categories = crud.get_categories(db, skip=skip, limit=limit)
-    return categories
+@app.post("/api/auth/logout-all")
+def logout_all(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Revoke every token of the current user, including the one used for this request"""
+    crud.revoke_user_tokens(db, current_user.id)
+    return {"message": "כל ההתחברויות בוטלו"}
 
-@app.get("/api/categories/{category_id}", response_model=schemas.CategoryResponse)
-def read_category(category_id: int, db: Session = Depends(get_db)):
-    db_category = crud.get_category(db, category_id=category_id)
+# Category Routes
+@app.get("/api/categories", response_model=List[schemas.CategoryResponse], dependencies=[Depends(catalog_conditional)])
+async def read_categories(response: Response, skip: int = 0, limit: int = 100, db: CatalogSession = Depends(get_catalog_db)):
+    categories = await crud.run_read(db, catalog_snapshot.categories_json, skip=skip, limit=limit)
+    return catalog_json(categories, response)
+
+@app.get("/api/categories/{category_id}", response_model=schemas.CategoryResponse, dependencies=[Depends(category_conditional)])
+async def read_category(category_id: int, db: CatalogSession = Depends(get_catalog_db)):
+    db_category = await crud.run_read(db, crud.get_category, category_id=category_id)
     if not db_category:
         raise HTTPException(status_code=404, detail="קטגוריה לא נמצאה")
     return db_category
@@ -132,40 +248,125 @@ def delete_category(
     return {"message": "קטגוריה נמחקה בהצלחה"}
 
 # Product Routes
-@app.get("/api/products", response_model=List[schemas.ProductResponse])
-def read_products(
-    skip: int = 0, 
-    limit: int = 100, 
+@app.get("/api/products", response_model=Union[List[schemas.ProductResponse], schemas.ProductPage], dependencies=[Depends(catalog_conditional)])
+async def read_products(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
     category_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    sort: Literal["newest", "price"] = "newest",
+    db: CatalogSession = Depends(get_catalog_db)
 ):
-    products = crud.get_products(db, skip=skip, limit=limit, category_id=category_id)
-    return products
+    """List products.
+
+    Without `cursor` this is the legacy skip/limit listing returning a plain list.
+    Passing `cursor` (empty for the first page) switches to keyset pagination and
+    returns {"items": [...], "next_cursor": ...}.
+    """
+    if cursor is None:
+        products = await crud.run_read(
+            db, catalog_snapshot.products_json, skip=skip, limit=limit, category_id=category_id
+        )
+        return catalog_json(products, response)
+    try:
+        page = await crud.run_read(
+            db, catalog_snapshot.products_page_json, cursor=cursor, limit=limit, category_id=category_id, sort=sort
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="סמן עימוד לא תקין")
+    return catalog_json(page, response)
 
-@app.get("/api/products/featured", response_model=List[schemas.ProductResponse])
-def read_featured_products(
+@app.get("/api/products/featured", response_model=List[schemas.ProductResponse], dependencies=[Depends(catalog_conditional)])
+async def read_featured_products(
+    response: Response,
     limit: int = 6,
-    db: Session = Depends(get_db)
+    db: CatalogSession = Depends(get_catalog_db)
 ):
     """Get featured products marked by admins"""
-    featured_products = crud.get_featured_products(db, limit=limit)
-    return featured_products
+    featured_products = await crud.run_read(db, catalog_snapshot.featured_products_json, limit=limit)
+    return catalog_json(featured_products, response)
 
-@app.get("/api/products/discounted", response_model=List[schemas.ProductResponse])
-def read_discounted_products(
+@app.get("/api/products/discounted", response_model=List[schemas.ProductResponse], dependencies=[Depends(catalog_conditional)])
+async def read_discounted_products(
+    response: Response,
     limit: int = 6,
-    db: Session = Depends(get_db)
+    db: CatalogSession = Depends(get_catalog_db)
 ):
     """Get products with discounts"""
-    discounted_products = crud.get_discounted_products(db, limit=limit)
-    return discounted_products
+    discounted_products = await crud.run_read(db, catalog_snapshot.discounted_products_json, limit=limit)
+    return catalog_json(discounted_products, response)
 
-@app.get("/api/products/{product_id}", response_model=schemas.ProductResponse)
-def read_product(product_id: int, db: Session = Depends(get_db)):
-    db_product = crud.get_product(db, product_id=product_id)
+def search_filters(
+    q: Optional[str] = Query(None, max_length=200),
+    category_id: Optional[int] = None,
+    shape: List[str] = Query([]),
+    color: List[str] = Query([]),
+    clarity: List[str] = Query([]),
+    cut: List[str] = Query([]),
+    color_min: Optional[str] = None,
+    color_max: Optional[str] = None,
+    clarity_min: Optional[str] = None,
+    clarity_max: Optional[str] = None,
+    cut_min: Optional[str] = None,
+    cut_max: Optional[str] = None,
+    carat_min: Optional[float] = None,
+    carat_max: Optional[float] = None,
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+):
+    """Catalog search filters shared by /api/products/search and /api/products/facets.
+
+    `q` matches name, description, category and certificate number, each word as a
+    prefix (type-ahead). Set filters repeat the parameter (?shape=Round&shape=Oval).
+    Grade bounds are inclusive along the grade scale, best first: color_min=D&color_max=G.
+    """
+    try:
+        return crud.normalize_search_filters(
+            q=q, category_id=category_id, shapes=shape, colors=color, clarities=clarity, cuts=cut,
+            color_min=color_min, color_max=color_max, clarity_min=clarity_min, clarity_max=clarity_max,
+            cut_min=cut_min, cut_max=cut_max, carat_min=carat_min, carat_max=carat_max,
+            price_min=price_min, price_max=price_max,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="דרגת יהלום לא מוכרת")
+
+@app.get("/api/products/search", response_model=List[schemas.ProductResponse], dependencies=[Depends(catalog_conditional)])
+async def search_products(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(24, ge=1, le=100),
+    sort: Optional[Literal[tuple(crud.PRODUCT_SEARCH_SORTS)]] = None,
+    filters: dict = Depends(search_filters),
+    db: CatalogSession = Depends(get_catalog_db)
+):
+    """Search the catalog by text and/or the 4C attributes (filters: see search_filters).
+
+    Without `sort`, text searches rank by relevance and the rest by newest.
+    """
+    products = await crud.run_read(
+        db, catalog_snapshot.search_products_json, skip=skip, limit=limit, sort=sort, **filters
+    )
+    return catalog_json(products, response)
+
+@app.get("/api/products/facets", response_model=schemas.ProductFacets, dependencies=[Depends(catalog_conditional)])
+async def read_product_facets(
+    response: Response,
+    filters: dict = Depends(search_filters),
+    db: CatalogSession = Depends(get_catalog_db)
+):
+    """Counts per category, shape, color, clarity and price range for the current filters.
+
+    Each facet ignores its own selection, so alternatives to the chosen value keep their counts.
+    """
+    return catalog_json(await crud.run_read(db, facets.product_facets_json, **filters), response)
+
+@app.get("/api/products/{product_id}", response_model=schemas.ProductResponse, dependencies=[Depends(product_conditional)])
+async def read_product(product_id: int, response: Response, db: CatalogSession = Depends(get_catalog_db)):
+    db_product = await crud.run_read(db, catalog_snapshot.product_json, product_id=product_id)
     if not db_product:
         raise HTTPException(status_code=404, detail="מוצר לא נמצא")
-    return db_product
+    return catalog_json(db_product, response)
 
 @app.post("/api/products", response_model=schemas.ProductResponse)
 def create_product(
@@ -231,7 +432,7 @@ def add_product_image(
 @app.get("/api/products/{product_id}/images", response_model=List[schemas.ProductImageResponse])
 def get_product_images(
     product_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     return crud.get_product_images(db, product_id=product_id)
 
@@ -267,7 +468,7 @@ def create_product_variant(
 @app.get("/api/products/{product_id}/variants", response_model=List[schemas.ProductVariantResponse])
 def get_product_variants(
     product_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     return crud.get_product_variants(db, product_id=product_id)
 
@@ -306,7 +507,7 @@ def delete_product_variant(
 def get_carat_pricing(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all active carat pricing configurations"""
     return crud.get_carat_pricing(db, skip=skip, limit=limit)
@@ -314,7 +515,7 @@ def get_carat_pricing(
 @app.get("/api/carat-pricing/{carat_weight}", response_model=schemas.CaratPricingResponse)
 def get_carat_pricing_by_weight(
     carat_weight: float,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get specific carat pricing by weight"""
     carat_pricing = crud.get_carat_pricing_by_weight(db, carat_weight=carat_weight)
@@ -363,7 +564,7 @@ def delete_carat_pricing(
 @app.get("/api/products/{product_id}/carats", response_model=List[schemas.ProductCaratAvailabilityResponse])
 def get_product_available_carats(
     product_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all available carat weights for a product"""
     # Verify product exists
@@ -447,7 +648,7 @@ def set_default_carat_for_product(
 def calculate_product_price(
     product_id: int,
     carat_weight: float,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Calculate price for a specific product and carat weight"""
     # Verify product exists
@@ -457,9 +658,8 @@ def calculate_product_price(
     
     # Verify carat is available for this product
     available_carats = crud.get_product_available_carats(db, product_id=product_id)
-    available_carat_weights = [carat.carat_weight for carat in available_carats]
     
-    if carat_weight not in available_carat_weights:
+    if not any(carat_pricing.weights_match(carat.carat_weight, carat_weight) for carat in available_carats):
         raise HTTPException(status_code=400, detail="משקל קראט זה אינו זמין למוצר זה")
     
     price_calculation = crud.calculate_price_for_carat(
@@ -471,75 +671,155 @@ def calculate_product_price(
     
     return schemas.PriceCalculationResponse(**price_calculation)
 
+@app.post("/api/prices/matrix", response_model=List[schemas.ProductPriceMatrix])
+def calculate_price_matrix(request: schemas.PriceMatrixRequest, db: Session = Depends(get_read_db)):
+    """Prices for every available carat of many products in one call"""
+    return crud.get_price_matrix(db, product_ids=request.product_ids)
+
+# Admin Cache Routes
+@app.get("/api/admin/cache/stats")
+def get_cache_stats(current_user: models.User = Depends(get_current_admin_user)):
+    """Catalog cache hit/miss counters (admin only)"""
+    return {**cache.catalog_cache.stats(), "snapshot": cache.product_json.stats()}
+
+@app.get("/api/admin/db/pool")
+def get_pool_stats(current_user: models.User = Depends(get_current_admin_user)):
+    """Connection pool occupancy, checkout wait and overflow per engine (admin only)"""
+    return database.pool_stats()
+
+@app.get("/api/admin/auth/password-pool")
+def get_password_pool_stats(current_user: models.User = Depends(get_current_admin_user)):
+    """Password hashing pool queue depth, wait times and rejections (admin only)"""
+    return password_hashing.password_pool.stats()
+
+@app.get("/api/admin/auth/login-limiter")
+def get_login_limiter_stats(current_user: models.User = Depends(get_current_admin_user)):
+    """Login throttle rejections per rule and backend errors (admin only)"""
+    return rate_limit.login_limiter.stats()
+
+@app.get("/api/admin/images/processing")
+def get_image_processing_stats(current_user: models.User = Depends(get_current_admin_user)):
+    """Image rendition jobs submitted, completed and failed (admin only)"""
+    return image_variants.processor.stats()
+
+@app.post("/api/admin/uploads/gc")
+def collect_upload_garbage(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_admin_user)):
+    """Delete stored uploads that no product, variant or category references (admin only)"""
+    removed = uploads.collect_garbage(db, uploads_dir)
+    return {"removed": removed, "count": len(removed)}
+
+@app.post("/api/admin/users/{user_id}/revoke-tokens")
+def revoke_user_tokens(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_admin_user)):
+    """Sign a user out everywhere (admin only)"""
+    if crud.revoke_user_tokens(db, user_id) is None:
+        raise HTTPException(status_code=404, detail="משתמש לא נמצא")
+    return {"message": "ההתחברויות של המשתמש בוטלו"}
+
+@app.post("/api/admin/cache/clear")
+def clear_cache(current_user: models.User = Depends(get_current_admin_user)):
+    """Drop every cached catalog response (admin only)"""
+    cache.clear()
+    return {"message": "המטמון נוקה בהצלחה"}
+
+@app.on_event("startup")
+def load_image_manifests():
+    """Load the srcset index before any response is serialized"""
+    db = SessionLocal()
+    try:
+        image_variants.sync_manifests(db)
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def warm_catalog_snapshot():
+    """Encode the catalog once at boot so the first visitors hit the snapshot"""
+    if not config('CATALOG_SNAPSHOT_WARM', default=True, cast=bool):
+        return
+    db = SessionLocal()
+    try:
+        catalog_snapshot.warm(db)
+    finally:
+        db.close()
+
+@app.on_event("startup")
+async def load_frontend_build():
+    """Index the React build once; with FRONTEND_BUILD_WATCH, follow rebuilds"""
+    await run_in_threadpool(build_index.frontend_build.load)
+    if build_index.FRONTEND_BUILD_WATCH:
+        app.state.frontend_build_watcher = asyncio.create_task(build_index.frontend_build.watch())
+
+@app.on_event("startup")
+async def start_upload_gc():
+    """Sweep unreferenced uploads every UPLOAD_GC_INTERVAL_SECONDS (0 disables it)"""
+    if uploads.UPLOAD_GC_INTERVAL_SECONDS > 0:
+        app.state.upload_gc = asyncio.create_task(uploads.collect_garbage_periodically(uploads_dir))
+
+@app.on_event("shutdown")
+async def stop_upload_gc():
+    sweeper = getattr(app.state, "upload_gc", None)
+    if sweeper is not None:
+        sweeper.cancel()
+
+@app.on_event("shutdown")
+async def stop_frontend_build_watcher():
+    watcher = getattr(app.state, "frontend_build_watcher", None)
+    if watcher is not None:
+        watcher.cancel()
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await database.dispose_async_engine()
+
+@app.on_event("shutdown")
+def stop_image_processor():
+    image_variants.processor.shutdown()
+
 @app.post("/api/upload")
 async def upload_file(
     file: UploadFile = File(...),
     current_user: models.User = Depends(get_current_admin_user)
 ):
-    # Validate file type
-    allowed_types = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
-    if file.content_type not in allowed_types:
-        raise HTTPException(status_code=400, detail="סוג קובץ לא נתמך. יש להעלות תמונות בלבד")
-    
-    # Check file size (5MB limit)
-    max_size = 5 * 1024 * 1024  # 5MB
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
-    
-    if file_size > max_size:
-        raise HTTPException(status_code=400, detail="קובץ גדול מדי. מקסימום 5MB")
-    
-    if file_size == 0:
-        raise HTTPException(status_code=400, detail="קובץ ריק")
-    
-    # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = uploads_dir / unique_filename
-    
-    try:
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Return file URL
-    file_url = f"/uploads/{unique_filename}"
-    return {"url": file_url, "filename": unique_filename}
-    except Exception as e:
-        # Clean up file if it was created
-        if file_path.exists():
-            os.remove(file_path)
-        raise HTTPException(status_code=500, detail=f"שגיאה בשמירת הקובץ: {str(e)}")
+    saved = await uploads.save_upload(file, uploads_dir)
+    # WebP renditions are generated in the background; srcsets appear once they are recorded
+    image_variants.process_upload(uploads_dir, saved)
+    return saved
+
+@app.post("/api/upload/batch")
+async def upload_files(
+    files: List[UploadFile] = File(...),
+    current_user: models.User = Depends(get_current_admin_user)
+):
+    """Upload several images at once; either all of them are saved or none"""
+    saved = await uploads.save_uploads(files, uploads_dir)
+    for entry in saved:
+        image_variants.process_upload(uploads_dir, entry)
+    return {"files": saved}
 
 # Route to serve React build files (images, favicon, etc.) from root path
 @app.get("/{filename}")
-async def serve_build_files(filename: str):
+async def serve_build_files(filename: str, request: Request):
     """Serve React build files like Background-White.png, favicon.ico, etc."""
     # Only serve specific file types to avoid conflicts
     allowed_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webp', '.json', '.xml', '.txt'}
     file_extension = os.path.splitext(filename)[1].lower()
     
     if file_extension in allowed_extensions:
-        frontend_build_dir = Path("../frontend/build")
-        file_path = frontend_build_dir / filename
-        
-        if file_path.exists() and file_path.is_file():
-            return FileResponse(file_path)
+        build_file = build_index.frontend_build.get(filename)
+        if build_file is not None:
+            return build_file.response(request.headers)
     
     # If not a build file, fall through to the catch-all route
     raise HTTPException(status_code=404, detail="File not found")
 
 # Catch-all route to serve React app (must be last!)
 @app.get("/{path:path}")
-async def serve_react_app(path: str):
+async def serve_react_app(path: str, request: Request):
     """Serve React app for all non-API routes"""
-    # For admin and any other React routes, serve index.html
-    frontend_build_dir = Path("../frontend/build")
-    index_file = frontend_build_dir / "index.html"
+    # For admin and any other React routes, serve index.html from the in-memory build index
+    index_file = build_index.frontend_build.get("index.html")
     
-    if index_file.exists():
-        return FileResponse(index_file)
+    if index_file is not None:
+        return index_file.response(request.headers)
     else:
         raise HTTPException(status_code=404, detail="Frontend not found")
 
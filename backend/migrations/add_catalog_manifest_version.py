@@ -0,0 +1,35 @@
+"""Add manifest_version to catalog_state
+
+Commits that only record image renditions bump it along with version, so
+other workers can refresh their srcsets instead of clearing their caches.
+"""
+
+from sqlalchemy import text
+
+def upgrade(connection):
+    """Add the manifest_version column"""
+    if connection.dialect.name == "sqlite":
+        # SQLite has no ADD COLUMN IF NOT EXISTS
+        existing = {row[1] for row in connection.execute(text("PRAGMA table_info(catalog_state)"))}
+        if existing and "manifest_version" not in existing:
+            connection.execute(text("ALTER TABLE catalog_state ADD COLUMN manifest_version INTEGER NOT NULL DEFAULT 0"))
+    else:
+        connection.execute(text("ALTER TABLE catalog_state ADD COLUMN IF NOT EXISTS manifest_version INTEGER NOT NULL DEFAULT 0"))
+
+def downgrade(connection):
+    """Remove the manifest_version column"""
+    connection.execute(text("ALTER TABLE catalog_state DROP COLUMN manifest_version"))
+
+if __name__ == "__main__":
+    # Auto-run migration when script is executed directly
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from database import engine
+
+    with engine.connect() as connection:
+        with connection.begin():
+            print("Running migration: Add catalog manifest version...")
+            upgrade(connection)
+            print("Migration completed successfully!")
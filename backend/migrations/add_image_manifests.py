@@ -0,0 +1,41 @@
+"""Add image_manifests table
+
+One row per uploaded image listing the resized WebP renditions generated for it.
+"""
+
+from sqlalchemy import text
+
+def upgrade(connection):
+    """Add image_manifests table"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS image_manifests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            original_url VARCHAR NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            variants JSON NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+    connection.execute(text("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_image_manifests_original_url ON image_manifests (original_url)
+    """))
+
+def downgrade(connection):
+    """Remove image_manifests table"""
+    connection.execute(text("DROP TABLE IF EXISTS image_manifests"))
+
+if __name__ == "__main__":
+    # Auto-run migration when script is executed directly
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from database import engine
+
+    with engine.connect() as connection:
+        with connection.begin():
+            print("Running migration: Add image manifests...")
+            upgrade(connection)
+            print("Migration completed successfully!")
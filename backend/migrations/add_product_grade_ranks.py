@@ -0,0 +1,58 @@
+"""Add ordinal grade rank columns to products
+
+This migration adds color_rank / clarity_rank / cut_rank, backfills them from
+the grade strings using the scales in grades.py, and adds the composite
+indexes used by /api/products/search.
+"""
+
+from sqlalchemy import text
+
+INDEXES = {
+    "ix_products_color_clarity_cut_rank": "color_rank, clarity_rank, cut_rank",
+    "ix_products_category_color_clarity_rank": "category_id, color_rank, clarity_rank",
+    "ix_products_shape_price_id": "shape, price, id",
+    "ix_products_carat_weight_id": "carat_weight, id",
+}
+
+def upgrade(connection):
+    """Add, backfill and index grade rank columns"""
+    import grades
+
+    if connection.dialect.name == "sqlite":
+        # SQLite has no ADD COLUMN IF NOT EXISTS
+        existing = {row[1] for row in connection.execute(text("PRAGMA table_info(products)"))}
+    else:
+        existing = set()
+    for scale, scale_grades in grades.GRADE_SCALES.items():
+        if f"{scale}_rank" not in existing:
+            if_not_exists = "" if connection.dialect.name == "sqlite" else "IF NOT EXISTS "
+            connection.execute(text(f"ALTER TABLE products ADD COLUMN {if_not_exists}{scale}_rank INTEGER"))
+        cases = " ".join(f"WHEN '{grade.upper()}' THEN {rank}" for rank, grade in enumerate(scale_grades))
+        connection.execute(text(
+            f"UPDATE products SET {scale}_rank = CASE UPPER(TRIM({scale}_grade)) {cases} ELSE NULL END"
+        ))
+    for name, columns in INDEXES.items():
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON products ({columns})"))
+
+def downgrade(connection):
+    """Remove grade rank columns"""
+    import grades
+
+    for name in INDEXES:
+        connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for scale in grades.GRADE_SCALES:
+        connection.execute(text(f"ALTER TABLE products DROP COLUMN {scale}_rank"))
+
+if __name__ == "__main__":
+    # Auto-run migration when script is executed directly
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from database import engine
+
+    with engine.connect() as connection:
+        with connection.begin():
+            print("Running migration: Add product grade ranks...")
+            upgrade(connection)
+            print("Migration completed successfully!")
@@ -0,0 +1,38 @@
+"""Add keyset pagination indexes to products
+
+This migration adds the composite (sort key, id) indexes used by cursor
+pagination on /api/products.
+"""
+
+from sqlalchemy import text
+
+INDEXES = {
+    "ix_products_created_at_id": "created_at, id",
+    "ix_products_price_id": "price, id",
+    "ix_products_category_created_at_id": "category_id, created_at, id",
+    "ix_products_category_price_id": "category_id, price, id",
+}
+
+def upgrade(connection):
+    """Add keyset pagination indexes"""
+    for name, columns in INDEXES.items():
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON products ({columns})"))
+
+def downgrade(connection):
+    """Remove keyset pagination indexes"""
+    for name in INDEXES:
+        connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+if __name__ == "__main__":
+    # Auto-run migration when script is executed directly
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from database import engine
+
+    with engine.connect() as connection:
+        with connection.begin():
+            print("Running migration: Add keyset pagination indexes...")
+            upgrade(connection)
+            print("Migration completed successfully!")
@@ -0,0 +1,45 @@
+"""Add min_final_price / max_final_price to products
+
+This migration adds the denormalized price range columns with their indexes
+and backfills every product with one set-based UPDATE.
+"""
+
+from sqlalchemy import text
+
+COLUMNS = ("min_final_price", "max_final_price")
+
+def upgrade(connection):
+    """Add and backfill price range columns"""
+    import price_range
+
+    if connection.dialect.name == "sqlite":
+        # SQLite has no ADD COLUMN IF NOT EXISTS
+        existing = {row[1] for row in connection.execute(text("PRAGMA table_info(products)"))}
+        add_columns = [f"ADD COLUMN {column} FLOAT" for column in COLUMNS if column not in existing]
+    else:
+        add_columns = [f"ADD COLUMN IF NOT EXISTS {column} FLOAT" for column in COLUMNS]
+    for add_column in add_columns:
+        connection.execute(text(f"ALTER TABLE products {add_column}"))
+    for column in COLUMNS:
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_products_{column} ON products ({column})"))
+    connection.execute(price_range.refresh_statement())
+
+def downgrade(connection):
+    """Remove price range columns"""
+    for column in COLUMNS:
+        connection.execute(text(f"DROP INDEX IF EXISTS ix_products_{column}"))
+        connection.execute(text(f"ALTER TABLE products DROP COLUMN {column}"))
+
+if __name__ == "__main__":
+    # Auto-run migration when script is executed directly
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from database import engine
+
+    with engine.connect() as connection:
+        with connection.begin():
+            print("Running migration: Add product price range columns...")
+            upgrade(connection)
+            print("Migration completed successfully!")
@@ -0,0 +1,35 @@
+"""Add token_version to users
+
+Access tokens carry the user's token_version; bumping it revokes every token
+issued before. Existing users start at 0.
+"""
+
+from sqlalchemy import text
+
+def upgrade(connection):
+    """Add the token_version column"""
+    if connection.dialect.name == "sqlite":
+        # SQLite has no ADD COLUMN IF NOT EXISTS
+        existing = {row[1] for row in connection.execute(text("PRAGMA table_info(users)"))}
+        if "token_version" not in existing:
+            connection.execute(text("ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"))
+    else:
+        connection.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0"))
+
+def downgrade(connection):
+    """Remove the token_version column"""
+    connection.execute(text("ALTER TABLE users DROP COLUMN token_version"))
+
+if __name__ == "__main__":
+    # Auto-run migration when script is executed directly
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from database import engine
+
+    with engine.connect() as connection:
+        with connection.begin():
+            print("Running migration: Add user token version...")
+            upgrade(connection)
+            print("Migration completed successfully!")
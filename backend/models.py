@@ -1,7 +1,8 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, Text, DateTime, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, Text, DateTime, JSON, Index
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 from database import Base
+import grades
 
 class User(Base):
     __tablename__ = "users"
@@ -14,6 +15,8 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False)
+    # Part of every access token; bumping it revokes the user's outstanding tokens
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class Category(Base):
@@ -39,6 +42,14 @@ class CaratPricing(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+class CatalogState(Base):
+    __tablename__ = "catalog_state"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)  # Bumped by every catalog write
+    manifest_version = Column(Integer, nullable=False, default=0)  # Also bumped by commits that only write image manifests
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class Product(Base):
     __tablename__ = "products"
 
@@ -53,11 +64,18 @@ class Product(Base):
     clarity_grade = Column(String, nullable=True)  # FL, IF, VVS1, VVS2, VS1, VS2, SI1, SI2
     cut_grade = Column(String, nullable=True)  # Excellent, Very Good, Good, Fair, Poor
     shape = Column(String, nullable=True)  # Round, Princess, Emerald, etc.
+    # Ordinal grade ranks (0 = best, see grades.py), kept in sync by the validators below
+    color_rank = Column(Integer, nullable=True)
+    clarity_rank = Column(Integer, nullable=True)
+    cut_rank = Column(Integer, nullable=True)
     certificate_number = Column(String, nullable=True)
     is_available = Column(Boolean, default=True)
     is_featured = Column(Boolean, default=False)
     discount_percentage = Column(Float, default=0.0)  # Discount percentage (0-100)
     category_id = Column(Integer, ForeignKey("categories.id"))
+    # Final price range across available carats, maintained by price_range.py
+    min_final_price = Column(Float, nullable=True, index=True)
+    max_final_price = Column(Float, nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     category = relationship("Category", back_populates="products")
@@ -65,6 +83,25 @@ class Product(Base):
     variants = relationship("ProductVariant", back_populates="product", cascade="all, delete-orphan")
     available_carats = relationship("ProductCaratAvailability", back_populates="product", cascade="all, delete-orphan")
 
+    # Keyset pagination indexes, matching the (sort key, id) cursor order
+    __table_args__ = (
+        Index("ix_products_created_at_id", "created_at", "id"),
+        Index("ix_products_price_id", "price", "id"),
+        Index("ix_products_category_created_at_id", "category_id", "created_at", "id"),
+        Index("ix_products_category_price_id", "category_id", "price", "id"),
+        # Catalog search: grade ranges, shape and carat filters
+        Index("ix_products_color_clarity_cut_rank", "color_rank", "clarity_rank", "cut_rank"),
+        Index("ix_products_category_color_clarity_rank", "category_id", "color_rank", "clarity_rank"),
+        Index("ix_products_shape_price_id", "shape", "price", "id"),
+        Index("ix_products_carat_weight_id", "carat_weight", "id"),
+    )
+
+    @validates("color_grade", "clarity_grade", "cut_grade")
+    def _rank_grade(self, key, value):
+        scale = key.removesuffix("_grade")
+        setattr(self, f"{scale}_rank", grades.rank(scale, value))
+        return value
+
 class ProductCaratAvailability(Base):
     __tablename__ = "product_carat_availability"
 
@@ -103,4 +140,15 @@ class ProductVariant(Base):
     sort_order = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    product = relationship("Product", back_populates="variants") 
\ No newline at end of file
+    product = relationship("Product", back_populates="variants")
+
+class ImageManifest(Base):
+    """Resized WebP renditions generated for an uploaded image (see image_variants.py)"""
+    __tablename__ = "image_manifests"
+
+    id = Column(Integer, primary_key=True, index=True)
+    original_url = Column(String, nullable=False, unique=True, index=True)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    variants = Column(JSON, nullable=False)  # [{"width": 320, "url": "/uploads/derived/...-320.webp"}, ...]
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
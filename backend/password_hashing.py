@@ -0,0 +1,111 @@
+"""Dedicated worker pool for password hashing and verification
+
+bcrypt (and the legacy pbkdf2 fallback) burns hundreds of milliseconds of CPU
+per call. Run on the shared threadpool that also serves sync routes, a burst
+of logins occupies every thread and catalog reads queue behind it, so login
+and register hand their password work to this small executor instead.
+
+The pool is bounded: with PASSWORD_HASH_WORKERS jobs running and
+PASSWORD_HASH_MAX_QUEUE more waiting, submit() refuses new jobs with
+PoolSaturated (the routes answer 429) rather than letting the queue and the
+response times grow without limit.
+
+stats() is served on /api/admin/auth/password-pool.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config
+
+PASSWORD_HASH_WORKERS = config('PASSWORD_HASH_WORKERS', default=2, cast=int)
+PASSWORD_HASH_MAX_QUEUE = config('PASSWORD_HASH_MAX_QUEUE', default=16, cast=int)
+
+
+class PoolSaturated(Exception):
+    """Every worker is busy and the queue is full"""
+
+
+class PasswordPool:
+    """Size-limited executor with queue-depth and timing counters"""
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.pending = 0  # submitted and not finished: queued plus running
+        self.running = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.submitted = 0
+            self.completed = 0
+            self.rejected = 0
+            self.peak_queued = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.run_total = 0.0
+
+    @property
+    def queued(self):
+        return max(0, self.pending - self.running)
+
+    def submit(self, func, *args):
+        """Schedule func(*args) and return its concurrent Future, or raise PoolSaturated"""
+        with self._lock:
+            if self.pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PoolSaturated()
+            self.pending += 1
+            self.submitted += 1
+            self.peak_queued = max(self.peak_queued, self.pending - self.workers)
+        try:
+            return self._executor.submit(self._run, time.perf_counter(), func, args)
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            raise
+
+    async def run(self, func, *args):
+        """Await func(*args) on the pool without holding an event loop or threadpool thread"""
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def _run(self, submitted_at, func, args):
+        started = time.perf_counter()
+        with self._lock:
+            self.running += 1
+            self.wait_total += started - submitted_at
+            self.wait_max = max(self.wait_max, started - submitted_at)
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.pending -= 1
+                self.completed += 1
+                self.run_total += time.perf_counter() - started
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queued": max(0, self.pending - self.running),
+                "peak_queued": self.peak_queued,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "wait_ms": {
+                    "avg": 1000 * self.wait_total / self.completed if self.completed else 0.0,
+                    "max": 1000 * self.wait_max,
+                },
+                "run_ms_avg": 1000 * self.run_total / self.completed if self.completed else 0.0,
+            }
+
+
+password_pool = PasswordPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
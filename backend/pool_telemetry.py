@@ -0,0 +1,146 @@
+"""Connection pool telemetry: checkout wait, occupancy and overflow per engine
+
+Pool events count checkouts, new connections (and which of them were
+overflow connections beyond pool_size) and invalidations, and track the
+peak number of checked-out connections. Checkout wait is the time a caller
+spends inside the pool before getting a connection: waiting for a free slot
+or opening a new connection. Pools have no event for the start of a
+checkout, so engines get a pool subclass that times it (see pool_class()).
+Timeouts ("QueuePool limit ... reached") are counted there too.
+
+stats() is served on /api/admin/db/pool.
+"""
+
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+# Recent checkout waits kept for the percentiles
+WAIT_SAMPLES = 2048
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+class PoolTelemetry:
+    """Counters for one engine's pool, fed by pool events and the timed pool class"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.connects = 0
+            self.overflow_connects = 0
+            self.invalidations = 0
+            self.timeouts = 0
+            self.checked_out = 0
+            self.peak_checked_out = 0
+            self.wait_count = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self._waits = deque(maxlen=WAIT_SAMPLES)
+
+    def pool_class(self, base=QueuePool):
+        """`base` with a timed checkout that reports to this telemetry.
+
+        A subclass rather than an attribute, so pools recreated by dispose()
+        keep reporting.
+        """
+        telemetry = self
+
+        class TimedPool(base):
+            def _do_get(self):
+                started = time.perf_counter()
+                try:
+                    record = super()._do_get()
+                except exc.TimeoutError:
+                    telemetry.timed_out()
+                    raise
+                telemetry.waited(time.perf_counter() - started)
+                return record
+
+        TimedPool.__name__ = TimedPool.__qualname__ = f"Timed{base.__name__}"
+        return TimedPool
+
+    def attach(self, engine):
+        """Listen to the pool events of a sync Engine (for async engines pass .sync_engine)"""
+        self.engine = engine
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        return engine
+
+    def waited(self, seconds: float):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._waits.append(seconds)
+
+    def timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        # QueuePool counts the new connection before opening it, so a positive
+        # overflow here means this connection is beyond pool_size
+        pool = self.engine.pool if self.engine is not None else None
+        overflow = isinstance(pool, QueuePool) and pool.overflow() > 0
+        with self._lock:
+            self.connects += 1
+            if overflow:
+                self.overflow_connects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        pool = self.engine.pool if self.engine is not None else None
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                "pool": type(pool).__name__ if pool is not None else None,
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "overflow_connects": self.overflow_connects,
+                "timeouts": self.timeouts,
+                "invalidations": self.invalidations,
+                "peak_checked_out": self.peak_checked_out,
+                "wait_ms": {
+                    "avg": 1000 * self.wait_total / self.wait_count if self.wait_count else 0.0,
+                    "p50": 1000 * _percentile(waits, 0.5),
+                    "p99": 1000 * _percentile(waits, 0.99),
+                    "max": 1000 * self.wait_max,
+                },
+            }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "pool_size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "timeout_seconds": pool.timeout(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+            })
+        return stats
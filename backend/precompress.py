@@ -0,0 +1,60 @@
+"""Write precompressed .br/.gz siblings of a frontend build
+
+    python backend/precompress.py frontend/build
+
+Run after `npm run build` (the deploy scripts do) and before the build is
+served; static_files.py and build_index.py serve the siblings to clients that
+accept them. Standard library only, so it runs with any Python 3 outside the
+backend virtualenv; brotli siblings are added when the optional `brotli`
+package happens to be installed. Siblings that would not be smaller than
+their file are removed, so a stale one is never served.
+"""
+
+import gzip
+import os
+import sys
+from pathlib import Path
+
+COMPRESSIBLE = {'.js', '.css', '.html', '.svg', '.json', '.map', '.txt', '.xml', '.ico', '.webmanifest'}
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+# Smaller files are not worth a sibling
+PRECOMPRESS_MIN_SIZE = 256
+
+
+def precompress(directory: Path, min_size: int = PRECOMPRESS_MIN_SIZE):
+    """Write .gz (and, with brotli installed, .br) siblings for the compressible files under `directory`"""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    encoders = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        encoders.insert(0, (".br", lambda data: brotli.compress(data, quality=11)))
+
+    written = 0
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE:
+            continue
+        data = path.read_bytes()
+        original = path.stat()
+        for suffix, encode in encoders:
+            sibling = path.with_name(path.name + suffix)
+            encoded = encode(data) if len(data) >= min_size else None
+            if encoded is None or len(encoded) >= len(data):
+                # Not worth it: make sure no stale sibling is served instead
+                sibling.unlink(missing_ok=True)
+                continue
+            sibling.write_bytes(encoded)
+            # Same Last-Modified as the file it encodes
+            os.utime(sibling, (original.st_atime, original.st_mtime))
+            written += 1
+    return written, brotli is not None
+
+
+if __name__ == "__main__":
+    build_dir = Path(sys.argv[1] if len(sys.argv) > 1 else "../frontend/build")
+    if not build_dir.is_dir():
+        sys.exit(f"No build directory at {build_dir}")
+    written, with_brotli = precompress(build_dir)
+    print(f"Wrote {written} precompressed files under {build_dir}" + ("" if with_brotli else " (gzip only, brotli not installed)"))
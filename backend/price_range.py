@@ -0,0 +1,156 @@
+"""Denormalized "price from / price to" columns on products
+
+products.min_final_price and max_final_price hold the lowest and highest
+final price across a product's available carats. Session hooks note which
+products a transaction touched: price or discount changes, changes to the
+weight or availability of carat rows, or any CaratPricing row (which affects
+every product). Bulk query.update()/delete() on carat availability rows do
+not say which products they hit, so callers report them with
+mark_products(). Just before commit, one set-based UPDATE recomputes those
+products in SQL.
+The multiplier expression mirrors CaratPriceTable.multiplier(), so the
+columns agree with /api/products/{id}/price/{carat}.
+
+Products with no available carats get NULL in both columns.
+"""
+
+from itertools import chain
+
+from sqlalchemy import and_, event, func, inspect, select, update
+from sqlalchemy.orm import Session, aliased
+
+import carat_pricing
+import models
+
+_PRODUCTS = "price_range_products"
+_ALL = "price_range_all"
+
+# Carat availability columns that move a product's price range
+_CARAT_PRICE_COLUMNS = ("product_id", "carat_weight", "is_available")
+
+
+def multiplier_expression(carat_weight, tolerance: float = carat_pricing.CARAT_WEIGHT_TOLERANCE,
+                          interpolate: bool = carat_pricing.CARAT_PRICE_INTERPOLATION):
+    """SQL equivalent of carat_pricing.multiplier_for() for a carat weight column"""
+    pricing = aliased(models.CaratPricing)
+    active = pricing.is_active == True
+
+    def first(column, *criteria, order_by):
+        return select(column).where(active, *criteria).order_by(*order_by).limit(1) \
+            .correlate_except(pricing).scalar_subquery()
+
+    # Nearest weight by a correlated WHERE: SQLite rejects correlated columns in
+    # the ORDER BY of a subquery nested inside an aggregate
+    other = aliased(models.CaratPricing)
+    distance = select(func.min(func.abs(other.carat_weight - carat_weight))).where(
+        other.is_active == True
+    ).correlate_except(other).scalar_subquery()
+    nearest = first(
+        pricing.price_multiplier,
+        pricing.carat_weight.between(carat_weight - tolerance, carat_weight + tolerance),
+        func.abs(pricing.carat_weight - carat_weight) == distance,
+        order_by=(pricing.carat_weight,),
+    )
+    if not interpolate:
+        return func.coalesce(nearest, 1.0)
+
+    below = (pricing.carat_weight < carat_weight,)
+    above = (pricing.carat_weight > carat_weight,)
+    low_weight = first(pricing.carat_weight, *below, order_by=(pricing.carat_weight.desc(),))
+    low = first(pricing.price_multiplier, *below, order_by=(pricing.carat_weight.desc(),))
+    high_weight = first(pricing.carat_weight, *above, order_by=(pricing.carat_weight,))
+    high = first(pricing.price_multiplier, *above, order_by=(pricing.carat_weight,))
+    # NULL outside the configured range, so no extrapolation
+    interpolated = low + (high - low) * (carat_weight - low_weight) / (high_weight - low_weight)
+    return func.coalesce(nearest, interpolated, 1.0)
+
+
+def refresh_statement(product_ids=None):
+    """UPDATE recomputing the price range of the given products, or of all of them"""
+    carat = models.ProductCaratAvailability
+    final_price = (
+        models.Product.base_price
+        * multiplier_expression(carat.carat_weight)
+        * (1 - func.coalesce(models.Product.discount_percentage, 0.0) / 100.0)
+    )
+    available = and_(carat.product_id == models.Product.id, carat.is_available == True)
+
+    statement = update(models.Product).values(
+        min_final_price=select(func.min(final_price)).where(available).scalar_subquery(),
+        max_final_price=select(func.max(final_price)).where(available).scalar_subquery(),
+    )
+    if product_ids is not None:
+        statement = statement.where(models.Product.id.in_(product_ids))
+    return statement.execution_options(synchronize_session=False)
+
+
+def refresh(db: Session, product_ids=None):
+    """Recompute price ranges now (the session hooks normally do this on commit)"""
+    if product_ids is not None and not product_ids:
+        return
+    db.execute(refresh_statement(sorted(product_ids) if product_ids is not None else None))
+
+
+def mark_products(session: Session, product_ids):
+    """Recompute these products on commit, e.g. after a bulk statement on their carat rows"""
+    session.info.setdefault(_PRODUCTS, set()).update(product_ids)
+
+
+def _changed(obj, names) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in names)
+
+
+def _price_changed(product) -> bool:
+    return _changed(product, ("base_price", "discount_percentage"))
+
+
+# Session hooks: collect affected products on flush, recompute them before commit
+@event.listens_for(Session, "after_flush")
+def _track_flushed_prices(session, flush_context):
+    products = session.info.setdefault(_PRODUCTS, set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, models.CaratPricing):
+            session.info[_ALL] = True
+        elif isinstance(obj, models.ProductCaratAvailability):
+            if obj in session.dirty and not _changed(obj, _CARAT_PRICE_COLUMNS):
+                # e.g. is_default or sort_order
+                continue
+            # A row moved to another product changes both
+            products.update(
+                product_id for product_id in chain(
+                    [obj.product_id], inspect(obj).attrs.product_id.history.deleted
+                ) if product_id is not None
+            )
+        elif isinstance(obj, models.Product) and obj not in session.deleted and (
+            obj in session.new or _price_changed(obj)
+        ):
+            products.add(obj.id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_prices(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        # Every product depends on the pricing table; bulk statements on carat
+        # availability rows are reported by their callers with mark_products()
+        if mapper is not None and issubclass(mapper.class_, models.CaratPricing):
+            orm_execute_state.session.info[_ALL] = True
+
+
+# insert=True: run ahead of the catalog version hook so the UPDATE is part of the bump
+@event.listens_for(Session, "before_commit", insert=True)
+def _refresh_before_commit(session):
+    session.flush()
+    refresh_all = session.info.pop(_ALL, False)
+    products = session.info.pop(_PRODUCTS, set())
+    if refresh_all:
+        refresh(session)
+    elif products:
+        refresh(session, products)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_prices(session, previous_transaction):
+    session.info.pop(_ALL, None)
+    session.info.pop(_PRODUCTS, None)
@@ -0,0 +1,224 @@
+"""Token-bucket throttle for login attempts, keyed by client IP and by email
+
+Every login attempt costs a users query and a bcrypt verify. The limiter runs
+before either: each attempt takes one token from the bucket of its IP and one
+from the bucket of the email it targets, and is answered with 429 when a
+bucket is empty. Buckets refill continuously at `per_minute` tokens a minute
+up to `burst`, so a user retyping a password is never noticed while a single
+address, or a spray of addresses against one account, is slowed to the refill
+rate.
+
+Buckets live in a backend:
+
+- MemoryBackend (default): per process, bounded LRU of buckets. With several
+  workers each one enforces the limits on its own.
+- RedisBackend: shared by every worker. Needs only `eval` from the client, so
+  redis.Redis or any compatible client (or a fake in tests) works. When Redis
+  fails, the limiter falls back to in-process buckets instead of letting
+  every attempt through.
+
+stats() is served on /api/admin/auth/login-limiter.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from decouple import config
+from starlette.concurrency import run_in_threadpool
+
+LOGIN_RATE_LIMIT_ENABLED = config('LOGIN_RATE_LIMIT_ENABLED', default=True, cast=bool)
+LOGIN_RATE_LIMIT_IP_BURST = config('LOGIN_RATE_LIMIT_IP_BURST', default=20, cast=int)
+LOGIN_RATE_LIMIT_IP_PER_MINUTE = config('LOGIN_RATE_LIMIT_IP_PER_MINUTE', default=10, cast=float)
+LOGIN_RATE_LIMIT_EMAIL_BURST = config('LOGIN_RATE_LIMIT_EMAIL_BURST', default=5, cast=int)
+LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE = config('LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE', default=2, cast=float)
+# "memory" or "redis"
+LOGIN_RATE_LIMIT_BACKEND = config('LOGIN_RATE_LIMIT_BACKEND', default='memory')
+LOGIN_RATE_LIMIT_MAX_KEYS = config('LOGIN_RATE_LIMIT_MAX_KEYS', default=100000, cast=int)
+REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
+
+logger = logging.getLogger(__name__)
+
+
+class Rule(NamedTuple):
+    name: str
+    burst: int
+    per_minute: float
+
+    @property
+    def rate(self):
+        """Tokens per second"""
+        return self.per_minute / 60
+
+
+def take(tokens, updated, now, burst, rate):
+    """One token-bucket step: returns (allowed, tokens_left, retry_after_seconds)"""
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / rate
+
+
+class MemoryBackend:
+    """Buckets in a bounded LRU; evicting a bucket only ever refills it"""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = LOGIN_RATE_LIMIT_MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, rate):
+        with self._lock:
+            now = self.clock()
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            allowed, tokens, retry_after = take(tokens, updated, now, burst, rate)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# The same step as take(), run atomically inside Redis
+TOKEN_BUCKET_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RedisBackend:
+    """Buckets shared by all workers, one Redis hash per key expiring once full again"""
+
+    name = "redis"
+
+    def __init__(self, client, prefix: str = "login-limit:", clock=time.time):
+        self.client = client
+        self.prefix = prefix
+        self.clock = clock
+
+    def take(self, key, burst, rate):
+        allowed, retry_after = self.client.eval(
+            TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, burst, rate, self.clock()
+        )
+        if isinstance(retry_after, bytes):
+            retry_after = retry_after.decode()
+        return bool(int(allowed)), float(retry_after)
+
+
+def create_backend(name: str = LOGIN_RATE_LIMIT_BACKEND):
+    if name == "redis":
+        import redis  # optional dependency, only needed for the shared backend
+        return RedisBackend(redis.Redis.from_url(REDIS_URL))
+    return MemoryBackend()
+
+
+class LoginLimiter:
+    """Checks the IP bucket, then the email bucket, and counts what it rejects"""
+
+    def __init__(self, backend, rules, enabled: bool = True):
+        self.backend = backend
+        self.rules = {rule.name: rule for rule in rules}
+        self.enabled = enabled
+        # Used while the shared backend is failing
+        self.fallback = MemoryBackend()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero the counters and refill the in-process buckets"""
+        self.fallback.clear()
+        if isinstance(self.backend, MemoryBackend):
+            self.backend.clear()
+        with self._lock:
+            self.allowed = 0
+            self.rejected = {name: 0 for name in self.rules}
+            self.backend_errors = 0
+
+    @staticmethod
+    def key(rule_name, value):
+        # Emails are not stored in the clear in a shared backend
+        digest = hashlib.sha256(value.strip().lower().encode('utf-8')).hexdigest()[:32]
+        return f"{rule_name}:{digest}"
+
+    def _take(self, rule, value):
+        key = self.key(rule.name, value)
+        try:
+            return self.backend.take(key, rule.burst, rule.rate)
+        except Exception as error:
+            with self._lock:
+                self.backend_errors += 1
+            logger.warning("Login rate limit backend failed, using in-process buckets: %s", error)
+            return self.fallback.take(key, rule.burst, rule.rate)
+
+    def hit(self, ip: str, email: str):
+        """Record a login attempt; returns None when allowed, else seconds until the next one is"""
+        if not self.enabled:
+            return None
+        # An address that is already throttled does not drain the email's bucket too
+        for name, value in (("ip", ip), ("email", email)):
+            allowed, retry_after = self._take(self.rules[name], value)
+            if not allowed:
+                with self._lock:
+                    self.rejected[name] += 1
+                return retry_after
+        with self._lock:
+            self.allowed += 1
+        return None
+
+    async def check(self, ip: str, email: str):
+        """hit() for async routes; a network backend is called from the threadpool"""
+        if isinstance(self.backend, MemoryBackend):
+            return self.hit(ip, email)
+        return await run_in_threadpool(self.hit, ip, email)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "enabled": self.enabled,
+                "backend": self.backend.name,
+                "allowed": self.allowed,
+                "rejected": dict(self.rejected),
+                "backend_errors": self.backend_errors,
+                "rules": {name: rule._asdict() for name, rule in self.rules.items()},
+            }
+        if isinstance(self.backend, MemoryBackend):
+            stats["keys"] = len(self.backend)
+        return stats
+
+
+login_limiter = LoginLimiter(
+    create_backend() if LOGIN_RATE_LIMIT_ENABLED else MemoryBackend(),
+    [
+        Rule("ip", LOGIN_RATE_LIMIT_IP_BURST, LOGIN_RATE_LIMIT_IP_PER_MINUTE),
+        Rule("email", LOGIN_RATE_LIMIT_EMAIL_BURST, LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE),
+    ],
+    enabled=LOGIN_RATE_LIMIT_ENABLED,
+)
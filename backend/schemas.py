@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, computed_field
 from typing import Optional, List
 from datetime import datetime
+import image_srcsets
 
 # User schemas
 class UserBase(BaseModel):
@@ -25,6 +26,10 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class CurrentUser(UserResponse):
+    """Snapshot of the authenticated user kept in the auth user cache"""
+    token_version: int = 0
+
 # Category schemas
 class CategoryBase(BaseModel):
     name: str
@@ -43,6 +48,11 @@ class CategoryResponse(CategoryBase):
     is_active: bool
     created_at: datetime
 
+    @computed_field
+    @property
+    def hero_image_srcset(self) -> Optional[str]:
+        return image_srcsets.srcset(self.hero_image_url)
+
     class Config:
         from_attributes = True
 
@@ -99,6 +109,11 @@ class ProductImageResponse(ProductImageBase):
     product_id: int
     created_at: datetime
 
+    @computed_field
+    @property
+    def srcset(self) -> Optional[str]:
+        return image_srcsets.srcset(self.image_url)
+
     class Config:
         from_attributes = True
 
@@ -118,6 +133,12 @@ class ProductVariantResponse(ProductVariantBase):
     product_id: int
     created_at: datetime
 
+    @computed_field
+    @property
+    def image_srcsets(self) -> List[Optional[str]]:
+        """srcset of each entry of `images`, in the same order"""
+        return [image_srcsets.srcset(url) for url in self.images or []]
+
     class Config:
         from_attributes = True
 
@@ -152,6 +173,8 @@ class ProductResponse(ProductBase):
     is_available: bool
     is_featured: bool
     discount_percentage: float
+    min_final_price: Optional[float] = None
+    max_final_price: Optional[float] = None
     created_at: datetime
     category: Optional[CategoryResponse] = None
     images: Optional[List[ProductImageResponse]] = []
@@ -161,6 +184,10 @@ class ProductResponse(ProductBase):
     class Config:
         from_attributes = True
 
+class ProductPage(BaseModel):
+    items: List[ProductResponse]
+    next_cursor: Optional[str] = None
+
 # Price calculation response
 class PriceCalculationResponse(BaseModel):
     base_price: float
@@ -171,4 +198,34 @@ class PriceCalculationResponse(BaseModel):
     final_price: float
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class PriceMatrixRequest(BaseModel):
+    product_ids: List[int] = Field(min_length=1, max_length=500)
+
+class ProductPriceMatrix(BaseModel):
+    product_id: int
+    prices: List[PriceCalculationResponse]
+
+# Catalog facet counts
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class CategoryFacetCount(BaseModel):
+    id: int
+    name: str
+    count: int
+
+class PriceRangeCount(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+    count: int
+
+class ProductFacets(BaseModel):
+    total: int
+    categories: List[CategoryFacetCount]
+    shapes: List[FacetCount]
+    colors: List[FacetCount]
+    clarities: List[FacetCount]
+    price_ranges: List[PriceRangeCount]
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""Full-text product search over name, description, category and certificate
+
+On SQLite the index is an FTS5 virtual table keyed by product id. On
+PostgreSQL it is a side table with a weighted tsvector and a GIN index.
+Text is normalized the same way on both sides before it reaches the
+database. Niqqud and cantillation marks are stripped and final letters
+folded (ך→כ, ם→מ, ...), so "טבעת", "טַבַּעַת" and a query typed
+without final forms all match. Every query term is a prefix match, which
+serves type-ahead.
+
+crud keeps the index in sync on product and category writes. Rows written
+behind crud's back (seed scripts, raw SQL) are picked up by a bulk rebuild:
+
+    python search_index.py rebuild
+"""
+
+import re
+import unicodedata
+from typing import Iterable, List
+
+from sqlalchemy import Float, Integer, bindparam, text
+from sqlalchemy.orm import Session
+
+import cache
+import catalog_version
+import models
+
+# Hebrew points and cantillation marks (keeps maqaf, paseq and sof pasuq)
+_NIQQUD = re.compile("[\u0591-\u05bd\u05bf\u05c1\u05c2\u05c4\u05c5\u05c7]")
+_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+# Geresh/gershayim and their ASCII stand-ins inside abbreviations (צה"ל, ג'ון)
+_WORD_QUOTES = re.compile("(?<=\\w)[\u05f3\u05f4'\"](?=\\w)")
+_TOKEN = re.compile(r"\w+")
+
+
+def normalize(value) -> str:
+    """Search form of a text: no niqqud, no final letters, lower case, words only"""
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFC", str(value))
+    value = _NIQQUD.sub("", value).translate(_FINAL_LETTERS)
+    value = _WORD_QUOTES.sub("", value).lower()
+    return " ".join(_TOKEN.findall(value))
+
+
+def terms(query: str) -> List[str]:
+    return normalize(query).split()
+
+
+def _dialect(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+
+def create(connection):
+    """Create the index table if it does not exist yet"""
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS product_search ("
+            " product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,"
+            " document TSVECTOR NOT NULL)"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_product_search_document ON product_search USING GIN (document)"
+        ))
+    else:
+        # prefix='2 3' keeps short type-ahead prefixes off the full term scan
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+            " name, description, category, certificate, tokenize='unicode61', prefix='2 3')"
+        ))
+
+
+def drop(connection):
+    connection.execute(text("DROP TABLE IF EXISTS product_search"))
+
+
+def _documents(db: Session, product_ids: Iterable[int] = None):
+    query = db.query(
+        models.Product.id, models.Product.name, models.Product.description,
+        models.Product.certificate_number, models.Category.name.label("category"),
+    ).outerjoin(models.Category, models.Category.id == models.Product.category_id)
+    if product_ids is not None:
+        query = query.filter(models.Product.id.in_(product_ids))
+    return [
+        {
+            "id": row.id,
+            "name": normalize(row.name),
+            "description": normalize(row.description),
+            "category": normalize(row.category),
+            "certificate": normalize(row.certificate_number),
+        }
+        for row in query
+    ]
+
+
+def remove_products(db: Session, product_ids: Iterable[int]):
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    column = "product_id" if _dialect(db) == "postgresql" else "rowid"
+    db.execute(
+        text(f"DELETE FROM product_search WHERE {column} IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"ids": product_ids},
+    )
+
+
+def index_products(db: Session, product_ids: Iterable[int]):
+    """(Re)index the given products inside the caller's transaction"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    documents = _documents(db, product_ids)
+    remove_products(db, product_ids)
+    _insert(db, documents)
+
+
+def _insert(db: Session, documents):
+    if not documents:
+        return
+    if _dialect(db) == "postgresql":
+        db.execute(text(
+            "INSERT INTO product_search (product_id, document) VALUES (:id,"
+            " setweight(to_tsvector('simple', :name), 'A') ||"
+            " setweight(to_tsvector('simple', :certificate), 'A') ||"
+            " setweight(to_tsvector('simple', :category), 'B') ||"
+            " setweight(to_tsvector('simple', :description), 'C'))"
+        ), documents)
+    else:
+        db.execute(text(
+            "INSERT INTO product_search (rowid, name, description, category, certificate)"
+            " VALUES (:id, :name, :description, :category, :certificate)"
+        ), documents)
+
+
+def index_category(db: Session, category_id: int):
+    """Reindex a category's products after its name changed"""
+    product_ids = [row.id for row in db.query(models.Product.id).filter(models.Product.category_id == category_id)]
+    index_products(db, product_ids)
+
+
+def rebuild(db: Session, batch_size: int = 1000) -> int:
+    """Drop and repopulate the whole index; returns the number of products indexed"""
+    connection = db.connection()
+    drop(connection)
+    create(connection)
+    product_ids = [row.id for row in db.query(models.Product.id).order_by(models.Product.id)]
+    for start in range(0, len(product_ids), batch_size):
+        _insert(db, _documents(db, product_ids[start:start + batch_size]))
+    # Search results are cached like other catalog lists; make every worker drop them
+    catalog_version.mark_changed(db)
+    db.commit()
+    cache.invalidate_product()
+    return len(product_ids)
+
+
+def matches(db: Session, query: str):
+    """Subquery of (product_id, score) for products matching every query term as a prefix.
+
+    Lower scores rank higher. Returns None when the query has no searchable terms.
+    """
+    query_terms = terms(query)
+    if not query_terms:
+        return None
+    if _dialect(db) == "postgresql":
+        statement = text(
+            "SELECT product_id, -ts_rank(document, to_tsquery('simple', :terms)) AS score"
+            " FROM product_search WHERE document @@ to_tsquery('simple', :terms)"
+        ).bindparams(terms=" & ".join(f"{term}:*" for term in query_terms))
+    else:
+        # Column weights follow the PostgreSQL A/B/C split: name, description, category, certificate
+        statement = text(
+            "SELECT rowid AS product_id, bm25(product_search, 10.0, 1.0, 4.0, 10.0) AS score"
+            " FROM product_search WHERE product_search MATCH :terms"
+        ).bindparams(terms=" ".join(f'"{term}"*' for term in query_terms))
+    return statement.columns(product_id=Integer, score=Float).subquery("search_matches")
+
+
+def main():
+    import argparse
+
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Product full-text search index")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print("🔎 Rebuilding product search index...")
+        count = rebuild(db, batch_size=args.batch_size)
+        print(f"✅ Indexed {count} products")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
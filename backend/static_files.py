@@ -0,0 +1,184 @@
+"""Static mounts with long-lived caching, precompressed siblings and range requests
+
+CachedStaticFiles is a StaticFiles that:
+
+- sends `Cache-Control: public, max-age=31536000, immutable` for paths matching
+  its `immutable` pattern (fingerprinted build files, content-addressed
+  uploads), so repeat visitors do not even revalidate them;
+- serves `<file>.br` / `<file>.gz` with Content-Encoding when the client
+  accepts it and the sibling is at least as new as the file. The siblings
+  are written at deploy time by precompress.py; nothing is compressed per
+  request;
+- answers single `Range: bytes=...` requests with 206 Partial Content, so
+  large media can be seeked and resumed.
+"""
+
+import os
+import re
+import stat
+from mimetypes import guess_type
+from typing import Optional
+
+import anyio
+from decouple import config
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from precompress import COMPRESSIBLE, ENCODINGS
+
+STATIC_PRECOMPRESSED = config('STATIC_PRECOMPRESSED', default=True, cast=bool)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Create React App names build output main.1a2b3c4d.js, 787.1a2b3c4d.chunk.js, logo.1a2b3c4d.svg
+FINGERPRINTED = re.compile(r"(?:^|/)[^/]+\.[0-9a-f]{8,}(?:\.chunk)?\.\w+(?:\.map)?$")
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> set:
+    """Codings an Accept-Encoding header allows (q > 0)"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def byte_range(header: Optional[str], size: int):
+    """(start, end) of a single satisfiable byte range; None to send the whole file; False if unsatisfiable"""
+    match = _RANGE.match((header or "").strip())
+    if not match or match.group(1) == match.group(2) == "":
+        # Absent, malformed or multiple ranges: a full response is always allowed
+        return None
+    first, last = match.groups()
+    if first == "":
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+class FileRangeResponse(FileResponse):
+    """206 response with bytes start..end (inclusive) of a file"""
+
+    def __init__(self, path, start: int, end: int, stat_result: os.stat_result, headers=None, media_type=None):
+        self.start, self.end = start, end
+        super().__init__(
+            path,
+            status_code=206,
+            headers={
+                **(headers or {}),
+                "content-length": str(end - start + 1),
+                "content-range": f"bytes {start}-{end}/{stat_result.st_size}",
+            },
+            media_type=media_type,
+            stat_result=stat_result,
+        )
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": bool(remaining)})
+        if remaining:
+            # The file shrank under us; end the body so the client sees a short response
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with Cache-Control for `immutable` paths, precompressed siblings and byte ranges"""
+
+    def __init__(self, *args, immutable: Optional[re.Pattern] = None, precompressed: bool = STATIC_PRECOMPRESSED, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable = immutable
+        self.precompressed = precompressed
+
+    async def get_response(self, path: str, scope) -> Response:
+        if self.precompressed and scope["method"] in ("GET", "HEAD") and os.path.splitext(path)[1] in COMPRESSIBLE:
+            request_headers = Headers(scope=scope)
+            accepted = accepted_encodings(request_headers.get("accept-encoding"))
+            # A range applies to the identity representation
+            if accepted and "range" not in request_headers:
+                response = await self._encoded_response(path, accepted, request_headers)
+                if response is not None:
+                    return response
+        return await super().get_response(path, scope)
+
+    async def _encoded_response(self, path, accepted, request_headers) -> Optional[Response]:
+        for coding, suffix in ENCODINGS:
+            if coding not in accepted:
+                continue
+            sibling_path, sibling_stat = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if sibling_stat is None or not stat.S_ISREG(sibling_stat.st_mode):
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+            if stat_result is None or sibling_stat.st_mtime < stat_result.st_mtime:
+                # Stale or orphaned sibling; the original is served as is
+                return None
+            response = FileResponse(
+                sibling_path,
+                stat_result=sibling_stat,
+                media_type=guess_type(full_path)[0] or "text/plain",
+                headers={"content-encoding": coding, **self.cache_headers(full_path)},
+            )
+            # Ranges are only served on the identity representation
+            del response.headers["accept-ranges"]
+            if self.is_not_modified(response.headers, request_headers):
+                return NotModifiedResponse(response.headers)
+            return response
+        return None
+
+    def cache_headers(self, full_path) -> dict:
+        headers = {"accept-ranges": "bytes"}
+        if self.precompressed and os.path.splitext(full_path)[1] in COMPRESSIBLE:
+            headers["vary"] = "Accept-Encoding"
+        relative = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+        if self.immutable is not None and self.immutable.search(relative):
+            headers["cache-control"] = IMMUTABLE
+        return headers
+
+    def file_response(self, full_path, stat_result, scope, status_code=200) -> Response:
+        request_headers = Headers(scope=scope)
+        headers = self.cache_headers(full_path)
+        response = FileResponse(full_path, status_code=status_code, headers=headers, stat_result=stat_result)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        if status_code != 200 or "range" not in request_headers or not self._if_range(response.headers, request_headers):
+            return response
+
+        requested = byte_range(request_headers["range"], stat_result.st_size)
+        if requested is None:
+            return response
+        if requested is False:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{stat_result.st_size}"})
+        return FileRangeResponse(full_path, *requested, stat_result=stat_result, headers=headers, media_type=response.media_type)
+
+    @staticmethod
+    def _if_range(response_headers, request_headers) -> bool:
+        """A Range only applies while If-Range (when sent) still names this version"""
+        if_range = request_headers.get("if-range")
+        return if_range is None or if_range.strip() in (response_headers["etag"], response_headers["last-modified"])
+
@@ -0,0 +1,90 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import event
+
+import cache
+import columnar
+import database
+from conftest import seed_catalog
+
+pytest.importorskip("aiosqlite")
+
+CATALOG_URLS = [
+    "/api/categories",
+    "/api/products?limit=5",
+    "/api/products?cursor=&limit=4&sort=price",
+    "/api/products/featured",
+    "/api/products/discounted",
+    "/api/products/search?shape=Round&sort=price",
+    "/api/products/search?q=יהלום",
+    "/api/products/facets?color=E",
+    "/api/products/1",
+]
+
+
+@pytest.fixture
+def async_queries(monkeypatch):
+    """Turn on the async catalog routes and collect the statements the async engine runs"""
+    monkeypatch.setattr(database, "ASYNC_CATALOG_ROUTES", True)
+    statements = []
+    sync_engine = database.get_async_engine().sync_engine
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_async_database_url():
+    assert database.async_database_url("sqlite:///./diamond_store.db") == "sqlite+aiosqlite:///./diamond_store.db"
+    assert database.async_database_url("postgresql://shop:secret@db/store") == "postgresql+asyncpg://shop:secret@db/store"
+    with pytest.raises(ValueError):
+        database.async_database_url("mysql://shop@db/store")
+
+
+def test_async_routes_answer_like_the_sync_ones(client, db, monkeypatch):
+    seed_catalog(db)
+    sync = {url: client.get(url) for url in CATALOG_URLS}
+    cache.clear()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(database, "ASYNC_CATALOG_ROUTES", True)
+        for url in CATALOG_URLS:
+            response = client.get(url)
+            assert response.status_code == sync[url].status_code == 200, url
+            assert response.json() == sync[url].json(), url
+            assert response.headers["etag"] == sync[url].headers["etag"]
+        assert client.get("/api/products/999").status_code == 404
+        assert client.get("/api/categories/999").status_code == 404
+
+
+def test_async_routes_read_through_the_async_engine(client, db, async_queries):
+    seed_catalog(db)
+    first = client.get("/api/products/featured")
+    assert first.status_code == 200
+    assert async_queries
+
+    revalidated = client.get("/api/products/featured", headers={"If-None-Match": first.headers["etag"]})
+    assert revalidated.status_code == 304
+
+
+def test_concurrent_cold_reads_do_not_stall_the_event_loop(client, db, async_queries, monkeypatch):
+    # The columnar engine and carat pricing table load on first use; concurrent
+    # requests must not block each other on those loads
+    monkeypatch.setattr(columnar, "CATALOG_COLUMNAR_ENGINE", True)
+    seed_catalog(db, products=30)
+    import main
+
+    async def burst():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            urls = [f"/api/products/search?sort=price&skip={i % 5}" for i in range(40)]
+            urls += ["/api/products/facets", "/api/products/1/price/1.0"] * 5
+            return await asyncio.gather(*(http.get(url) for url in urls))
+
+    responses = asyncio.run(asyncio.wait_for(burst(), timeout=30))
+    assert [response.status_code for response in responses] == [200] * len(responses)
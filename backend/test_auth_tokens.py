@@ -0,0 +1,68 @@
+import pytest
+from jose import jwt
+
+import auth
+import models
+from conftest import count_queries, pbkdf2_hash
+
+
+@pytest.fixture
+def customer(db):
+    user = models.User(
+        email="dana@example.com", username="dana", full_name="דנה",
+        hashed_password=pbkdf2_hash("secret"),
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def bearer(user):
+    return {"Authorization": f"Bearer {auth.create_user_token(user)}"}
+
+
+def test_login_token_carries_id_admin_flag_and_version(client, customer):
+    response = client.post("/api/auth/login", json={"email": customer.email, "password": "secret"})
+    assert response.status_code == 200
+    claims = jwt.decode(response.json()["access_token"], auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    assert (claims["sub"], claims["uid"], claims["adm"], claims["ver"]) == (customer.email, customer.id, False, 0)
+
+
+def test_authenticated_requests_skip_the_users_lookup(client, customer):
+    headers = bearer(customer)
+    assert client.get("/api/auth/me", headers=headers).json()["email"] == customer.email
+    with count_queries() as statements:
+        response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["username"] == "dana"
+    assert statements == []
+
+
+def test_logout_all_revokes_existing_tokens(client, customer):
+    headers = bearer(customer)
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    assert client.post("/api/auth/logout-all", headers=headers).status_code == 200
+
+    # The cached snapshot was dropped with the write, so the old token fails right away
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+    response = client.post("/api/auth/login", json={"email": customer.email, "password": "secret"})
+    fresh = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/api/auth/me", headers=fresh).status_code == 200
+
+
+def test_admin_revokes_a_users_tokens(client, admin_headers, customer):
+    headers = bearer(customer)
+    response = client.post(f"/api/admin/users/{customer.id}/revoke-tokens", headers=admin_headers)
+    assert response.status_code == 200
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+    assert client.post("/api/admin/users/999/revoke-tokens", headers=admin_headers).status_code == 404
+    assert client.post(f"/api/admin/users/{customer.id}/revoke-tokens", headers=headers).status_code == 401
+
+
+def test_tokens_without_the_new_claims_still_authenticate(client, customer):
+    token = auth.create_access_token(data={"sub": customer.email})
+    response = client.get("/api/auth/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["id"] == customer.id
@@ -0,0 +1,71 @@
+import gzip
+import os
+
+import pytest
+
+import build_index
+
+INDEX = b"<!doctype html><html lang=\"he\" dir=\"rtl\"><div id=\"root\"></div></html>" * 10
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    (tmp_path / "index.html").write_bytes(INDEX)
+    (tmp_path / "index.html.gz").write_bytes(gzip.compress(INDEX))
+    (tmp_path / "favicon.ico").write_bytes(b"\x00\x00\x01\x00")
+    # Never rechecked on its own; test_each_worker_picks_up_a_new_build covers that
+    monkeypatch.setattr(build_index, "frontend_build", build_index.BuildIndex(tmp_path, check_seconds=float("inf")))
+    return tmp_path
+
+
+def test_spa_routes_are_served_from_memory_with_etags(client, build):
+    response = client.get("/admin/products", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200 and response.content == INDEX
+    assert response.headers["content-type"].startswith("text/html")
+    assert response.headers["cache-control"] == "no-cache"
+    etag = response.headers["etag"]
+
+    # Deleting the file does not matter until the index is reloaded
+    (build / "index.html").unlink()
+    revalidated = client.get("/products/7", headers={"If-None-Match": etag, "Accept-Encoding": "identity"})
+    assert revalidated.status_code == 304 and revalidated.headers["etag"] == etag
+
+    compressed = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip" and compressed.content == INDEX
+    assert compressed.headers["etag"] != etag
+    assert build_index.frontend_build.loads == 1
+
+
+def test_root_build_files(client, build):
+    assert client.get("/favicon.ico").content == b"\x00\x00\x01\x00"
+    assert client.get("/missing.png").status_code == 404
+
+
+def test_each_worker_picks_up_a_new_build(client, build, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(build_index, "frontend_build", build_index.BuildIndex(build, check_seconds=2, clock=lambda: now[0]))
+    first = client.get("/", headers={"Accept-Encoding": "identity"}).headers["etag"]
+    (build / "index.html").write_bytes(INDEX + b"<!-- v2 -->")
+    os.utime(build / "index.html.gz", (0, 0))
+    # Checked at most every check_seconds
+    assert client.get("/", headers={"Accept-Encoding": "identity"}).headers["etag"] == first
+
+    now[0] = 2.0
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    # The .gz sibling is older than the new index.html, so it is no longer used
+    assert "content-encoding" not in response.headers and response.content.endswith(b"<!-- v2 -->")
+    assert response.headers["etag"] != first
+    assert build_index.frontend_build.loads == 2
+
+    # Precompressing after the build lands is picked up too
+    (build / "index.html.gz").write_bytes(gzip.compress(INDEX + b"<!-- v2 -->"))
+    now[0] = 4.0
+    assert client.get("/", headers={"Accept-Encoding": "gzip"}).headers["content-encoding"] == "gzip"
+    now[0] = 6.0
+    client.get("/")
+    assert build_index.frontend_build.loads == 3
+
+
+def test_missing_build_is_a_404(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(build_index, "frontend_build", build_index.BuildIndex(tmp_path / "build"))
+    assert client.get("/").json()["detail"] == "Frontend not found"
@@ -0,0 +1,61 @@
+import pytest
+
+import carat_pricing
+import crud
+import schemas
+
+
+def add_pricing(db, *rows):
+    for weight, multiplier in rows:
+        crud.create_carat_pricing(db, schemas.CaratPricingCreate(carat_weight=weight, price_multiplier=multiplier))
+
+
+def test_lookup_tolerates_float_noise(db):
+    add_pricing(db, (0.5, 0.6), (1.0, 1.0), (1.5, 1.8))
+
+    assert crud.calculate_price_for_carat(db, 1000.0, 0.9999)["price_multiplier"] == 1.0
+    assert crud.calculate_price_for_carat(db, 1000.0, 1.5001)["price_multiplier"] == 1.8
+    assert crud.get_carat_pricing_by_weight(db, 0.4999).price_multiplier == 0.6
+
+
+def test_unknown_weight_defaults_to_one(db):
+    add_pricing(db, (0.5, 0.6), (1.5, 1.8))
+
+    result = crud.calculate_price_for_carat(db, 1000.0, 1.0, discount_percentage=10)
+    assert result["price_multiplier"] == 1.0
+    assert result["final_price"] == pytest.approx(900.0)
+
+
+def test_interpolation_between_configured_weights():
+    table = carat_pricing.CaratPriceTable([0.5, 1.0, 2.0], [0.6, 1.0, 3.0], version=1)
+
+    assert table.multiplier(0.75) is None
+    assert table.multiplier(0.75, interpolate=True) == pytest.approx(0.8)
+    assert table.multiplier(1.5, interpolate=True) == pytest.approx(2.0)
+    assert table.multiplier(2.5, interpolate=True) is None
+    assert table.multiplier(0.25, interpolate=True) is None
+
+
+def test_lookups_do_not_query_until_pricing_changes(db, query_counter):
+    add_pricing(db, (1.0, 1.2))
+    crud.calculate_price_for_carat(db, 100.0, 1.0)
+
+    with query_counter() as statements:
+        for _ in range(50):
+            crud.calculate_price_for_carat(db, 100.0, 1.0)
+    assert statements == []
+
+    pricing = crud.get_carat_pricing_by_weight(db, 1.0)
+    crud.update_carat_pricing(db, pricing.id, schemas.CaratPricingUpdate(carat_weight=1.0, price_multiplier=1.5))
+    assert crud.calculate_price_for_carat(db, 100.0, 1.0)["price_multiplier"] == 1.5
+
+    crud.delete_carat_pricing(db, pricing.id)
+    assert crud.calculate_price_for_carat(db, 100.0, 1.0)["price_multiplier"] == 1.0
+
+
+def test_inactive_pricing_is_ignored(db):
+    add_pricing(db, (1.0, 1.2))
+    pricing = crud.get_carat_pricing_by_weight(db, 1.0)
+    crud.update_carat_pricing(db, pricing.id, schemas.CaratPricingUpdate(carat_weight=1.0, price_multiplier=1.2, is_active=False))
+
+    assert crud.calculate_price_for_carat(db, 100.0, 1.0)["price_multiplier"] == 1.0
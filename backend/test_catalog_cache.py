@@ -0,0 +1,117 @@
+import cache
+import crud
+import schemas
+from conftest import seed_catalog
+
+
+def test_repeat_reads_are_served_without_queries(client, db, query_counter):
+    seed_catalog(db, products=5)
+    client.get("/api/products?limit=3")
+
+    with query_counter() as statements:
+        response = client.get("/api/products?limit=3")
+
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+    assert statements == []
+
+
+def test_keys_include_query_parameters(client, db):
+    seed_catalog(db, products=5, categories=2)
+
+    assert len(client.get("/api/products?limit=2").json()) == 2
+    assert len(client.get("/api/products?limit=4").json()) == 4
+    assert {p["category_id"] for p in client.get("/api/products?category_id=2").json()} == {2}
+
+
+def test_product_writes_invalidate_detail_and_lists(client, db):
+    seed_catalog(db, products=5)
+    assert client.get("/api/products/1").json()["name"] == "יהלום 0"
+    assert client.get("/api/products").json()[0]["name"] == "יהלום 0"
+
+    crud.update_product(db, 1, schemas.ProductUpdate(name="שם חדש", base_price=1.0, price=1.0, category_id=1))
+
+    assert client.get("/api/products/1").json()["name"] == "שם חדש"
+    assert client.get("/api/products").json()[0]["name"] == "שם חדש"
+
+
+def test_writes_keep_unrelated_entries(client, db):
+    seed_catalog(db, products=5)
+    client.get("/api/products/2")
+    client.get("/api/categories")
+
+    crud.toggle_product_featured(db, 1)
+
+    responses, snapshot = cache.catalog_cache.stats(), cache.product_json.stats()
+    client.get("/api/products/2")
+    client.get("/api/categories")
+    assert cache.catalog_cache.stats()["hits"] == responses["hits"] + 1
+    assert cache.product_json.stats()["hits"] == snapshot["hits"] + 1
+
+
+def test_child_row_writes_invalidate_product(client, db):
+    seed_catalog(db, products=2, images=1)
+    assert len(client.get("/api/products/1").json()["images"]) == 1
+
+    image = crud.create_product_image(db, schemas.ProductImageCreate(product_id=1, image_url="/uploads/new.jpg"))
+    assert len(client.get("/api/products/1").json()["images"]) == 2
+
+    crud.delete_product_image(db, image.id)
+    assert len(client.get("/api/products/1").json()["images"]) == 1
+
+
+def test_category_writes_invalidate_embedded_categories(client, db):
+    seed_catalog(db, products=2)
+    client.get("/api/products/1")
+
+    crud.update_category(db, 1, schemas.CategoryUpdate(name="טבעות"))
+
+    assert client.get("/api/products/1").json()["category"]["name"] == "טבעות"
+    assert client.get("/api/categories").json()[0]["name"] == "טבעות"
+
+
+def test_created_products_appear_in_lists(client, db):
+    seed_catalog(db, products=1)
+    assert len(client.get("/api/products").json()) == 1
+    assert client.get("/api/products/2").status_code == 404
+
+    crud.create_product(db, schemas.ProductCreate(name="חדש", base_price=1.0, price=1.0, category_id=1))
+
+    assert len(client.get("/api/products").json()) == 2
+    assert client.get("/api/products/2").status_code == 200
+
+
+def test_lru_eviction_and_ttl_expiry():
+    now = [0.0]
+    lru = cache.TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+
+    assert lru.get("b") == (False, None)
+    assert lru.get("a") == (True, 1)
+    now[0] = 11
+    assert lru.get("a") == (False, None)
+    assert lru.stats()["evictions"] == 1
+    assert lru.stats()["expirations"] == 1
+
+
+def test_stale_load_is_not_stored_after_concurrent_invalidation():
+    lru = cache.TTLCache(maxsize=10, ttl=10)
+    generation = lru.generation
+    lru.invalidate("product:1")
+    lru.set("key", "stale", tags=("product:1",), generation=generation)
+
+    assert lru.get("key") == (False, None)
+
+
+def test_stats_endpoint_requires_admin(client, admin_headers):
+    before = cache.catalog_cache.stats()
+    client.get("/api/categories")
+    client.get("/api/categories")
+
+    assert client.get("/api/admin/cache/stats").status_code == 403
+    stats = client.get("/api/admin/cache/stats", headers=admin_headers).json()
+    assert stats["hits"] == before["hits"] + 1
+    assert stats["misses"] == before["misses"] + 1
@@ -0,0 +1,43 @@
+from conftest import seed_catalog
+
+# Listing routes must not issue more statements than this, however many rows they return
+MAX_CATALOG_QUERIES = 5
+
+
+def test_product_listing_query_count_is_constant(client, db, query_counter):
+    seed_catalog(db, products=100, categories=20)
+
+    with query_counter() as statements:
+        response = client.get("/api/products?limit=100")
+
+    assert response.status_code == 200
+    products = response.json()
+    assert len(products) == 100
+    assert all(p["category"] is not None for p in products)
+    assert all(len(p["images"]) == 3 and len(p["variants"]) == 2 for p in products)
+    assert len(statements) <= MAX_CATALOG_QUERIES, statements
+
+
+def test_featured_and_discounted_load_all_relationships(client, db, query_counter):
+    seed_catalog(db, products=30, categories=10)
+
+    for path in ("/api/products/featured?limit=20", "/api/products/discounted?limit=20"):
+        with query_counter() as statements:
+            response = client.get(path)
+
+        assert response.status_code == 200
+        products = response.json()
+        assert products
+        assert all(p["category"] is not None and p["variants"] for p in products)
+        assert len(statements) <= MAX_CATALOG_QUERIES, statements
+
+
+def test_single_product_query_count(client, db, query_counter):
+    seed_catalog(db, products=3)
+
+    with query_counter() as statements:
+        response = client.get("/api/products/1")
+
+    assert response.status_code == 200
+    assert response.json()["category"]["id"] == 1
+    assert len(statements) <= MAX_CATALOG_QUERIES, statements
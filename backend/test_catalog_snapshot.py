@@ -0,0 +1,59 @@
+import json
+
+import catalog_snapshot
+import crud
+import schemas
+from conftest import seed_catalog
+
+
+def orm_body(products):
+    """What the route used to send: response_model validation plus JSON encoding"""
+    return json.loads(
+        json.dumps([schemas.ProductResponse.model_validate(p).model_dump(mode="json") for p in products])
+    )
+
+
+def test_snapshot_matches_orm_serialization(client, db):
+    seed_catalog(db, products=8, categories=3)
+
+    assert client.get("/api/products").json() == orm_body(crud.get_products(db))
+    assert client.get("/api/products?category_id=2").json() == orm_body(crud.get_products(db, category_id=2))
+    assert client.get("/api/products/featured").json() == orm_body(crud.get_featured_products(db))
+    assert client.get("/api/products/discounted").json() == orm_body(crud.get_discounted_products(db))
+    assert client.get("/api/products/3").json() == orm_body([crud.get_product(db, 3)])[0]
+
+    page = client.get("/api/products?limit=3&cursor=").json()
+    products, next_cursor = crud.get_products_page(db, limit=3)
+    assert page == {"items": orm_body(products), "next_cursor": next_cursor}
+
+
+def test_snapshot_is_served_as_raw_json_with_validators(client, db):
+    seed_catalog(db, products=2)
+    response = client.get("/api/products/1")
+
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers["etag"].startswith('"catalog-')
+
+
+def test_product_change_reencodes_only_that_product(client, db, query_counter):
+    seed_catalog(db, products=20)
+    client.get("/api/products")
+
+    crud.toggle_product_featured(db, 5)
+
+    with query_counter() as statements:
+        body = client.get("/api/products").json()
+
+    # One id-only listing query, then a reload of product 5 and its collections
+    product_loads = [s for s in statements if "products.name" in s]
+    assert len(product_loads) == 1
+    assert "products.id IN (" in product_loads[0]
+    assert len(statements) <= 5, statements
+    assert next(p for p in body if p["id"] == 5)["is_featured"] is True
+
+
+def test_warm_encodes_every_available_product(db):
+    seed_catalog(db, products=12)
+
+    assert catalog_snapshot.warm(db, batch_size=5) == 12
+    assert len(catalog_snapshot.product_fragments(db, list(range(1, 13)))) == 12
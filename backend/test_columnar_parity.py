@@ -0,0 +1,151 @@
+"""The columnar engine must answer exactly like the SQL path it replaces"""
+
+import random
+import time
+
+import pytest
+from sqlalchemy import text
+
+import catalog_version
+import columnar
+import crud
+import facets
+import grades
+import models
+import schemas
+from conftest import seed_catalog
+
+pytestmark = pytest.mark.skipif(columnar.np is None, reason="NumPy not installed")
+
+SHAPES = ["Round", "Oval", "Princess", "Emerald", None]
+
+
+@pytest.fixture
+def catalog(db):
+    """A random catalog with NULLs and unknown grades sprinkled in"""
+    rng = random.Random(13)
+    seed_catalog(db, products=120, categories=4, images=0, variants=0, carats=2)
+    for product in db.query(models.Product):
+        product.shape = rng.choice(SHAPES)
+        product.color_grade = rng.choice(grades.COLOR_GRADES[:7] + ("Fancy", None))
+        product.clarity_grade = rng.choice(grades.CLARITY_GRADES[:8] + (None,))
+        product.cut_grade = rng.choice(grades.CUT_GRADES + (None,))
+        product.carat_weight = rng.choice([None, round(rng.uniform(0.3, 3.0), 2)])
+        product.price = float(rng.randrange(500, 40000, 250))
+        product.discount_percentage = rng.choice([0.0, 0.0, 10.0, 15.0])
+        product.is_available = rng.random() > 0.1
+        product.is_featured = rng.random() > 0.8
+    db.commit()
+    # Spread creation times so "newest" has something to sort
+    for product_id, in db.query(models.Product.id):
+        db.execute(text("UPDATE products SET created_at = datetime('2024-01-01', :offset) WHERE id = :id"),
+                   {"offset": f"+{rng.randrange(0, 30)} days", "id": product_id})
+    db.commit()
+    return rng
+
+
+def random_filters(rng, categories):
+    filters = {}
+    if rng.random() < 0.3:
+        filters["category_id"] = rng.choice(categories)
+    if rng.random() < 0.3:
+        filters["shapes"] = tuple(rng.sample(SHAPES[:4], rng.randint(1, 2)))
+    for scale, key in (("color", "colors"), ("clarity", "clarities"), ("cut", "cuts")):
+        scale_grades = grades.GRADE_SCALES[scale]
+        if rng.random() < 0.2:
+            filters[key] = tuple(rng.sample(scale_grades[:6], 2))
+        if rng.random() < 0.2:
+            filters[f"{scale}_min"] = rng.choice(scale_grades[:3])
+        if rng.random() < 0.2:
+            filters[f"{scale}_max"] = rng.choice(scale_grades[2:5])
+    if rng.random() < 0.3:
+        filters["carat_min"] = round(rng.uniform(0.3, 1.5), 2)
+    if rng.random() < 0.3:
+        filters["price_max"] = float(rng.randrange(5000, 40000, 500))
+    return filters
+
+
+def both_paths(monkeypatch, read):
+    monkeypatch.setattr(columnar, "CATALOG_COLUMNAR_ENGINE", False)
+    sql = read()
+    monkeypatch.setattr(columnar, "CATALOG_COLUMNAR_ENGINE", True)
+    return sql, read()
+
+
+def test_search_parity(db, catalog, monkeypatch):
+    categories = [row.id for row in db.query(models.Category.id)]
+    for _ in range(150):
+        filters = random_filters(catalog, categories)
+        sort = catalog.choice(list(crud.PRODUCT_SEARCH_SORTS) + [None])
+        skip, limit = catalog.choice([(0, 100), (0, 7), (5, 10)])
+        sql, engine = both_paths(monkeypatch, lambda: crud.search_products(
+            db, skip=skip, limit=limit, sort=sort, ids_only=True, **filters
+        ))
+        assert engine == sql, (filters, sort)
+
+
+def test_facet_parity(db, catalog, monkeypatch):
+    categories = [row.id for row in db.query(models.Category.id)]
+    for _ in range(60):
+        filters = random_filters(catalog, categories)
+        sql, engine = both_paths(monkeypatch, lambda: facets.product_facets(db, **filters))
+        assert engine == sql, filters
+
+
+def test_listing_parity(db, catalog, monkeypatch):
+    categories = [row.id for row in db.query(models.Category.id)]
+    for category_id in [None] + categories:
+        sql, engine = both_paths(monkeypatch, lambda: crud.get_products(
+            db, skip=3, limit=40, category_id=category_id, ids_only=True
+        ))
+        assert engine == sql
+    for read in (crud.get_featured_products, crud.get_discounted_products):
+        sql, engine = both_paths(monkeypatch, lambda: read(db, limit=20, ids_only=True))
+        assert engine == sql
+
+
+def test_change_feed_keeps_the_engine_current(db, catalog, monkeypatch, query_counter):
+    monkeypatch.setattr(columnar, "CATALOG_COLUMNAR_ENGINE", True)
+    columns = columnar.catalog_engine.columns(db)
+    product = db.query(models.Product).filter(models.Product.is_available == True).first()
+
+    # An update is patched in place, without rereading the whole catalog
+    crud.update_product(db, product.id, schemas.ProductUpdate(
+        name=product.name, base_price=product.base_price, price=1.0, category_id=product.category_id,
+        color_grade="D",
+    ))
+    with query_counter() as statements:
+        assert columnar.catalog_engine.columns(db) is columns
+    assert len(statements) == 1
+    assert crud.search_products(db, sort="price", limit=1, ids_only=True) == [product.id]
+
+    # A new product changes the id set, so the arrays are rebuilt
+    new = crud.create_product(db, schemas.ProductCreate(
+        name="חדש", base_price=1.0, price=0.5, category_id=product.category_id
+    ))
+    assert crud.search_products(db, sort="price", limit=1, ids_only=True) == [new.id]
+    assert columnar.catalog_engine.columns(db) is not columns
+
+
+def test_writes_from_another_worker_trigger_a_rebuild(db, catalog, monkeypatch):
+    clock = [time.monotonic()]
+    monkeypatch.setattr(catalog_version.catalog_version, "clock", lambda: clock[0])
+    monkeypatch.setattr(columnar, "CATALOG_COLUMNAR_ENGINE", True)
+    columns = columnar.catalog_engine.columns(db)
+    product_id = db.query(models.Product.id).filter(models.Product.is_available == True).first().id
+
+    with db.get_bind().begin() as connection:
+        connection.execute(text("UPDATE products SET price = 0.25 WHERE id = :id"), {"id": product_id})
+        connection.execute(text("UPDATE catalog_state SET version = version + 1"))
+    clock[0] += 60
+    assert columnar.catalog_engine.columns(db) is not columns
+    assert crud.search_products(db, sort="price", limit=1, ids_only=True) == [product_id]
+
+
+def test_missing_numpy_is_reported_once(monkeypatch, caplog):
+    monkeypatch.setattr(columnar, "np", None)
+    monkeypatch.setattr(columnar, "CATALOG_COLUMNAR_ENGINE", True)
+    monkeypatch.setattr(columnar, "_warned_missing_numpy", False)
+
+    assert not columnar.enabled() and not columnar.enabled()
+    assert [record.levelname for record in caplog.records] == ["WARNING"]
@@ -0,0 +1,94 @@
+import crud
+import schemas
+from conftest import seed_catalog
+
+
+def test_catalog_get_emits_validators(client, db):
+    seed_catalog(db, products=2)
+    response = client.get("/api/products")
+
+    assert response.status_code == 200
+    assert response.headers["etag"].startswith('"catalog-')
+    assert "last-modified" in response.headers
+    assert response.headers["cache-control"] == "no-cache"
+
+
+def test_if_none_match_short_circuits_before_the_query(client, db, query_counter):
+    seed_catalog(db, products=3)
+    etag = client.get("/api/products/1").headers["etag"]
+
+    with query_counter() as statements:
+        response = client.get("/api/products/1", headers={"If-None-Match": etag})
+        listing = client.get("/api/products?limit=50", headers={"If-None-Match": f'W/{etag}, "other"'})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert listing.status_code == 304
+    assert statements == []
+
+
+def test_admin_writes_change_the_etag(client, db):
+    seed_catalog(db, products=3)
+    etag = client.get("/api/products/1").headers["etag"]
+
+    crud.update_product(db, 1, schemas.ProductUpdate(name="שם חדש", base_price=1.0, price=1.0, category_id=1))
+
+    response = client.get("/api/products/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["name"] == "שם חדש"
+    assert response.headers["etag"] != etag
+
+
+def test_bulk_updates_change_the_etag(client, db):
+    seed_catalog(db, products=3)
+    etag = client.get("/api/products").headers["etag"]
+
+    crud.set_default_carat_for_product(db, product_id=1, carat_weight=1.0)
+
+    assert client.get("/api/products", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_if_modified_since(client, db):
+    seed_catalog(db, products=1)
+    last_modified = client.get("/api/categories").headers["last-modified"]
+
+    assert client.get("/api/categories", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(
+        "/api/categories", headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"}
+    ).status_code == 200
+
+
+def test_writes_from_another_worker_are_noticed(client, db, monkeypatch):
+    from sqlalchemy import text
+    from database import engine
+    import catalog_version
+
+    seed_catalog(db, products=2)
+    etag = client.get("/api/products/1").headers["etag"]
+
+    # Another process edits the row and bumps catalog_state; this worker's
+    # crud invalidation never runs
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE products SET name = 'נערך בתהליך אחר' WHERE id = 1"))
+        connection.execute(text("UPDATE catalog_state SET version = version + 1"))
+    # Let the version TTL lapse
+    monkeypatch.setattr(catalog_version.catalog_version, "clock", lambda: float("inf"))
+
+    response = client.get("/api/products/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["name"] == "נערך בתהליך אחר"
+
+
+def test_missing_rows_are_404_even_with_a_matching_etag(client, db, query_counter):
+    seed_catalog(db, products=1)
+    etag = client.get("/api/products/1").headers["etag"]
+
+    assert client.get("/api/products/999", headers={"If-None-Match": etag}).status_code == 404
+    assert client.get("/api/products/999", headers={"If-None-Match": "*"}).status_code == 404
+    assert client.get("/api/categories/999", headers={"If-None-Match": etag}).status_code == 404
+    assert client.get("/api/categories/1", headers={"If-None-Match": etag}).status_code == 304
+    # A product already in the snapshot needs no lookup to answer 304
+    with query_counter() as statements:
+        assert client.get("/api/products/1", headers={"If-None-Match": etag}).status_code == 304
+    assert statements == []
@@ -0,0 +1,182 @@
+import io
+from datetime import datetime
+
+import pytest
+from PIL import Image
+from sqlalchemy import text
+
+import cache
+import catalog_version
+import image_srcsets
+import image_variants
+import main
+import models
+import schemas
+from database import engine
+
+WIDTHS = (320, 640, 1024, 1600)
+
+
+def jpeg_with_exif(width, height, orientation=1):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x010F] = "Camera maker"  # Make
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+def test_renditions_are_resized_rotated_and_stripped(tmp_path):
+    source = tmp_path / "ring.jpg"
+    # Orientation 6: stored landscape, displayed portrait
+    source.write_bytes(jpeg_with_exif(2000, 1200, orientation=6))
+
+    result = image_variants.generate_variants(str(source), str(tmp_path / "derived"), WIDTHS, 80)
+
+    assert (result["width"], result["height"]) == (1200, 2000)
+    assert [variant["width"] for variant in result["variants"]] == [320, 640, 1024, 1200]
+    for variant in result["variants"]:
+        with Image.open(tmp_path / "derived" / variant["name"]) as rendition:
+            assert rendition.format == "WEBP"
+            assert rendition.width == variant["width"]
+            assert rendition.height == round(2000 * variant["width"] / 1200)
+            assert "exif" not in rendition.info and not rendition.getexif()
+    assert sorted(path.name for path in (tmp_path / "derived").iterdir()) == sorted(
+        variant["name"] for variant in result["variants"]
+    )
+    # Named after the whole file name, so ring.jpg and ring.png never share renditions
+    assert result["variants"][0]["name"] == "ring-jpg-320.webp"
+
+
+def test_target_widths_never_upscale():
+    assert image_variants.target_widths(500, WIDTHS) == [320, 500]
+    assert image_variants.target_widths(3000, WIDTHS) == list(WIDTHS)
+    assert image_variants.target_widths(200, WIDTHS) == [200]
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "uploads_dir", tmp_path)
+    processor = image_variants.ImageProcessor(workers=1)
+    monkeypatch.setattr(image_variants, "processor", processor)
+    jobs = []
+    submit = processor.submit
+    monkeypatch.setattr(processor, "submit", lambda *args: jobs.append(submit(*args)) or jobs[-1])
+    yield jobs
+    processor.shutdown()
+
+
+def test_uploads_get_srcsets_once_processed(client, db, admin_headers, uploads):
+    png = io.BytesIO()
+    Image.new("RGBA", (800, 400), (0, 0, 0, 0)).save(png, "PNG")
+    response = client.post("/api/upload", files={"file": ("hero.png", png.getvalue(), "image/png")}, headers=admin_headers)
+    url = response.json()["url"]
+
+    category = models.Category(name="טבעות", hero_image_url=url)
+    db.add(category)
+    db.flush()
+    product = models.Product(name="טבעת", base_price=100.0, price=100.0, category_id=category.id)
+    db.add(product)
+    db.flush()
+    db.add(models.ProductImage(product_id=product.id, image_url=url))
+    db.add(models.ProductVariant(product_id=product.id, color_name="זהב", color_code="#ffd700", images=[url, "/uploads/other.jpg"]))
+    db.commit()
+
+    # Served before the job is recorded, then refreshed by the manifest write
+    assert client.get(f"/api/products/{product.id}").json()["images"][0]["srcset"] is None
+    uploads[0].result(timeout=30)
+
+    stem = url.rsplit("/", 1)[1].replace(".", "-")
+    srcset = f"/uploads/derived/{stem}-320.webp 320w, /uploads/derived/{stem}-640.webp 640w, /uploads/derived/{stem}-800.webp 800w"
+    body = client.get(f"/api/products/{product.id}").json()
+    assert body["images"][0]["srcset"] == srcset
+    assert body["variants"][0]["image_srcsets"] == [srcset, None]
+    assert body["category"]["hero_image_srcset"] == srcset
+    assert client.get(f"/api/categories/{category.id}").json()["hero_image_srcset"] == srcset
+    assert client.get("/api/admin/images/processing", headers=admin_headers).json()["completed"] == 1
+
+
+def test_recording_a_manifest_drops_only_the_responses_showing_it(client, db):
+    url = "/uploads/ring.jpg"
+    rings, earrings = models.Category(name="טבעות"), models.Category(name="עגילים", hero_image_url=url)
+    db.add_all([rings, earrings])
+    db.flush()
+    products = [
+        models.Product(name=name, base_price=100.0, price=100.0, category_id=category.id)
+        for name, category in (("טבעת", rings), ("טבעת זהב", rings), ("עגיל", earrings), ("צמיד", rings))
+    ]
+    db.add_all(products)
+    db.flush()
+    image, variant, in_category, unrelated = (product.id for product in products)
+    db.add(models.ProductImage(product_id=image, image_url=url))
+    db.add(models.ProductVariant(product_id=variant, color_name="זהב", color_code="#ffd700", images=["/uploads/a.jpg", url]))
+    db.commit()
+    for product_id in (image, variant, in_category, unrelated):
+        client.get(f"/api/products/{product_id}")
+
+    image_variants.record_manifest(url, {"width": 640, "height": 480, "variants": [{"width": 320, "name": "ring-jpg-320.webp"}]})
+
+    cached = {product_id: cache.product_json.get(product_id)[0] for product_id in (image, variant, in_category, unrelated)}
+    assert cached == {image: False, variant: False, in_category: False, unrelated: True}
+
+
+def test_index_reloads_after_another_worker_writes(client, db, monkeypatch):
+    url = "/uploads/ring.jpg"
+    category = models.Category(name="טבעות", hero_image_url=url)
+    earrings = models.Category(name="עגילים")
+    db.add_all([category, earrings])
+    db.flush()
+    shown = models.Product(name="טבעת", base_price=100.0, price=100.0, category_id=category.id)
+    unrelated = models.Product(name="עגיל", base_price=100.0, price=100.0, category_id=earrings.id)
+    db.add_all([shown, unrelated])
+    db.commit()
+    client.get(f"/api/products/{shown.id}")
+    client.get(f"/api/products/{unrelated.id}")
+    assert image_srcsets.srcset(url) is None
+
+    foreign_writes = catalog_version.catalog_version.foreign_writes
+    # Recorded by another worker: this process only learns of it through catalog_state
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO image_manifests (original_url, width, height, variants)"
+            " VALUES (:url, 640, 480, '[{\"width\": 320, \"url\": \"/uploads/derived/ring-320.webp\"}]')"
+        ), {"url": url})
+        connection.execute(text("UPDATE catalog_state SET version = version + 1, manifest_version = manifest_version + 1"))
+    monkeypatch.setattr(catalog_version.catalog_version, "clock", lambda: float("inf"))
+
+    # The next catalog request reloads the index on its own session...
+    srcset = "/uploads/derived/ring-320.webp 320w"
+    assert client.get(f"/api/categories/{category.id}").json()["hero_image_srcset"] == srcset
+    # ...and drops only the responses that show the image
+    assert cache.product_json.get(unrelated.id)[0] is True
+    assert client.get(f"/api/products/{shown.id}").json()["category"]["hero_image_srcset"] == srcset
+    assert catalog_version.catalog_version.foreign_writes == foreign_writes
+
+
+def test_manifest_only_commits_are_marked(db):
+    db.add(models.Category(name="טבעות"))
+    db.commit()
+    db.add(models.ImageManifest(original_url="/uploads/a.jpg", width=1, height=1, variants=[]))
+    db.commit()
+    db.add(models.Category(name="עגילים"))
+    db.add(models.ImageManifest(original_url="/uploads/b.jpg", width=1, height=1, variants=[]))
+    db.commit()
+
+    state = db.query(models.CatalogState).one()
+    assert (state.version, state.manifest_version) == (3, 1)
+
+
+def test_serialization_never_queries_for_srcsets(db, query_counter):
+    url = "/uploads/ring.jpg"
+    db.add(models.ImageManifest(original_url=url, width=640, height=480, variants=[{"width": 320, "url": "/x-320.webp"}]))
+    db.commit()
+    # Not loaded yet: no srcsets rather than a query from inside serialization
+    image_srcsets.manifests.reset()
+    with query_counter() as statements:
+        assert schemas.ProductImageResponse(
+            id=1, product_id=1, image_url=url, is_primary=True, sort_order=0, created_at=datetime.now(),
+        ).srcset is None
+    assert statements == []
+
+    image_variants.sync_manifests(db)
+    assert image_srcsets.srcset(url) == "/x-320.webp 320w"
@@ -0,0 +1,103 @@
+import math
+
+import pytest
+
+import auth
+import models
+import rate_limit
+from conftest import pbkdf2_hash
+
+RULES = [rate_limit.Rule("ip", burst=3, per_minute=6), rate_limit.Rule("email", burst=2, per_minute=1)]
+
+
+class FakeRedis:
+    """Stands in for redis.Redis: runs the script's token-bucket step over in-memory hashes"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.ttls = {}
+        self.down = False
+
+    def eval(self, script, numkeys, key, burst, rate, now):
+        if self.down:
+            raise ConnectionError("Connection refused")
+        assert script == rate_limit.TOKEN_BUCKET_SCRIPT and numkeys == 1
+        bucket = self.hashes.get(key, {})
+        allowed, tokens, retry_after = rate_limit.take(
+            float(bucket.get(b"tokens", burst)), float(bucket.get(b"updated", now)), now, burst, rate
+        )
+        self.hashes[key] = {b"tokens": str(tokens).encode(), b"updated": str(now).encode()}
+        self.ttls[key] = math.ceil(burst / rate) + 1
+        return [int(allowed), str(retry_after).encode()]
+
+
+def test_login_is_throttled_per_email_before_any_password_check(client, db, monkeypatch):
+    db.add(models.User(email="dana@example.com", username="dana", full_name="דנה", hashed_password=pbkdf2_hash("secret")))
+    db.commit()
+    checks = []
+    verify = auth.verify_and_update
+    monkeypatch.setattr(auth, "verify_and_update", lambda *args: checks.append(args) or verify(*args))
+
+    burst = rate_limit.LOGIN_RATE_LIMIT_EMAIL_BURST
+    for _ in range(burst):
+        assert client.post("/api/auth/login", json={"email": "dana@example.com", "password": "wrong"}).status_code == 401
+    response = client.post("/api/auth/login", json={"email": "Dana@example.com", "password": "secret"})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) == math.ceil(60 / rate_limit.LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE)
+    assert len(checks) == burst
+
+    # Other accounts from the same address are still served
+    assert client.post("/api/auth/login", json={"email": "other@example.com", "password": "x"}).status_code == 401
+    stats = rate_limit.login_limiter.stats()
+    assert stats["rejected"] == {"ip": 0, "email": 1}
+    assert stats["allowed"] == burst + 1
+
+
+def test_buckets_refill_over_time():
+    clock = [0.0]
+    limiter = rate_limit.LoginLimiter(rate_limit.MemoryBackend(clock=lambda: clock[0]), RULES)
+
+    # One address spraying many accounts runs out of its own bucket
+    assert [limiter.hit("10.0.0.1", f"user{i}@example.com") for i in range(3)] == [None] * 3
+    assert limiter.hit("10.0.0.1", "user3@example.com") == pytest.approx(10)
+    assert limiter.hit("10.0.0.2", "user3@example.com") is None
+
+    clock[0] += 10
+    assert limiter.hit("10.0.0.1", "user4@example.com") is None
+    assert limiter.hit("10.0.0.1", "user5@example.com") == pytest.approx(10)
+    assert limiter.stats()["rejected"] == {"ip": 2, "email": 0}
+
+
+def test_redis_backend_shares_buckets_between_workers():
+    redis = FakeRedis()
+    clock = [1000.0]
+    workers = [
+        rate_limit.LoginLimiter(rate_limit.RedisBackend(redis, clock=lambda: clock[0]), RULES) for _ in range(2)
+    ]
+
+    assert workers[0].hit("10.0.0.1", "dana@example.com") is None
+    assert workers[1].hit("10.0.0.2", "dana@example.com") is None
+    assert workers[0].hit("10.0.0.3", "dana@example.com") == pytest.approx(60)
+    assert workers[0].stats()["rejected"]["email"] == 1
+
+    assert all(key.startswith("login-limit:") and "dana" not in key for key in redis.hashes)
+    email_key = "login-limit:" + rate_limit.LoginLimiter.key("email", "dana@example.com")
+    assert redis.ttls[email_key] == 121
+
+
+def test_redis_outage_falls_back_to_in_process_buckets():
+    redis = FakeRedis()
+    limiter = rate_limit.LoginLimiter(rate_limit.RedisBackend(redis), RULES)
+    redis.down = True
+
+    assert [limiter.hit("10.0.0.1", "dana@example.com") for _ in range(2)] == [None, None]
+    assert limiter.hit("10.0.0.1", "dana@example.com") is not None
+    # Both buckets of all three attempts were taken from the fallback
+    assert limiter.stats()["backend_errors"] == 6
+
+
+def test_limiter_stats_endpoint(client, admin_headers):
+    response = client.get("/api/admin/auth/login-limiter", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["backend"] == "memory"
+    assert client.get("/api/admin/auth/login-limiter").status_code == 403
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+from passlib.hash import pbkdf2_sha256
+
+import auth
+import models
+import password_hashing
+from conftest import pbkdf2_hash
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = password_hashing.PasswordPool(workers=1, max_queue=1)
+    monkeypatch.setattr(password_hashing, "password_pool", pool)
+    return pool
+
+
+def add_user(db, hashed_password):
+    user = models.User(email="dana@example.com", username="dana", full_name="דנה", hashed_password=hashed_password)
+    db.add(user)
+    db.commit()
+    return user
+
+
+def login(client, password="secret"):
+    return client.post("/api/auth/login", json={"email": "dana@example.com", "password": password})
+
+
+@pytest.mark.parametrize(
+    "legacy_hash", [pbkdf2_hash("secret"), pbkdf2_sha256.hash("secret")], ids=["hash:salt", "pbkdf2_sha256"]
+)
+def test_login_upgrades_legacy_hashes_to_bcrypt(client, db, pool, legacy_hash):
+    user = add_user(db, legacy_hash)
+    assert login(client, "wrong").status_code == 401
+    db.refresh(user)
+    assert user.hashed_password == legacy_hash
+
+    assert login(client).status_code == 200
+    db.refresh(user)
+    assert user.hashed_password.startswith("$2b$")
+    assert login(client).status_code == 200
+    assert pool.stats()["completed"] == 3
+
+
+def test_register_and_login_hash_on_the_password_pool(client, db, pool, monkeypatch):
+    threads = []
+    verify = auth.verify_and_update
+
+    def recording_verify(*args):
+        threads.append(threading.current_thread().name)
+        return verify(*args)
+
+    monkeypatch.setattr(auth, "verify_and_update", recording_verify)
+    response = client.post("/api/auth/register", json={
+        "email": "dana@example.com", "username": "dana", "full_name": "דנה", "password": "secret",
+    })
+    assert response.status_code == 200
+    assert login(client).status_code == 200
+    assert threads and all(name.startswith("password-hash") for name in threads)
+
+
+def test_saturated_pool_answers_429(client, db, pool):
+    add_user(db, pbkdf2_hash("secret"))
+    release = threading.Event()
+    blocked = [pool.submit(release.wait) for _ in range(pool.workers + pool.max_queue)]
+    try:
+        assert pool.stats()["queued"] == 1
+        response = login(client)
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+    finally:
+        release.set()
+    for future in blocked:
+        future.result(timeout=5)
+
+    assert login(client).status_code == 200
+    stats = pool.stats()
+    assert (stats["rejected"], stats["peak_queued"], stats["queued"]) == (1, 1, 0)
+
+
+def test_password_pool_stats_endpoint(client, admin_headers):
+    response = client.get("/api/admin/auth/password-pool", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["workers"] == password_hashing.PASSWORD_HASH_WORKERS
+    assert client.get("/api/admin/auth/password-pool").status_code == 403
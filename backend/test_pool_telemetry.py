@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+import database
+from pool_telemetry import PoolTelemetry
+
+
+def test_pool_settings_split_the_connection_budget():
+    assert database.pool_settings(workers=1, max_connections=90) == (45, 45)
+    assert database.pool_settings(workers=4, max_connections=90) == (11, 11)
+    # An async engine next to the sync one halves each share
+    assert database.pool_settings(workers=4, max_connections=90, engines=2) == (5, 6)
+    assert database.pool_settings(workers=64, max_connections=20) == (1, 1)
+    # Unknown worker count: conservative per-worker pools instead of the whole budget
+    assert database.pool_settings(workers=None, max_connections=90) == (5, 10)
+    assert database.pool_settings(workers=None, max_connections=90, engines=2) == (2, 5)
+
+
+def test_postgresql_engine_options(monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_POOL_SIZE", 7)
+    monkeypatch.setattr(database, "DATABASE_STATEMENT_TIMEOUT_MS", 5000)
+    telemetry = PoolTelemetry("test")
+    url = "postgresql://shop:secret@db/store"
+
+    options = database.engine_options(url, telemetry)
+    assert options["pool_size"] == 7
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"options": "-c statement_timeout=5000"}
+    assert options["poolclass"].__name__ == "TimedQueuePool"
+
+    async_options = database.engine_options(url, telemetry, asynchronous=True)
+    assert async_options["connect_args"] == {"server_settings": {"statement_timeout": "5000"}}
+    assert async_options["poolclass"].__name__ == "TimedAsyncAdaptedQueuePool"
+
+
+def test_overflow_and_timeouts_are_recorded(tmp_path):
+    telemetry = PoolTelemetry("test")
+    engine = telemetry.attach(create_engine(
+        f"sqlite:///{tmp_path}/pool.db", poolclass=telemetry.pool_class(),
+        pool_size=1, max_overflow=1, pool_timeout=0.05,
+    ))
+    first, second = engine.connect(), engine.connect()
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+
+    stats = telemetry.stats()
+    assert stats["checked_out"] == stats["peak_checked_out"] == 2
+    assert (stats["connects"], stats["overflow_connects"], stats["timeouts"]) == (2, 1, 1)
+    assert stats["overflow"] == 1
+
+    first.close()
+    second.close()
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    stats = telemetry.stats()
+    assert stats["checked_out"] == 0
+    assert stats["checkouts"] == 3
+    assert stats["wait_ms"]["max"] >= stats["wait_ms"]["p50"] >= 0
+    engine.dispose()
+
+
+def test_pool_endpoint_requires_admin(client, admin_headers):
+    response = client.get("/api/admin/db/pool", headers=admin_headers)
+    assert response.status_code == 200
+    primary = response.json()["primary"]
+    assert primary["pool"] == "TimedQueuePool"
+    assert primary["pool_size"] == database.DATABASE_POOL_SIZE
+    assert primary["checkouts"] > 0
+
+    assert client.get("/api/admin/db/pool").status_code == 403
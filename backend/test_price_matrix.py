@@ -0,0 +1,66 @@
+import pytest
+
+import carat_pricing
+import crud
+import models
+import schemas
+from conftest import seed_catalog
+
+
+def add_pricing(db, *rows):
+    for weight, multiplier in rows:
+        crud.create_carat_pricing(db, schemas.CaratPricingCreate(carat_weight=weight, price_multiplier=multiplier))
+
+
+def test_matrix_matches_single_price_route(client, db):
+    seed_catalog(db, products=5, carats=4)
+    add_pricing(db, (0.5, 0.6), (1.0, 1.0), (1.5, 1.8))
+    product_ids = [row.id for row in db.query(models.Product.id)]
+
+    response = client.post("/api/prices/matrix", json={"product_ids": product_ids})
+    assert response.status_code == 200
+    matrix = response.json()
+    assert [entry["product_id"] for entry in matrix] == product_ids
+
+    for entry in matrix:
+        assert [price["carat_weight"] for price in entry["prices"]] == [0.5, 1.0, 1.5, 2.0]
+        for price in entry["prices"]:
+            single = client.get(f"/api/products/{entry['product_id']}/price/{price['carat_weight']}").json()
+            assert price == pytest.approx(single)
+
+
+def test_matrix_is_one_query_once_pricing_is_cached(client, db, query_counter):
+    seed_catalog(db, products=20, carats=4)
+    add_pricing(db, (1.0, 1.2))
+    product_ids = [row.id for row in db.query(models.Product.id)]
+    client.post("/api/prices/matrix", json={"product_ids": product_ids})
+
+    with query_counter() as statements:
+        response = client.post("/api/prices/matrix", json={"product_ids": product_ids})
+    assert sum(len(entry["prices"]) for entry in response.json()) == 80
+    assert len(statements) == 1
+
+
+def test_matrix_skips_unavailable_carats_and_unknown_products(client, db):
+    seed_catalog(db, products=1, carats=2)
+    carat = db.query(models.ProductCaratAvailability).filter_by(carat_weight=1.0).one()
+    carat.is_available = False
+    db.commit()
+
+    response = client.post("/api/prices/matrix", json={"product_ids": [carat.product_id, 999]})
+    assert [[p["carat_weight"] for p in entry["prices"]] for entry in response.json()] == [[0.5], []]
+
+
+def test_matrix_rejects_empty_batch(client):
+    assert client.post("/api/prices/matrix", json={"product_ids": []}).status_code == 422
+
+
+@pytest.mark.skipif(carat_pricing.np is None, reason="NumPy not installed")
+@pytest.mark.parametrize("interpolate", [False, True])
+def test_vectorized_lookup_matches_scalar(interpolate):
+    table = carat_pricing.CaratPriceTable([0.3, 0.5, 1.0, 1.5, 2.0], [0.4, 0.6, 1.0, 1.8, 3.0], version=1)
+    weights = [0.1, 0.3, 0.3004, 0.4, 0.4999, 0.75, 1.0, 1.2, 1.5006, 1.9951, 2.0, 3.0]
+
+    scalar = table.multipliers_for(weights, interpolate=interpolate, numpy_threshold=len(weights) + 1)
+    vectorized = table.multipliers_for(weights, interpolate=interpolate, numpy_threshold=0)
+    assert vectorized == pytest.approx(scalar)
@@ -0,0 +1,117 @@
+import pytest
+
+import crud
+import models
+import price_range
+import schemas
+from conftest import seed_catalog
+
+
+def add_pricing(db, *rows):
+    for weight, multiplier in rows:
+        crud.create_carat_pricing(db, schemas.CaratPricingCreate(carat_weight=weight, price_multiplier=multiplier))
+
+
+def expected_range(db, product):
+    prices = [
+        crud.calculate_price_for_carat(db, product.base_price, carat.carat_weight, product.discount_percentage)["final_price"]
+        for carat in product.available_carats if carat.is_available
+    ]
+    return (min(prices), max(prices)) if prices else (None, None)
+
+
+def assert_ranges_current(db):
+    db.expire_all()
+    for product in db.query(models.Product):
+        assert (product.min_final_price, product.max_final_price) == pytest.approx(expected_range(db, product))
+
+
+def test_new_products_get_a_price_range(db):
+    add_pricing(db, (0.5, 0.6), (1.0, 1.0), (2.0, 3.0))
+    seed_catalog(db, products=4, carats=4)
+
+    assert_ranges_current(db)
+    product = db.query(models.Product).first()
+    assert product.min_final_price == pytest.approx(product.base_price * 0.6 * (1 - product.discount_percentage / 100))
+
+
+def test_price_and_carat_changes_recompute_the_product(db):
+    seed_catalog(db, products=3, carats=2)
+    product = db.query(models.Product).first()
+
+    crud.update_product(db, product.id, schemas.ProductUpdate(
+        name=product.name, base_price=5000.0, price=5000.0, category_id=product.category_id, discount_percentage=20.0
+    ))
+    assert_ranges_current(db)
+
+    crud.create_product_carat_availability(
+        db, schemas.ProductCaratAvailabilityCreate(product_id=product.id, carat_weight=3.0)
+    )
+    carat = db.query(models.ProductCaratAvailability).filter_by(product_id=product.id, carat_weight=0.5).one()
+    crud.delete_product_carat_availability(db, carat.id)
+    assert_ranges_current(db)
+
+
+def test_multiplier_change_is_one_set_based_update(db, query_counter):
+    seed_catalog(db, products=30, carats=3)
+    add_pricing(db, (1.0, 1.2))
+    pricing = crud.get_carat_pricing_by_weight(db, 1.0)
+
+    with query_counter() as statements:
+        crud.update_carat_pricing(db, pricing.id, schemas.CaratPricingUpdate(carat_weight=1.0, price_multiplier=2.5))
+    assert len([sql for sql in statements if sql.lstrip().upper().startswith("UPDATE PRODUCTS")]) == 1
+    assert_ranges_current(db)
+
+
+def test_carat_changes_only_recompute_their_product(db, query_counter):
+    seed_catalog(db, products=5, carats=3)
+    product = db.query(models.Product).first()
+
+    def product_updates(statements):
+        return [sql for sql in statements if sql.lstrip().upper().startswith("UPDATE PRODUCTS")]
+
+    with query_counter() as statements:
+        crud.set_default_carat_for_product(db, product.id, 1.0)
+    assert product_updates(statements) == []
+
+    with query_counter() as statements:
+        crud.update_product(db, product.id, schemas.ProductUpdate(
+            name=product.name, base_price=product.base_price, price=product.price, category_id=product.category_id,
+            available_carats=[schemas.ProductCaratAvailabilityCreate(product_id=product.id, carat_weight=2.0)],
+        ))
+    assert product_updates(statements) and all(" IN " in sql for sql in product_updates(statements))
+    assert_ranges_current(db)
+
+    # Dropping every carat goes through the bulk delete alone
+    crud.update_product(db, product.id, schemas.ProductUpdate(
+        name=product.name, base_price=product.base_price, price=product.price, category_id=product.category_id,
+        available_carats=[],
+    ))
+    assert_ranges_current(db)
+
+
+def test_products_without_available_carats_have_no_range(db):
+    seed_catalog(db, products=1, carats=0)
+    product = db.query(models.Product).one()
+    assert (product.min_final_price, product.max_final_price) == (None, None)
+
+
+def test_refresh_rebuilds_every_product(db):
+    seed_catalog(db, products=5, carats=3)
+    db.query(models.Product).update({"min_final_price": None, "max_final_price": None})
+    db.commit()
+
+    price_range.refresh(db)
+    db.commit()
+    assert_ranges_current(db)
+
+
+def test_nearest_configured_weight_wins_within_tolerance(db):
+    add_pricing(db, (1.0, 1.0), (1.004, 7.0))
+    seed_catalog(db, products=1, carats=0)
+    product = db.query(models.Product).one()
+    for weight in (0.9995, 1.003):
+        crud.create_product_carat_availability(
+            db, schemas.ProductCaratAvailabilityCreate(product_id=product.id, carat_weight=weight)
+        )
+    assert_ranges_current(db)
@@ -0,0 +1,82 @@
+import crud
+import models
+import schemas
+from conftest import seed_catalog
+
+STONES = [
+    # category index, shape, color, clarity, price
+    (0, "Round", "D", "VVS1", 900.0),
+    (0, "Round", "F", "VS1", 3000.0),
+    (0, "Oval", "F", "VS1", 4000.0),
+    (1, "Round", "G", "SI1", 12000.0),
+    (1, "Princess", "D", "VVS1", 30000.0),
+]
+
+
+def seed_stones(db):
+    categories = seed_catalog(db, products=len(STONES), categories=2, carats=0)
+    products = db.query(models.Product).order_by(models.Product.id).all()
+    for product, (category, shape, color, clarity, price) in zip(products, STONES):
+        product.category_id = categories[category].id
+        product.shape, product.color_grade, product.clarity_grade, product.price = shape, color, clarity, price
+    db.commit()
+    return categories
+
+
+def facets(client, **params):
+    response = client.get("/api/products/facets", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def counts(entries):
+    return {entry["value"]: entry["count"] for entry in entries}
+
+
+def test_unfiltered_facets(client, db):
+    categories = seed_stones(db)
+    result = facets(client)
+
+    assert result["total"] == 5
+    assert [(c["id"], c["count"]) for c in result["categories"]] == [(categories[0].id, 3), (categories[1].id, 2)]
+    assert counts(result["shapes"]) == {"Round": 3, "Oval": 1, "Princess": 1}
+    assert [entry["value"] for entry in result["colors"]] == ["D", "F", "G"]
+    assert [bucket["count"] for bucket in result["price_ranges"]] == [1, 0, 2, 0, 1, 1]
+    assert result["price_ranges"][0] == {"min": None, "max": 1000.0, "count": 1}
+
+
+def test_each_facet_ignores_its_own_selection(client, db):
+    seed_stones(db)
+    result = facets(client, shape="Round", color="f")
+
+    assert result["total"] == 1
+    # Shapes are counted under the color selection only, colors under the shape selection only
+    assert counts(result["shapes"]) == {"Round": 1, "Oval": 1}
+    assert counts(result["colors"]) == {"D": 1, "F": 1, "G": 1}
+    assert counts(result["clarities"]) == {"VS1": 1}
+
+
+def test_facets_are_one_query_and_cached_per_normalized_filters(client, db, query_counter):
+    seed_stones(db)
+    client.get("/api/products/facets")  # settle the catalog version read
+
+    with query_counter() as statements:
+        first = facets(client, shape=["Round", "Oval"], clarity="vs1")
+    assert len(statements) == 1
+
+    with query_counter() as statements:
+        again = facets(client, shape=["Oval", "Round", "Oval"], clarity="VS1")
+    assert statements == []
+    assert again == first
+
+
+def test_product_writes_refresh_facets(client, db):
+    seed_stones(db)
+    assert facets(client)["total"] == 5
+
+    product = db.query(models.Product).first()
+    crud.update_product(db, product.id, schemas.ProductUpdate(
+        name=product.name, base_price=product.base_price, price=product.price,
+        category_id=product.category_id, is_available=False,
+    ))
+    assert facets(client)["total"] == 4
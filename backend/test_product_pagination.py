@@ -0,0 +1,71 @@
+import crud
+import models
+from conftest import seed_catalog
+
+
+def walk_pages(client, query):
+    ids, cursor, pages = [], "", 0
+    while cursor is not None:
+        response = client.get(f"/api/products?{query}&cursor={cursor}")
+        assert response.status_code == 200
+        page = response.json()
+        ids.extend(p["id"] for p in page["items"])
+        cursor = page["next_cursor"]
+        pages += 1
+    return ids, pages
+
+
+def test_cursor_walk_covers_catalog_once(client, db):
+    seed_catalog(db, products=25)
+
+    newest, pages = walk_pages(client, "limit=10&sort=newest")
+    assert pages == 3
+    # Seeded rows share a created_at second, so ties fall back to id order
+    assert newest == list(range(25, 0, -1))
+
+    by_price, _ = walk_pages(client, "limit=7&sort=price")
+    assert by_price == list(range(1, 26))
+
+
+def test_cursor_pages_do_not_shift_when_products_are_added(client, db):
+    seed_catalog(db, products=10)
+
+    first = client.get("/api/products?limit=5&sort=price&cursor=").json()
+    db.add(models.Product(name="חדש", base_price=1.0, price=1.0, category_id=1))
+    db.commit()
+    second = client.get(f"/api/products?limit=5&sort=price&cursor={first['next_cursor']}").json()
+
+    assert [p["id"] for p in first["items"]] == [1, 2, 3, 4, 5]
+    assert [p["id"] for p in second["items"]] == [6, 7, 8, 9, 10]
+
+
+def test_cursor_respects_category_filter(client, db):
+    seed_catalog(db, products=12, categories=2)
+
+    ids, _ = walk_pages(client, "limit=4&category_id=2")
+    assert ids == [12, 10, 8, 6, 4, 2]
+
+
+def test_legacy_skip_still_returns_a_list(client, db):
+    seed_catalog(db, products=5)
+
+    response = client.get("/api/products?skip=2&limit=2")
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
+    assert len(response.json()) == 2
+
+
+def test_invalid_cursor_is_rejected(client, db):
+    seed_catalog(db, products=5)
+    price_cursor = client.get("/api/products?limit=2&sort=price&cursor=").json()["next_cursor"]
+
+    assert client.get("/api/products?cursor=not-a-cursor").status_code == 400
+    assert client.get(f"/api/products?sort=newest&cursor={price_cursor}").status_code == 400
+
+
+def test_limit_is_bounded(client, db):
+    seed_catalog(db, products=3)
+
+    assert client.get("/api/products?cursor=&limit=0").status_code == 422
+    assert client.get("/api/products?limit=100000").status_code == 422
+    assert crud.get_products_page(db, cursor="", limit=0) == ([], None)
@@ -0,0 +1,81 @@
+import pytest
+
+import models
+from conftest import seed_catalog
+
+STONES = [
+    # color, clarity, cut, shape, carat, price
+    ("D", "IF", "Excellent", "Round", 1.0, 5000.0),
+    ("F", "VVS2", "Very Good", "Oval", 1.5, 4200.0),
+    ("G", "VS1", "Good", "Round", 0.7, 2100.0),
+    ("E", "SI1", "Excellent", "Princess", 2.0, 6100.0),
+    ("J", "VVS1", "Fair", "Round", 0.5, 900.0),
+    ("h", "vs2", "Poor", "Emerald", 1.2, 3000.0),
+]
+
+
+@pytest.fixture
+def stones(db):
+    seed_catalog(db, products=len(STONES), categories=1, carats=0)
+    products = db.query(models.Product).order_by(models.Product.id).all()
+    for product, (color, clarity, cut, shape, carat, price) in zip(products, STONES):
+        product.color_grade, product.clarity_grade, product.cut_grade = color, clarity, cut
+        product.shape, product.carat_weight, product.price = shape, carat, price
+    db.commit()
+    return {product.id: product for product in products}
+
+
+def search(client, **params):
+    response = client.get("/api/products/search", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_grade_ranks_follow_the_scale(stones):
+    ranks = [(p.color_rank, p.clarity_rank, p.cut_rank) for p in stones.values()]
+    assert ranks[0] == (0, 1, 0)
+    assert ranks[5] == (4, 5, 4)
+
+
+def test_grade_ranges_are_ordinal(client, stones):
+    found = search(client, color_min="D", color_max="F", clarity_max="VVS2")
+    assert sorted(p["color_grade"] for p in found) == ["D", "F"]
+
+    found = search(client, clarity_min="VS1", clarity_max="SI1", sort="clarity")
+    assert [p["clarity_grade"] for p in found] == ["VS1", "vs2", "SI1"]
+
+
+def test_set_and_numeric_filters_combine(client, stones):
+    found = search(client, shape=["Round", "Oval"], carat_min=0.6, price_max=4500, sort="price")
+    assert [(p["shape"], p["price"]) for p in found] == [("Round", 2100.0), ("Oval", 4200.0)]
+
+    found = search(client, cut=["Excellent"], color=["e"], sort="color")
+    assert [p["color_grade"] for p in found] == ["E"]
+
+
+def test_sorts_put_ungraded_products_last(client, db, stones):
+    product = next(iter(stones.values()))
+    product.color_grade = "Fancy"
+    db.commit()
+
+    found = search(client, sort="color")
+    assert found[-1]["id"] == product.id
+    assert [p["color_grade"] for p in found[:-1]] == ["E", "F", "G", "h", "J"]
+
+
+def test_unknown_grade_is_rejected(client, stones):
+    response = client.get("/api/products/search", params={"clarity_min": "VVS9"})
+    assert response.status_code == 400
+
+
+def test_paging_parameters_are_bounded(client, stones):
+    # LIMIT -1 means no limit to SQLite, and a negative skip would slice from the end on the columnar path
+    for params in ({"limit": -1}, {"limit": 0}, {"limit": 101}, {"skip": -1}):
+        assert client.get("/api/products/search", params=params).status_code == 422
+
+
+def test_search_uses_the_rank_index(db, stones):
+    plan = db.connection().exec_driver_sql(
+        "EXPLAIN QUERY PLAN SELECT id FROM products WHERE color_rank BETWEEN 0 AND 2 AND clarity_rank <= 3"
+    ).all()
+    assert any("ix_products_color_clarity_cut_rank" in row[-1] for row in plan)
@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+import crud
+import database
+import models
+import schemas
+from pool_telemetry import PoolTelemetry
+
+
+def replica_of(db, tmp_path, name="replica"):
+    """Snapshot the test database into a second SQLite file standing in for a replica"""
+    db.commit()
+    path = tmp_path / f"{name}.db"
+    source = sqlite3.connect(database.engine.url.database)
+    target = sqlite3.connect(path)
+    source.backup(target)
+    source.close()
+    target.close()
+    return database.create_read_engine(f"sqlite:///{path}", PoolTelemetry(name))
+
+
+def weights(response):
+    assert response.status_code == 200, response.text
+    return sorted(entry["carat_weight"] for entry in response.json())
+
+
+@pytest.fixture
+def replica(db, tmp_path, monkeypatch):
+    db.add(models.CaratPricing(carat_weight=1.0, price_multiplier=1.0))
+    replica_engine = replica_of(db, tmp_path)
+    # Mark the replica so reads from it can be told apart
+    with replica_engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO carat_pricing (carat_weight, price_multiplier, is_active) VALUES (9.99, 1.0, 1)"
+        )
+    replicas = database.ReplicaSet([replica_engine], sticky_seconds=0)
+    monkeypatch.setattr(database, "replicas", replicas)
+    yield replicas
+    replica_engine.dispose()
+
+
+def test_reads_use_the_replica_until_this_client_writes(client, admin_headers, replica):
+    assert weights(client.get("/api/carat-pricing")) == [1.0, 9.99]
+
+    created = client.post(
+        "/api/carat-pricing", json={"carat_weight": 2.0, "price_multiplier": 1.5}, headers=admin_headers
+    )
+    assert created.status_code == 200
+    assert "read_primary" in created.cookies
+
+    # The admin who saved reads the primary; everyone else keeps reading the replica
+    assert weights(client.get("/api/carat-pricing")) == [1.0, 2.0]
+    import main
+    assert weights(TestClient(main.app).get("/api/carat-pricing")) == [1.0, 9.99]
+
+
+def test_process_reads_its_own_writes_from_the_primary(db, replica, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(replica, "clock", lambda: clock[0])
+    replica.sticky_seconds = 5
+    assert replica.choose() is replica.engines[0]
+
+    crud.create_category(db, schemas.CategoryCreate(name="צמידים"))
+    assert replica.choose() is None
+    assert database.read_session().get_bind() is database.engine
+    clock[0] += 6
+    assert replica.choose() is replica.engines[0]
+
+
+def test_round_robin_skips_replicas_that_fail_health_checks(db, tmp_path):
+    clock = [0.0]
+    first, second = replica_of(db, tmp_path, "first"), replica_of(db, tmp_path, "second")
+    broken = create_engine(f"sqlite:///{tmp_path}/missing/replica.db")
+    replicas = database.ReplicaSet([first, broken, second], retry_seconds=30, clock=lambda: clock[0])
+
+    assert [replicas.choose() for _ in range(2)] == [first, broken]
+    # A failed connection takes the replica out of rotation
+    with pytest.raises(Exception):
+        broken.connect()
+    assert [replicas.choose() for _ in range(4)] == [second, first, second, first]
+
+    # After retry_seconds it is pinged first, and stays out while it still fails
+    clock[0] += 31
+    assert [replicas.choose() for _ in range(3)] == [second, first, second]
+    for engine in (first, second):
+        engine.dispose()
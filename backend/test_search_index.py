@@ -0,0 +1,81 @@
+import crud
+import models
+import schemas
+import search_index
+
+
+def add_product(db, name, description="", category_id=None, certificate_number=None):
+    if category_id is None:
+        category_id = crud.create_category(db, schemas.CategoryCreate(name="תכשיטים", description="")).id
+    return crud.create_product(db, schemas.ProductCreate(
+        name=name, description=description, base_price=1000.0, price=1000.0,
+        category_id=category_id, certificate_number=certificate_number,
+    ))
+
+
+def search_names(client, q, **params):
+    response = client.get("/api/products/search", params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return [product["name"] for product in response.json()]
+
+
+def test_normalize_strips_niqqud_and_folds_final_letters():
+    assert search_index.normalize("טַבַּעַת יַהֲלוֹם") == "טבעת יהלומ"
+    assert search_index.normalize('צה"ל, Round-Cut') == "צהל round cut"
+    assert search_index.terms("עגילים") == search_index.terms("עגילימ")
+
+
+def test_prefix_matches_for_type_ahead(client, db):
+    add_product(db, "טבעת יהלום סוליטר", "טבעת אירוסין קלאסית")
+    add_product(db, "עגילי יהלום", "זוג עגילים צמודים")
+
+    assert search_names(client, "טבע") == ["טבעת יהלום סוליטר"]
+    assert sorted(search_names(client, "יהל")) == ["טבעת יהלום סוליטר", "עגילי יהלום"]
+    assert search_names(client, "יַהֲלוֹם עגיל") == ["עגילי יהלום"]
+
+
+def test_category_and_certificate_are_searchable(client, db):
+    category = crud.create_category(db, schemas.CategoryCreate(name="צמידים", description=""))
+    add_product(db, "Tennis", category_id=category.id, certificate_number="IGI-LG5512")
+
+    assert search_names(client, "צמיד") == ["Tennis"]
+    assert search_names(client, "lg55") == ["Tennis"]
+
+    crud.update_category(db, category.id, schemas.CategoryUpdate(name="שרשראות"))
+    assert search_names(client, "צמיד") == []
+    assert search_names(client, "שרשר") == ["Tennis"]
+
+    crud.delete_category(db, category.id)
+    assert search_names(client, "שרשר") == []
+
+
+def test_index_follows_product_writes(client, db):
+    product = add_product(db, "תליון לב")
+    crud.update_product(db, product.id, schemas.ProductUpdate(
+        name="תליון כוכב", base_price=1000.0, price=1000.0, category_id=product.category_id
+    ))
+    assert search_names(client, "לב") == []
+    assert search_names(client, "כוכב") == ["תליון כוכב"]
+
+    crud.delete_product(db, product.id)
+    assert search_names(client, "תליון") == []
+
+
+def test_name_matches_rank_above_description_matches(client, db):
+    add_product(db, "שרשרת זהב", "עם יהלום קטן")
+    add_product(db, "יהלום מעבדה", "אבן בודדת")
+
+    assert search_names(client, "יהלום") == ["יהלום מעבדה", "שרשרת זהב"]
+    # An explicit sort overrides relevance (equal prices fall back to id order)
+    assert search_names(client, "יהלום", sort="price") == ["שרשרת זהב", "יהלום מעבדה"]
+
+
+def test_rebuild_indexes_rows_written_outside_crud(client, db):
+    add_product(db, "טבעת")
+    category_id = db.query(models.Category.id).scalar()
+    db.add(models.Product(name="עגיל חישוק", base_price=1.0, price=1.0, category_id=category_id))
+    db.commit()
+    assert search_names(client, "חישוק") == []
+
+    assert search_index.rebuild(db) == 2
+    assert search_names(client, "חישוק") == ["עגיל חישוק"]
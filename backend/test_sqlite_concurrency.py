@@ -0,0 +1,135 @@
+"""Concurrent admin writes while readers stream the catalog, on SQLite"""
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, exc, select, text
+from sqlalchemy.orm import sessionmaker
+
+import database
+import models
+from pool_telemetry import PoolTelemetry
+
+BUSY_TIMEOUT_MS = 300
+WRITERS = 4
+WRITES_PER_WRITER = 10
+
+
+def legacy_sessions(url):
+    """The engine as configured before the SQLite profile: rollback journal, plain pysqlite"""
+    engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT_MS / 1000})
+    return engine, sessionmaker(bind=engine, autoflush=False)
+
+
+def profile_sessions(url, monkeypatch):
+    monkeypatch.setattr(database, "SQLITE_BUSY_TIMEOUT_MS", BUSY_TIMEOUT_MS)
+    telemetry = {"primary": PoolTelemetry("primary"), "writer": PoolTelemetry("writer")}
+    engine, writer_engine = database.create_engines(url, telemetry)
+    return engine, database.session_factory(engine, writer_engine)
+
+
+def stress(engine, sessions):
+    """Writers bump prices while readers stream the catalog row by row.
+
+    Returns the writers' lock errors, the readers' lock errors and the final prices.
+    """
+    models.Base.metadata.create_all(bind=engine)
+    db = sessions()
+    category = models.Category(name="טבעות")
+    db.add(category)
+    db.flush()
+    db.add_all([
+        models.Product(name=f"יהלום {i}", base_price=100.0, price=100.0, category_id=category.id)
+        for i in range(10)
+    ])
+    db.commit()
+    product_ids = [row.id for row in db.query(models.Product.id).order_by(models.Product.id)]
+    db.close()
+
+    errors = []
+    read_errors = []
+    done = threading.Event()
+
+    def reader():
+        # Long streaming reads, like warming the snapshot or an export, keep a cursor open
+        while not done.is_set():
+            session = sessions()
+            try:
+                for _ in session.execute(select(models.Product.id).execution_options(yield_per=1)):
+                    time.sleep(0.05)
+            except exc.OperationalError as error:
+                # A reader that died here would leave the writers without contention
+                read_errors.append(error)
+            finally:
+                session.close()
+
+    def writer(product_id):
+        for _ in range(WRITES_PER_WRITER):
+            session = sessions()
+            try:
+                product = session.get(models.Product, product_id)
+                product.price += 1
+                session.commit()
+            except exc.OperationalError as error:
+                errors.append(error)
+                session.rollback()
+            finally:
+                session.close()
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    writers = [threading.Thread(target=writer, args=(product_id,)) for product_id in product_ids[:WRITERS]]
+    for thread in readers:
+        thread.start()
+    time.sleep(0.1)
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    with engine.connect() as connection:
+        prices = connection.execute(
+            select(models.Product.price).where(models.Product.id.in_(product_ids[:WRITERS]))
+        ).scalars().all()
+    return errors, read_errors, prices
+
+
+def test_legacy_engine_reports_database_is_locked(tmp_path):
+    engine, sessions = legacy_sessions(f"sqlite:///{tmp_path}/legacy.db")
+    errors, read_errors, _ = stress(engine, sessions)
+    engine.dispose()
+    assert errors or read_errors
+    assert all("database is locked" in str(error) for error in errors + read_errors)
+
+
+def test_production_profile_serializes_writers_without_lock_errors(tmp_path, monkeypatch):
+    engine, sessions = profile_sessions(f"sqlite:///{tmp_path}/profile.db", monkeypatch)
+    errors, read_errors, prices = stress(engine, sessions)
+
+    assert errors == []
+    assert read_errors == []
+    assert prices == [100.0 + WRITES_PER_WRITER] * WRITERS
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == BUSY_TIMEOUT_MS
+    engine.dispose()
+
+
+@pytest.mark.skipif(database.writer_engine is None, reason="SQLite profile not active")
+def test_transactions_stay_on_the_writer_from_their_first_write(db):
+    assert db.get_bind() is database.engine
+    db.add(models.Category(name="עגילים"))
+    db.flush()
+    # Reads after the write see it because they share the writer connection
+    assert db.get_bind() is database.writer_engine
+    assert db.query(models.Category).filter(models.Category.name == "עגילים").count() == 1
+    db.commit()
+    assert db.get_bind() is database.engine
+
+    db.execute(text("UPDATE categories SET description = 'x'"))
+    assert db.get_bind() is database.writer_engine
+    db.rollback()
+    assert db.get_bind() is database.engine
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import precompress
+import static_files
+
+BUNDLE = b"console.log('diamonds');\n" * 200
+
+
+@pytest.fixture
+def build(tmp_path):
+    (tmp_path / "js").mkdir()
+    (tmp_path / "js" / "main.1a2b3c4d.js").write_bytes(BUNDLE)
+    (tmp_path / "manifest.json").write_bytes(b'{"name": "Diamond Lab"}')
+    (tmp_path / "video.mp4").write_bytes(bytes(range(256)) * 4)
+    return tmp_path
+
+
+def client_for(directory, **kwargs):
+    return TestClient(static_files.CachedStaticFiles(directory=directory, immutable=static_files.FINGERPRINTED, **kwargs))
+
+
+def test_fingerprinted_files_are_immutable(build):
+    client = client_for(build)
+    assert client.get("/js/main.1a2b3c4d.js").headers["cache-control"] == static_files.IMMUTABLE
+    assert "cache-control" not in client.get("/manifest.json").headers
+
+
+def test_precompressed_siblings_are_served_when_accepted(build):
+    written, _ = precompress.precompress(build)
+    # The manifest is below the size threshold
+    assert (build / "js" / "main.1a2b3c4d.js.gz").exists() and not (build / "manifest.json.gz").exists()
+    assert written >= 1
+    client = client_for(build)
+
+    response = client.get("/js/main.1a2b3c4d.js", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith(("application/javascript", "text/javascript"))
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(BUNDLE)
+    assert response.content == BUNDLE  # decoded by the client
+
+    identity = client.get("/js/main.1a2b3c4d.js", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "content-encoding" not in identity.headers and identity.content == BUNDLE
+
+    # A sibling older than its file is stale and ignored
+    os.utime(build / "js" / "main.1a2b3c4d.js.gz", (0, 0))
+    stale = client.get("/js/main.1a2b3c4d.js", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in stale.headers
+
+
+def test_byte_ranges(build):
+    client = client_for(build)
+    data = (build / "video.mp4").read_bytes()
+
+    response = client.get("/video.mp4", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 10-19/{len(data)}"
+    assert response.content == data[10:20]
+    assert client.get("/video.mp4", headers={"Range": "bytes=-5"}).content == data[-5:]
+    assert client.get("/video.mp4", headers={"Range": "bytes=1000-"}).content == data[1000:]
+
+    unsatisfiable = client.get("/video.mp4", headers={"Range": "bytes=5000-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{len(data)}"
+
+    full = client.get("/video.mp4", headers={"Range": "bytes=0-1, 5-6"})
+    assert full.status_code == 200 and full.headers["accept-ranges"] == "bytes"
+    stale = client.get("/video.mp4", headers={"Range": "bytes=0-1", "If-Range": '"old"'})
+    assert stale.status_code == 200 and stale.content == data
+
+
+def test_accepted_encodings():
+    assert static_files.accepted_encodings("gzip, deflate, br;q=0.5") == {"gzip", "deflate", "br"}
+    assert static_files.accepted_encodings("br;q=0, gzip") == {"gzip"}
+    assert static_files.accepted_encodings(None) == set()
@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import crud
+import image_variants
+import main
+import models
+import schemas
+import static_files
+import uploads
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 1024
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "uploads_dir", tmp_path)
+    monkeypatch.setattr(uploads, "UPLOAD_ROOT", tmp_path)
+    # These bodies are not real images; renditions are covered in test_image_variants.py
+    monkeypatch.setattr(image_variants, "IMAGE_VARIANTS_ENABLED", False)
+    return tmp_path
+
+
+def stored_files(directory):
+    return sorted(path.relative_to(directory).as_posix() for path in directory.rglob("*") if path.is_file())
+
+
+def test_upload_is_written_in_chunks_under_its_content_hash(client, admin_headers, upload_dir, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_CHUNK_SIZE", 100)
+    response = client.post("/api/upload", files={"file": ("ring.PNG", PNG, "image/png")}, headers=admin_headers)
+    assert response.status_code == 200
+    body = response.json()
+    digest = hashlib.sha256(PNG).hexdigest()
+    assert body["filename"] == f"{digest[:2]}/{digest[2:4]}/{digest}.png"
+    assert body["url"] == f"/uploads/{body['filename']}" and body["sha256"] == digest
+    assert not body["deduplicated"]
+    assert stored_files(upload_dir) == [body["filename"]]
+    assert (upload_dir / body["filename"]).read_bytes() == PNG
+
+
+def test_upload_validation(client, admin_headers, upload_dir):
+    def upload(content, content_type="image/png"):
+        return client.post("/api/upload", files={"file": ("a.png", content, content_type)}, headers=admin_headers)
+
+    assert upload(PNG, "application/pdf").status_code == 400
+    assert upload(b"").json()["detail"] == "קובץ ריק"
+    # Fits the request cap, so the per-file limit stops the copy part way
+    response = upload(b"\x00" * (uploads.MAX_FILE_SIZE + 1))
+    assert response.status_code == 400
+    assert response.json()["detail"] == "קובץ גדול מדי. מקסימום 5MB"
+    assert list(upload_dir.iterdir()) == []
+    assert client.post("/api/upload", files={"file": ("a.png", PNG, "image/png")}).status_code == 403
+
+
+def test_oversized_requests_are_refused_before_the_body_is_read(client, admin_headers, upload_dir):
+    content = b"\x00" * (uploads.MAX_FILE_SIZE + uploads.MULTIPART_OVERHEAD_BYTES)
+    response = client.post("/api/upload", files={"file": ("a.png", content, "image/png")}, headers=admin_headers)
+    assert response.status_code == 413
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_chunked_request_bodies_are_counted_while_streaming(admin_headers, upload_dir):
+    sent = []
+
+    async def body():
+        # A multipart body that never ends; no Content-Length is sent
+        yield b"--boundary\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.png\"\r\n"
+        yield b"Content-Type: image/png\r\n\r\n"
+        while True:
+            chunk = b"\x00" * (256 * 1024)
+            sent.append(len(chunk))
+            yield chunk
+
+    async def post():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/api/upload", content=body(),
+                headers={**admin_headers, "Content-Type": "multipart/form-data; boundary=boundary"},
+            )
+
+    response = asyncio.run(post())
+    assert response.status_code == 413
+    assert sum(sent) <= uploads.MAX_FILE_SIZE + uploads.MULTIPART_OVERHEAD_BYTES + 256 * 1024
+
+
+def test_batch_upload(client, admin_headers, upload_dir):
+    files = [("files", (f"{i}.png", PNG + bytes([i]), "image/png")) for i in range(5)]
+    response = client.post("/api/upload/batch", files=files, headers=admin_headers)
+    assert response.status_code == 200
+    saved = response.json()["files"]
+    assert [(upload_dir / entry["filename"]).read_bytes()[-1] for entry in saved] == list(range(5))
+    assert len(stored_files(upload_dir)) == 5
+
+
+@pytest.mark.parametrize("bad_file", [
+    ("bad.pdf", b"%PDF", "application/pdf"),
+    ("big.png", b"\x00" * (uploads.MAX_FILE_SIZE + 1), "image/png"),
+], ids=["content type", "size"])
+def test_batch_upload_keeps_nothing_when_a_file_fails(client, admin_headers, upload_dir, bad_file):
+    files = [("files", ("ok.png", PNG, "image/png")), ("files", bad_file), ("files", ("ok2.png", PNG, "image/png"))]
+    response = client.post("/api/upload/batch", files=files, headers=admin_headers)
+    assert response.status_code == 400
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_batch_upload_limits_the_file_count(client, admin_headers, upload_dir, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_FILES_PER_REQUEST", 2)
+    files = [("files", (f"{i}.png", PNG, "image/png")) for i in range(3)]
+    assert client.post("/api/upload/batch", files=files, headers=admin_headers).status_code == 400
+
+
+def test_identical_uploads_are_stored_once(client, admin_headers, upload_dir):
+    def upload(name):
+        return client.post("/api/upload", files={"file": (name, PNG, "image/png")}, headers=admin_headers).json()
+
+    first, second = upload("a.png"), upload("b.png")
+    assert second["url"] == first["url"] and second["deduplicated"]
+    assert stored_files(upload_dir) == [first["filename"]]
+
+
+def test_files_are_collected_with_their_last_reference(client, db, admin_headers, upload_dir, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_GC_GRACE_SECONDS", 0)
+    url = client.post("/api/upload", files={"file": ("a.png", PNG, "image/png")}, headers=admin_headers).json()["url"]
+    legacy = upload_dir / "legacy.png"
+    legacy.write_bytes(PNG)
+    category = models.Category(name="טבעות")
+    db.add(category)
+    db.commit()
+    product = models.Product(name="טבעת", base_price=1.0, price=1.0, category_id=category.id, image_url="/uploads/legacy.png")
+    db.add(product)
+    db.commit()
+    images = [models.ProductImage(product_id=product.id, image_url=url) for _ in range(2)]
+    db.add_all(images)
+    db.add(models.ProductVariant(product_id=product.id, color_name="זהב", color_code="#ffd700", images=[url]))
+    db.commit()
+    path = upload_dir / url.removeprefix("/uploads/")
+    assert uploads.reference_counts(db, [url]) == {url: 3}
+
+    image_id = images[0].id
+    assert client.delete(f"/api/products/{product.id}/images/{image_id}", headers=admin_headers).status_code == 200
+    assert path.exists()
+    assert client.delete(f"/api/products/{product.id}", headers=admin_headers).status_code == 200
+    assert not path.exists() and stored_files(upload_dir) == ["legacy.png"]
+
+
+def test_replaced_images_are_released(client, db, admin_headers, upload_dir, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_GC_GRACE_SECONDS", 0)
+
+    def upload(content):
+        return client.post("/api/upload", files={"file": ("a.png", content, "image/png")}, headers=admin_headers).json()["url"]
+
+    hero, banner, photo, swatch, kept = (upload(PNG + bytes([i])) for i in range(5))
+    category = crud.create_category(db, schemas.CategoryCreate(name="טבעות", image_url=banner, hero_image_url=hero))
+    product = crud.create_product(db, schemas.ProductCreate(
+        name="טבעת", base_price=1.0, price=1.0, category_id=category.id, image_url=photo,
+    ))
+    variant = crud.create_product_variant(db, schemas.ProductVariantCreate(
+        product_id=product.id, color_name="זהב", color_code="#ffd700", images=[swatch, kept],
+    ))
+
+    crud.update_product(db, product.id, schemas.ProductUpdate(
+        name="טבעת", base_price=1.0, price=1.0, category_id=category.id, image_url=kept,
+    ))
+    crud.update_product_variant(db, variant.id, schemas.ProductVariantCreate(
+        product_id=product.id, color_name="זהב", color_code="#ffd700", images=[kept],
+    ))
+    crud.update_category(db, category.id, schemas.CategoryUpdate(name="טבעות", hero_image_url=None))
+    assert {uploads.stored_path(url, upload_dir).exists() for url in (hero, photo, swatch)} == {False}
+    assert uploads.stored_path(banner, upload_dir).exists() and uploads.stored_path(kept, upload_dir).exists()
+
+    crud.delete_product(db, product.id)
+    crud.delete_category(db, category.id)
+    assert stored_files(upload_dir) == []
+
+
+def test_garbage_collection_keeps_recent_and_referenced_uploads(client, db, admin_headers, upload_dir, monkeypatch):
+    def upload(content):
+        return client.post("/api/upload", files={"file": ("a.png", content, "image/png")}, headers=admin_headers).json()
+
+    kept, orphan = upload(PNG), upload(PNG + b"\x01")
+    db.add(models.Category(name="טבעות", image_url=kept["url"]))
+    db.commit()
+    assert client.post("/api/admin/uploads/gc", headers=admin_headers).json()["count"] == 0
+
+    monkeypatch.setattr(uploads, "UPLOAD_GC_GRACE_SECONDS", 0)
+    assert client.post("/api/admin/uploads/gc", headers=admin_headers).json()["removed"] == [orphan["url"]]
+    assert stored_files(upload_dir) == [kept["filename"]]
+
+
+def test_files_released_inside_the_grace_period_are_swept_later(client, db, admin_headers, upload_dir, monkeypatch):
+    url = client.post("/api/upload", files={"file": ("a.png", PNG, "image/png")}, headers=admin_headers).json()["url"]
+    category = models.Category(name="טבעות")
+    db.add(category)
+    db.flush()
+    product = models.Product(name="טבעת", base_price=1.0, price=1.0, category_id=category.id)
+    db.add(product)
+    db.flush()
+    image = models.ProductImage(product_id=product.id, image_url=url)
+    db.add(image)
+    db.commit()
+    path = uploads.stored_path(url, upload_dir)
+
+    # Attached and dropped again within the grace period: release() leaves it
+    assert client.delete(f"/api/products/{product.id}/images/{image.id}", headers=admin_headers).status_code == 200
+    assert path.exists()
+
+    monkeypatch.setattr(uploads, "UPLOAD_GC_GRACE_SECONDS", 0)
+
+    async def sweep_until_collected():
+        sweeper = asyncio.create_task(uploads.collect_garbage_periodically(upload_dir, interval=0.01))
+        try:
+            for _ in range(500):
+                if not path.exists():
+                    return
+                await asyncio.sleep(0.01)
+        finally:
+            sweeper.cancel()
+
+    asyncio.run(sweep_until_collected())
+    assert stored_files(upload_dir) == []
+
+
+def test_content_addressed_files_are_served_as_immutable(tmp_path):
+    digest = hashlib.sha256(PNG).hexdigest()
+    (tmp_path / digest[:2] / digest[2:4]).mkdir(parents=True)
+    (tmp_path / digest[:2] / digest[2:4] / f"{digest}.png").write_bytes(PNG)
+    (tmp_path / "12345678-1234-4234-8234-123456789abc.jpg").write_bytes(PNG)
+    (tmp_path / "banner.png").write_bytes(PNG)
+    client = TestClient(static_files.CachedStaticFiles(directory=tmp_path, immutable=uploads.IMMUTABLE_PATHS))
+
+    response = client.get(f"/{digest[:2]}/{digest[2:4]}/{digest}.png")
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert client.get("/12345678-1234-4234-8234-123456789abc.jpg").headers["cache-control"] == static_files.IMMUTABLE
+    assert "cache-control" not in client.get("/banner.png").headers
+
+
+def test_renditions_are_removed_with_their_own_original_only(client, db, admin_headers, upload_dir, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_GC_GRACE_SECONDS", 0)
+
+    def upload(content_type):
+        return client.post("/api/upload", files={"file": ("a", PNG, content_type)}, headers=admin_headers).json()["url"]
+
+    # The same bytes stored as two originals; rendition names carry the extension
+    png, webp = upload("image/png"), upload("image/webp")
+    (upload_dir / "derived").mkdir()
+    renditions = {}
+    for url in (png, webp):
+        name = url.rsplit("/", 1)[1].replace(".", "-") + "-320.webp"
+        renditions[url] = upload_dir / "derived" / name
+        renditions[url].write_bytes(b"webp")
+        db.add(models.ImageManifest(original_url=url, width=640, height=480,
+                                    variants=[{"width": 320, "url": f"/uploads/derived/{name}"}]))
+    db.commit()
+
+    assert uploads.release(db, [png]) == [png]
+    assert not renditions[png].exists() and renditions[webp].exists()
@@ -0,0 +1,339 @@
+"""Non-blocking, content-addressed image uploads
+
+Starlette spools a multipart body into temporary files before the route runs,
+so the size limits are enforced at two points:
+
+- UploadLimitMiddleware caps the whole request body of the upload routes while
+  it is received: a too large Content-Length is refused before anything is
+  read, and bodies without one are counted chunk by chunk. An oversized
+  request never gets spooled.
+- save_upload() copies each file in UPLOAD_CHUNK_SIZE chunks with aiofiles,
+  enforcing the per-file limit and hashing the bytes as it goes. The file is
+  written to a ".part" name and renamed once complete, so a half-written
+  file is never served, and the event loop is free between chunks.
+
+Files are stored by content: uploads/<h[0:2]>/<h[2:4]>/<sha256><ext>. The same
+photo uploaded for five variants is stored once under one URL, and since a
+URL never changes content it is served with an immutable Cache-Control
+(IMMUTABLE_PATHS).
+
+A stored file is referenced by the rows that hold its URL: product images,
+variant image lists, and product and category images. reference_counts()
+counts those rows. When crud deletes rows or replaces their images, release()
+removes the files (and their WebP renditions) that no row references any more. collect_garbage()
+sweeps the whole store, e.g. for uploads that were never attached or files
+release() skipped. Files touched within UPLOAD_GC_GRACE_SECONDS are kept, so
+an upload is safe until the form that uploaded it saves its row; uploading
+the same content again renews that grace. Each worker runs the sweep every
+UPLOAD_GC_INTERVAL_SECONDS (collect_garbage_periodically()), so a file
+released inside its grace period is still collected once the grace is over.
+
+save_uploads() saves a batch concurrently, at most UPLOAD_BATCH_CONCURRENCY
+files at a time, and keeps either all of the files or none.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import aiofiles
+import aiofiles.os
+from decouple import Csv, config
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from sqlalchemy import String, cast, or_
+from sqlalchemy.orm import Session
+
+import image_srcsets
+import models
+from database import SessionLocal
+from image_variants import DERIVED_DIR, UPLOADS_URL
+
+MAX_FILE_SIZE = config('MAX_FILE_SIZE', default=5 * 1024 * 1024, cast=int)
+MAX_FILES_PER_REQUEST = config('MAX_FILES_PER_REQUEST', default=10, cast=int)
+ALLOWED_FILE_TYPES = config(
+    'ALLOWED_FILE_TYPES', default='image/jpeg,image/png,image/gif,image/webp', cast=Csv(post_process=set)
+)
+UPLOAD_CHUNK_SIZE = config('UPLOAD_CHUNK_SIZE', default=64 * 1024, cast=int)
+UPLOAD_BATCH_CONCURRENCY = config('UPLOAD_BATCH_CONCURRENCY', default=4, cast=int)
+UPLOAD_GC_GRACE_SECONDS = config('UPLOAD_GC_GRACE_SECONDS', default=3600, cast=float)
+UPLOAD_GC_INTERVAL_SECONDS = config('UPLOAD_GC_INTERVAL_SECONDS', default=3600, cast=float)
+# Room for multipart boundaries and part headers on top of the file bytes
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+UPLOAD_ROOT = Path("uploads")
+EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif', 'image/webp': '.webp'}
+# Paths under uploads/ whose content never changes: stored originals and their renditions
+CONTENT_ADDRESSED = re.compile(rf"^(?:[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{64}}\.\w+|{DERIVED_DIR}/[0-9a-f]{{64}}(?:-\w+)?-\d+\.webp)$")
+# Legacy uploads got a fresh uuid4 name each, so they never change either
+IMMUTABLE_PATHS = re.compile(
+    rf"{CONTENT_ADDRESSED.pattern}|^[0-9a-f]{{8}}-(?:[0-9a-f]{{4}}-){{3}}[0-9a-f]{{12}}\.\w+$"
+)
+ORIGINAL = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$")
+
+_utime = aiofiles.os.wrap(os.utime)
+
+logger = logging.getLogger(__name__)
+
+
+def content_path(digest: str, extension: str) -> Path:
+    """Where a file with this sha256 is stored, relative to the upload root"""
+    return Path(digest[:2]) / digest[2:4] / f"{digest}{extension}"
+
+
+def stored_path(url: Optional[str], directory: Optional[Path] = None) -> Optional[Path]:
+    """File of a content-addressed upload URL; None for any other URL (legacy uploads are never collected)"""
+    if not url or not url.startswith(UPLOADS_URL) or not ORIGINAL.match(url[len(UPLOADS_URL):]):
+        return None
+    return (directory or UPLOAD_ROOT) / url[len(UPLOADS_URL):]
+
+
+def too_large_detail(max_bytes: int = MAX_FILE_SIZE):
+    return f"קובץ גדול מדי. מקסימום {max_bytes // (1024 * 1024)}MB"
+
+
+def check_content_type(file: UploadFile):
+    if file.content_type not in ALLOWED_FILE_TYPES:
+        raise HTTPException(status_code=400, detail="סוג קובץ לא נתמך. יש להעלות תמונות בלבד")
+
+
+async def _remove(path: Path):
+    with contextlib.suppress(FileNotFoundError):
+        await aiofiles.os.remove(path)
+
+
+async def save_upload(file: UploadFile, directory: Optional[Path] = None, max_bytes: int = MAX_FILE_SIZE):
+    """Store an uploaded image by content; returns its url, path, hash and whether it already existed"""
+    check_content_type(file)
+    directory = directory or UPLOAD_ROOT
+    extension = EXTENSIONS.get(file.content_type) or os.path.splitext(file.filename or '')[1].lower()
+    partial_path = directory / f".{uuid.uuid4().hex}.part"
+
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        async with aiofiles.open(partial_path, "wb") as buffer:
+            # UploadFile.read() moves to the threadpool once the spool is on disk
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=400, detail=too_large_detail(max_bytes))
+                digest.update(chunk)
+                await buffer.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="קובץ ריק")
+
+        relative = content_path(digest.hexdigest(), extension)
+        file_path = directory / relative
+        deduplicated = await aiofiles.os.path.exists(file_path)
+        if deduplicated:
+            await _remove(partial_path)
+            # Renew the grace period so garbage collection leaves it alone until it is referenced
+            await _utime(file_path)
+        else:
+            await aiofiles.os.makedirs(file_path.parent, exist_ok=True)
+            await aiofiles.os.replace(partial_path, file_path)
+    except HTTPException:
+        await _remove(partial_path)
+        raise
+    except Exception as e:
+        await _remove(partial_path)
+        raise HTTPException(status_code=500, detail=f"שגיאה בשמירת הקובץ: {str(e)}")
+
+    return {
+        "url": f"{UPLOADS_URL}{relative.as_posix()}",
+        "filename": relative.as_posix(),
+        "sha256": digest.hexdigest(),
+        "deduplicated": deduplicated,
+    }
+
+
+async def save_uploads(files: List[UploadFile], directory: Optional[Path] = None, max_bytes: int = MAX_FILE_SIZE):
+    """Save several uploads concurrently; on any failure the saved ones are removed"""
+    if len(files) > MAX_FILES_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"ניתן להעלות עד {MAX_FILES_PER_REQUEST} קבצים בבת אחת")
+    # Refuse the whole batch before writing anything
+    for file in files:
+        check_content_type(file)
+
+    slots = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+
+    async def save(file):
+        async with slots:
+            return await save_upload(file, directory, max_bytes)
+
+    results = await asyncio.gather(*(save(file) for file in files), return_exceptions=True)
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        for result in results:
+            # Files that were already stored belong to someone else
+            if not isinstance(result, BaseException) and not result["deduplicated"]:
+                path = (directory or UPLOAD_ROOT) / result["filename"]
+                await _remove(path)
+                for parent in (path.parent, path.parent.parent):
+                    # Shard directories go once empty
+                    with contextlib.suppress(OSError):
+                        await aiofiles.os.rmdir(parent)
+        raise failures[0]
+    return results
+
+
+class UploadLimitMiddleware:
+    """Refuse upload requests whose body exceeds the limit for their path, while it streams in"""
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits  # path -> max body bytes
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            response = JSONResponse({"detail": "הבקשה גדולה מדי"}, status_code=413, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised while the route parses the form; FastAPI passes HTTPException through
+                    raise HTTPException(status_code=413, detail="הבקשה גדולה מדי")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def body_limits(single_path: str, batch_path: str):
+    """Request body caps for the single and the batch upload routes"""
+    return {
+        single_path: MAX_FILE_SIZE + MULTIPART_OVERHEAD_BYTES,
+        batch_path: MAX_FILES_PER_REQUEST * (MAX_FILE_SIZE + MULTIPART_OVERHEAD_BYTES),
+    }
+
+
+def reference_counts(db: Session, urls: Iterable[str]) -> dict:
+    """Number of rows referencing each of `urls`"""
+    urls = set(urls)
+    counts = dict.fromkeys(urls, 0)
+    if not urls:
+        return counts
+    columns = (
+        models.ProductImage.image_url,
+        models.Product.image_url,
+        models.Category.image_url,
+        models.Category.hero_image_url,
+    )
+    for column in columns:
+        for (url,) in db.query(column).filter(column.in_(urls)):
+            counts[url] += 1
+    # Variant images are a JSON list: narrow down by text, then count exact entries
+    images = cast(models.ProductVariant.images, String)
+    for (variant_images,) in db.query(models.ProductVariant.images).filter(
+        or_(*(images.contains(url) for url in urls))
+    ):
+        for url in variant_images or []:
+            if url in counts:
+                counts[url] += 1
+    return counts
+
+
+def _remove_stored(db: Session, url: str, path: Path, directory: Path):
+    """Delete a stored original, its renditions and its manifest"""
+    manifest = db.query(models.ImageManifest).filter(models.ImageManifest.original_url == url).first()
+    renditions = {variant["url"] for variant in manifest.variants} if manifest else set()
+    if manifest is not None:
+        db.delete(manifest)
+        db.commit()
+    image_srcsets.manifests.discard(url)
+    for rendition in renditions:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(directory / rendition[len(UPLOADS_URL):])
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+    for parent in (path.parent, path.parent.parent):
+        # Shard directories go once empty
+        with contextlib.suppress(OSError):
+            parent.rmdir()
+
+
+def release(db: Session, urls: Iterable[Optional[str]], directory: Optional[Path] = None,
+            grace_seconds: Optional[float] = None) -> List[str]:
+    """Remove stored files among `urls` that no row references any more; returns the removed urls.
+
+    Call after the commit that dropped the references.
+    """
+    directory = directory or UPLOAD_ROOT
+    grace_seconds = UPLOAD_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    paths = {url: path for url in set(urls) if (path := stored_path(url, directory)) is not None}
+    if not paths:
+        return []
+    counts = reference_counts(db, paths)
+    cutoff = time.time() - grace_seconds
+    removed = []
+    for url, path in sorted(paths.items()):
+        if counts[url]:
+            continue
+        try:
+            if path.stat().st_mtime > cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        try:
+            _remove_stored(db, url, path, directory)
+        except Exception as error:
+            # The rows are gone either way; a later sweep retries the file
+            db.rollback()
+            logger.warning("Could not remove stored upload %s: %s", url, error)
+            continue
+        removed.append(url)
+    return removed
+
+
+def collect_garbage(db: Session, directory: Optional[Path] = None, grace_seconds: Optional[float] = None) -> List[str]:
+    """Sweep the whole store for files no row references"""
+    directory = directory or UPLOAD_ROOT
+    urls = [
+        f"{UPLOADS_URL}{path.relative_to(directory).as_posix()}"
+        for path in directory.glob("??/??/*")
+        if ORIGINAL.match(path.relative_to(directory).as_posix())
+    ]
+    return release(db, urls, directory, grace_seconds)
+
+
+def _sweep(directory: Optional[Path]) -> List[str]:
+    db = SessionLocal()
+    try:
+        return collect_garbage(db, directory)
+    finally:
+        db.close()
+
+
+async def collect_garbage_periodically(directory: Optional[Path] = None, interval: float = UPLOAD_GC_INTERVAL_SECONDS):
+    """Run collect_garbage() every `interval` seconds; runs until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await asyncio.to_thread(_sweep, directory)
+        except Exception as error:
+            # Another worker sweeping at the same time, a locked database...: the next round retries
+            logger.warning("Upload garbage collection failed: %s", error)
+            continue
+        if removed:
+            logger.info("Collected %d unreferenced uploads", len(removed))
@@ -269,6 +269,9 @@ setup_react_frontend() {
         export REACT_APP_API_URL=https://$DOMAIN/api
         npm run build
     "
+
+    # Precompress the build (stdlib only; a failure leaves the build served uncompressed)
+    sudo -u $APP_USER python3 ../backend/precompress.py build || print_warning "Could not precompress the build; serving it uncompressed"
     
     # Copy build to backend static directory
     sudo -u $APP_USER mkdir -p ../backend/static
@@ -292,6 +295,7 @@ WorkingDirectory=$APP_DIR/source/backend
 Environment=PATH=$APP_DIR/source/backend/venv/bin
 Environment=DATABASE_URL=sqlite:///$APP_DIR/data/diamond_store_production.db
 EnvironmentFile=$APP_DIR/source/backend/.env.production
+Environment=WEB_CONCURRENCY=4
 ExecStart=$APP_DIR/source/backend/venv/bin/gunicorn main:app --bind 127.0.0.1:$PORT --workers 4 --worker-class uvicorn.workers.UvicornWorker --access-logfile $APP_DIR/logs/access.log --error-logfile $APP_DIR/logs/error.log --log-level info
 ExecReload=/bin/kill -s HUP \$MAINPID
 Restart=always
@@ -481,6 +485,7 @@ alembic upgrade head
 cd ../frontend
 npm install
 npm run build
+python3 ../backend/precompress.py build || echo "Could not precompress the build; serving it uncompressed"
 sudo cp -r build/* ../backend/static/
 sudo systemctl restart diamond-store
 sudo systemctl reload nginx
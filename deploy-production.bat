@@ -34,6 +34,11 @@ if %errorlevel% neq 0 (
     pause
     exit /b 1
 )
+:: Precompressed .br/.gz siblings (stdlib only); a failure leaves the build uncompressed
+python ..\backend\precompress.py build
+if %errorlevel% neq 0 (
+    echo Warning: Could not precompress the frontend build
+)
 
 :: Copy built frontend to backend static directory
 echo [5/8] Copying Frontend Build to Backend...
@@ -84,6 +89,7 @@ echo echo Starting Diamond Lab Store Production Server...
 echo cd /d "%~dp0"
 echo call venv\Scripts\activate
 echo set PYTHONPATH=%cd%
+echo set WEB_CONCURRENCY=4
 echo gunicorn main:app --host 0.0.0.0 --port 8001 --workers 4 --worker-class uvicorn.workers.UvicornWorker --access-logfile - --error-logfile - --log-level info
 echo pause
 ) > start-production.bat
@@ -2,7 +2,7 @@ import React, { memo, useCallback, useMemo } from 'react';
 import { Heart, ShoppingCart, Eye } from 'lucide-react';
 import MemoizedLink from './MemoizedLink';
 import StarRating from './StarRating';
-import { getFullImageUrl } from '../utils/imageUtils';
+import { getFullImageUrl, getFullSrcSet } from '../utils/imageUtils';
 
 // Memoized Product Card Component
 const OptimizedProductCard = memo(({ 
@@ -26,6 +26,12 @@ const OptimizedProductCard = memo(({
     return getFullImageUrl(product.image_url);
   }, [product.images, product.image_url]);
 
+  // Resized WebP renditions of the first image, once the backend has generated them
+  const imageSrcSet = useMemo(() => {
+    const firstImage = product.images && product.images[0];
+    return firstImage && typeof firstImage !== 'string' ? getFullSrcSet(firstImage.srcset) : undefined;
+  }, [product.images]);
+
   // Memoize formatted price
   const formattedPrice = useMemo(() => {
     return product.price ? `₪${(product.price || 0).toLocaleString()}` : 'מחיר לא זמין';
@@ -58,6 +64,8 @@ const OptimizedProductCard = memo(({
         <div className="relative aspect-square overflow-hidden bg-gray-50">
           <img
             src={imageUrl}
+            srcSet={imageSrcSet}
+            sizes="(min-width: 1024px) 25vw, (min-width: 640px) 50vw, 100vw"
             alt={product.name}
             className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300"
             loading="lazy"
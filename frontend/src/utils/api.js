@@ -101,9 +101,14 @@ export const apiConfig = {
 // Product-specific API functions
 export const getProduct = (id) => apiGet(`/api/products/${id}`);
 export const getProducts = (params = {}) => apiGet('/api/products', { params });
+export const searchProducts = (params = {}) =>
+  apiGet('/api/products/search', { params, paramsSerializer: { indexes: null } });
+export const getProductFacets = (params = {}) =>
+  apiGet('/api/products/facets', { params, paramsSerializer: { indexes: null } });
 export const getProductPrice = (id, caratWeight, params = {}) => 
   apiGet(`/api/products/${id}/price/${caratWeight}`, { params });
 export const getProductCarats = (id) => apiGet(`/api/products/${id}/carats`);
+export const getPriceMatrix = (productIds) => apiPost('/api/prices/matrix', { product_ids: productIds });
 export const getFeaturedProducts = (limit = 6) => apiGet(`/api/products/featured?limit=${limit}`);
 export const getDiscountedProducts = (limit = 8) => apiGet(`/api/products/discounted?limit=${limit}`);
 
@@ -36,6 +36,23 @@ export const getOptimizedImageUrl = (imageUrl, size = 'medium') => {
   return fullUrl;
 };
 
+/**
+ * Prefix every URL of a backend srcset (e.g. "/uploads/derived/a-320.webp 320w, ...")
+ * @param {string} srcset - srcset returned by the API, may be null while renditions are pending
+ * @returns {string|undefined} srcset with full URLs, or undefined when there is none
+ */
+export const getFullSrcSet = (srcset) => {
+  if (!srcset) return undefined;
+
+  return srcset
+    .split(',')
+    .map((candidate) => {
+      const [url, descriptor] = candidate.trim().split(/\s+/);
+      return `${getFullImageUrl(url)} ${descriptor}`;
+    })
+    .join(', ');
+};
+
 /**
  * Handle multiple image sources (arrays, objects, strings)
  * @param {any} imageSource - Various image source formats
@@ -69,6 +86,7 @@ export const normalizeImageUrl = (imageSource) => {
 
 export default {
   getFullImageUrl,
+  getFullSrcSet,
   getOptimizedImageUrl,
   normalizeImageUrl
 }; 
\ No newline at end of file
@@ -361,6 +361,10 @@ npm install
 print_status "Building React application..."
 npm run build
 
+# Precompress the build (stdlib only; a failure leaves the build served uncompressed)
+print_status "Precompressing static assets..."
+python3 ../backend/precompress.py build || print_warning "Could not precompress the build; serving it uncompressed"
+
 # Go back to root directory
 cd ..
 
@@ -380,6 +384,7 @@ WorkingDirectory=$(pwd)/backend
 Environment=PATH=$(pwd)/backend/venv/bin
 Environment=LANG=en_US.UTF-8
 Environment=LC_ALL=en_US.UTF-8
+Environment=WEB_CONCURRENCY=4
 ExecStart=$(pwd)/backend/venv/bin/gunicorn main:app -w 4 -k uvicorn.workers.UvicornWorker -b 0.0.0.0:$APP_PORT
 Restart=always
 RestartSec=10
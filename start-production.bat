@@ -40,6 +40,8 @@ if not exist "frontend\build" (
         pause
         exit /b 1
     )
+    REM Precompressed .br/.gz siblings; a failure leaves the build uncompressed
+    python ..\backend\precompress.py build || echo WARNING: Could not precompress the frontend build
     cd ..
 )
 
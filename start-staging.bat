@@ -39,6 +39,8 @@ if %errorlevel% neq 0 (
     pause
     exit /b 1
 )
+REM Precompressed .br/.gz siblings; a failure leaves the build uncompressed
+python ..\backend\precompress.py build || echo WARNING: Could not precompress the frontend build
 cd ..
 
 REM Start backend with staging settings